@@ -22,16 +22,44 @@
 """
 
 from qgis.gui import QgsMessageBar, QgsMessageBarItem
-from PyQt4.QtCore import Qt
-from PyQt4.QtGui import QProgressBar, QSizePolicy
+from PyQt4.QtCore import Qt, QThread
+from PyQt4.QtGui import QProgressBar, QSizePolicy, QApplication
 import time
 
-class ProgressWidget(QgsMessageBar):
+def ProgressWidget(min, max, message, parent=None, timeout = 1.5):
+    """
+    Constructs a progress widget. Without a GUI (e.g. the headless validation runner), or out of
+    the GUI thread, a NullProgressWidget is returned, so callers do not need to check for one.
+    """
+    if QApplication.type() == QApplication.Tty or QThread.currentThread() != QApplication.instance().thread():
+        return NullProgressWidget(min, max, message)
+    return MessageBarProgressWidget(min, max, message, parent=parent, timeout=timeout)
+
+class NullProgressWidget(object):
+    def __init__(self, min, max, message):
+        """
+        Progress widget that only counts the steps
+        """
+        self.min = min
+        self.max = max
+        self.message = message
+        self.value = 0
+
+    def initBar(self):
+        self.value = 0
+
+    def step(self):
+        self.value += 1
+
+    def close(self):
+        pass
+
+class MessageBarProgressWidget(QgsMessageBar):
     def __init__(self, min, max, message, parent=None, timeout = 1.5):
         """
         Constructs a progress widget
         """
-        super(self.__class__, self).__init__(parent)
+        super(MessageBarProgressWidget, self).__init__(parent)
         self.min = min
         self.max = max
         sizePolicy = QSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.Fixed)
@@ -38,15 +38,16 @@ class DsgGeometrySnapper(QObject):
 
     featureSnapped = pyqtSignal()
 
-    def __init__(self, referenceLayer):
+    def __init__(self, referenceLayer, request = None):
         """
         Constructor
         :param referenceLayer: QgsVectorLayer
+        :param request: QgsFeatureRequest that restricts the indexed reference features (e.g. to a tile)
         """
         super(self.__class__,self).__init__()
         self.referenceLayer = referenceLayer
         # Build spatial index
-        self.index = QgsSpatialIndex(self.referenceLayer.getFeatures())
+        self.index = QgsSpatialIndex(self.referenceLayer.getFeatures(request if request else QgsFeatureRequest()))
         
     def polyLineSize(self, geom, iPart, iRing):
         """
@@ -20,7 +20,7 @@
  *                                                                         *
  ***************************************************************************/
 """
-import os, binascii
+import os, binascii, time
 from uuid import uuid4, UUID
 
 from osgeo import ogr, osr
@@ -29,10 +29,13 @@ from osgeo import ogr, osr
 from DsgTools.Factories.SqlFactory.sqlGeneratorFactory import SqlGeneratorFactory
 from DsgTools.Utils.utils import Utils
 from DsgTools.LayerTools.CreateFrameTool.map_index import UtmGrid
+from DsgTools.Factories.DbFactory.queryLogger import QueryLogger, InstrumentedQuery as QSqlQuery
+from DsgTools.Factories.DbFactory.connectionPool import ConnectionPool
+from DsgTools.Factories.ThreadFactory.asyncQueryThread import AsyncQueryThread
 
 #PyQt imports
-from PyQt4.QtSql import QSqlQuery, QSqlDatabase
-from PyQt4.QtCore import QSettings, SIGNAL, pyqtSignal, QObject
+from PyQt4.QtSql import QSqlDatabase
+from PyQt4.QtCore import QSettings, SIGNAL, pyqtSignal, QObject, QCoreApplication, QThread, QEventLoop
 
 #Qgis imports
 import qgis.core 
@@ -43,6 +46,13 @@ class DbSignals(QObject):
         clearLog = pyqtSignal()
 
 class AbstractDb(QObject):
+    # catalog metadata (srids, geometry types and columns) shared by every instance
+    # connected to the same database. It is kept until invalidateMetadataCache is called.
+    metadataCache = dict()
+    # seconds a "layer has elements" answer is kept. Edits of layers loaded by DsgTools invalidate it at once
+    # (see EDGVLayerLoader.trackLayerEdits), the TTL bounds staleness for edits made by other clients.
+    layersWithElementsTtl = 30
+
     def __init__(self):
         '''
         Constructor
@@ -54,12 +64,14 @@ class AbstractDb(QObject):
         self.slotConnected = False
         self.versionFolderDict = dict({'2.1.3':'edgv_213','FTer_2a_Ed':'edgv_FTer_2a_Ed','3.0':'3'})
         self.utmGrid = UtmGrid()
+        self.asyncQueryDict = dict()
 
     def __del__(self):
         '''
         Destructor
         '''
         if self.db.isOpen():
+            ConnectionPool.closeConnections(self.db)
             self.db.close()
             self.db = None
             
@@ -115,8 +127,14 @@ class AbstractDb(QObject):
         return lyrWithElemList
 
     def getLayersWithElementsV2(self, layerList, useInheritance = False):
+        '''
+        Gets the names of the tables in layerList that have at least one element.
+        Tables not cached yet are checked together with EXISTS queries (see getLayersWithElementsQuery)
+        and the answers are cached for layersWithElementsTtl seconds, unless invalidated before (e.g. by edits or
+        temp table creation).
+        '''
         self.checkAndOpenDb()
-        lyrWithElemList = []
+        tableList = []
         for layer in layerList:
             if isinstance(layer, dict):
                 schema = layer['tableSchema']
@@ -127,18 +145,38 @@ class AbstractDb(QObject):
                 else:
                     lyr = layer
                     schema = self.getTableSchemaFromDb(lyr)
-            sql = self.gen.getElementCountFromLayerV2(schema, lyr, useInheritance)
-            query = QSqlQuery(sql,self.db)
-            query.next()
-            if query.value(0) > 0:
-                lyrWithElemList.append(lyr)
-        return lyrWithElemList
+            tableList.append((schema, lyr))
+        notCachedList = [i for i in tableList if self.getCachedHasElements(i[0], i[1], useInheritance) is None]
+        # chunks keep each query below SQLite's compound select limit
+        chunkSize = 400
+        for i in range(0, len(notCachedList), chunkSize):
+            sql = self.gen.getLayersWithElementsQuery(notCachedList[i:i+chunkSize], useInheritance)
+            query = QSqlQuery(sql, self.db)
+            if not query.isActive():
+                raise Exception(self.tr("Problem getting layers with elements: ")+query.lastError().text())
+            while query.next():
+                self.setCachedMetadata('layersWithElements', (query.value(0), query.value(1), useInheritance), (bool(query.value(2)), time.time()))
+        return [lyr for schema, lyr in tableList if self.getCachedHasElements(schema, lyr, useInheritance)]
+
+    def getCachedHasElements(self, schema, table, useInheritance):
+        '''
+        Gets the cached "table has elements" answer. Returns None if it is not cached or older than layersWithElementsTtl.
+        '''
+        value = self.getCachedMetadata('layersWithElements', (schema, table, useInheritance))
+        if value is None or time.time() - value[1] > self.layersWithElementsTtl:
+            return None
+        return value[0]
     
     def findEPSG(self, parameters=dict()):
         '''
         Finds the database EPSG
+        Found srids are cached per connection, see getCachedMetadata
         '''
         self.checkAndOpenDb()
+        cacheKey = tuple(sorted(parameters.items()))
+        srid = self.getCachedMetadata('srid', cacheKey)
+        if srid is not None:
+            return srid
         sql = self.gen.getSrid(parameters=parameters)
         query = QSqlQuery(sql, self.db)
         if not query.isActive():
@@ -146,8 +184,120 @@ class AbstractDb(QObject):
         srid = -1
         while query.next():
             srid = query.value(0)
+        if srid != -1:
+            self.setCachedMetadata('srid', cacheKey, srid)
         return srid
 
+    def getMetadataCacheKey(self):
+        '''
+        Gets the key that identifies this connection in the metadata cache
+        '''
+        return (self.db.driverName(), self.db.hostName(), self.db.port(), self.db.databaseName())
+
+    def getCachedMetadata(self, category, key):
+        '''
+        Gets a cached metadata value. Returns None if it is not cached.
+        category: metadata category (e.g. 'srid', 'geomTypeDict')
+        key: hashable key inside the category
+        '''
+        return self.metadataCache.get(self.getMetadataCacheKey(), dict()).get(category, dict()).get(key)
+
+    def setCachedMetadata(self, category, key, value):
+        '''
+        Stores a metadata value in the cache of this connection
+        '''
+        connectionCache = self.metadataCache.setdefault(self.getMetadataCacheKey(), dict())
+        connectionCache.setdefault(category, dict())[key] = value
+
+    def invalidateMetadataCache(self, categoryList = None):
+        '''
+        Invalidates the metadata cache of this connection.
+        Must be called whenever the database structure changes (srid update, customizations, etc).
+        categoryList: if provided, only these categories are invalidated
+        '''
+        cacheKey = self.getMetadataCacheKey()
+        if cacheKey not in self.metadataCache:
+            return
+        if categoryList is None:
+            self.metadataCache.pop(cacheKey)
+        else:
+            for category in categoryList:
+                self.metadataCache[cacheKey].pop(category, None)
+
+    def getQueryLogger(self):
+        '''
+        Gets the query logger of this connection. Every QSqlQuery run by database classes is recorded
+        in it when the query log is enabled in DsgTools options.
+        '''
+        return QueryLogger.getLogger(self.db)
+
+    def getQueryLog(self):
+        '''
+        Gets the last executed queries as a list of dicts (timestamp, sql, elapsed, rows, caller, error)
+        '''
+        return self.getQueryLogger().getQueryLog()
+
+    def getSlowQueryLog(self):
+        '''
+        Gets the queries slower than the threshold set in DsgTools options (with their plans, if captured)
+        '''
+        return self.getQueryLogger().getSlowQueryLog()
+
+    def exportQueryLog(self, path):
+        '''
+        Exports the query log of this connection to a JSON file
+        '''
+        QueryLogger.exportToJson(path, loggerList = [self.getQueryLogger()])
+
+    def executeQueryAsync(self, sql, useTransaction = True):
+        '''
+        Runs sql in the queries thread pool, on a pooled connection of the worker thread (see ConnectionPool).
+        Independent queries run concurrently and do not freeze the interface.
+        sql: statements separated by #. The rows of the last one are returned.
+        useTransaction: when False, the caller owns the transaction of self.db, so sql runs synchronously on self.db
+        and the returned future is already done.
+        Returns a QueryFuture: connect to its queryFinished/queryFailed signals or call result().
+        '''
+        self.checkAndOpenDb()
+        process = AsyncQueryThread(self.db, sql, useTransaction = useTransaction)
+        if not useTransaction:
+            process.runOn(self.db)
+            return process.future
+        # keeps the runnable alive until the query ends
+        self.asyncQueryDict[process.getId()] = process
+        process.future.queryFinished.connect(self.releaseAsyncQuery)
+        process.future.queryFailed.connect(self.releaseAsyncQuery)
+        # processes and tiles wait for their queries, so queries have a pool of their own
+        ConnectionPool.getThreadPool('queries').start(process)
+        return process.future
+
+    def releaseAsyncQuery(self, id, result = None):
+        '''
+        Releases a finished asynchronous query
+        '''
+        self.asyncQueryDict.pop(id, None)
+
+    def waitForQuery(self, future):
+        '''
+        Waits for an asynchronous query (see executeQueryAsync). The GUI thread keeps repainting the interface,
+        but user input is not processed, so the user cannot start other actions in the middle of the caller.
+        Worker threads just block. Returns its rows or raises an Exception if it failed.
+        '''
+        if QThread.currentThread() == QCoreApplication.instance().thread():
+            while not future.wait(0.05):
+                QCoreApplication.processEvents(QEventLoop.ExcludeUserInputEvents)
+        else:
+            future.wait()
+        # signals are not delivered to threads without an event loop
+        self.releaseAsyncQuery(future.id)
+        return future.result()
+
+    def getAsyncQueryResult(self, sql, useTransaction = True):
+        '''
+        Runs sql on a pooled connection (see executeQueryAsync) and waits for its rows (see waitForQuery)
+        '''
+        return self.waitForQuery(self.executeQueryAsync(sql, useTransaction = useTransaction))
+
     def listWithElementsFromDatabase(self, classList):
         '''
         List classes with elements
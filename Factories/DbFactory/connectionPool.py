@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ DsgTools
+                                 A QGIS plugin
+ Brazilian Army Cartographic Production Tools
+                              -------------------
+        begin                : 2018-03-14
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Philipe Borba - Cartographic Engineer @ Brazilian Army
+        email                : borba@dsg.eb.mil.br
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import threading, itertools
+
+#PyQt imports
+from PyQt4.QtCore import QThreadPool
+from PyQt4.QtSql import QSqlDatabase
+
+class ConnectionPool(object):
+    """
+    Pool of named QSqlDatabase connections, one per (connection parameters, thread).
+    QSqlDatabase objects can only be used by the thread that created them, so worker threads
+    must get their connections from here instead of using AbstractDb.db. Connections are created
+    in the thread that uses them, from the parameters captured by the thread that owns the original
+    connection (see getConnectionParameters), and kept open for the next runnables of that thread.
+    Workers must run in the thread pools of getThreadPool, whose threads never expire.
+    """
+    # connections of the current thread: {connection key: (connection name, generation)}
+    threadLocal = threading.local()
+    # closeConnections increments the generation of a key, connections of older generations are stale
+    generationDict = dict()
+    threadPoolDict = dict()
+    lock = threading.Lock()
+    # connection names must never be reused while a connection with that name exists
+    nameCounter = itertools.count()
+
+    @classmethod
+    def getConnectionParameters(cls, db):
+        """
+        Gets the parameters needed to open connections like db. Must be called by the thread that owns db.
+        """
+        return {'driver' : db.driverName(), 'host' : db.hostName(), 'port' : db.port(), 'database' : db.databaseName(),
+                'user' : db.userName(), 'password' : db.password(), 'options' : db.connectOptions()}
+
+    @classmethod
+    def getConnectionKey(cls, parameters):
+        """
+        Gets the key of connection parameters (same key used by AbstractDb metadata cache)
+        """
+        return (parameters['driver'], parameters['host'], parameters['port'], parameters['database'])
+
+    @classmethod
+    def getThreadPool(cls, name):
+        """
+        Gets the thread pool name, created on the first call. Its threads never expire, so that their connections are reused.
+        Runnables that wait for other runnables (e.g. processes waiting for their queries) must not share a pool with them,
+        otherwise a full pool deadlocks.
+        """
+        with cls.lock:
+            if name not in cls.threadPoolDict:
+                threadPool = QThreadPool()
+                threadPool.setExpiryTimeout(-1)
+                cls.threadPoolDict[name] = threadPool
+            return cls.threadPoolDict[name]
+
+    @classmethod
+    def getConnection(cls, parameters):
+        """
+        Gets an open connection for the current thread with parameters (see getConnectionParameters).
+        The connection is created by the first call of each thread and reused until closeConnections is called.
+        Stale connections of the current thread are closed here, by the thread that created them.
+        """
+        connectionKey = cls.getConnectionKey(parameters)
+        connectionDict = cls.threadLocal.__dict__.setdefault('connectionDict', dict())
+        with cls.lock:
+            generationDict = dict(cls.generationDict)
+        for key, (connectionName, generation) in connectionDict.items():
+            if generation != generationDict.get(key, 0):
+                connectionDict.pop(key)
+                QSqlDatabase.database(connectionName, False).close()
+                QSqlDatabase.removeDatabase(connectionName)
+        if connectionKey not in connectionDict:
+            with cls.lock:
+                connectionName = 'dsgtools_pool_{0}'.format(next(cls.nameCounter))
+            connection = QSqlDatabase.addDatabase(parameters['driver'], connectionName)
+            connection.setHostName(parameters['host'])
+            connection.setPort(parameters['port'])
+            connection.setDatabaseName(parameters['database'])
+            connection.setUserName(parameters['user'])
+            connection.setPassword(parameters['password'])
+            connection.setConnectOptions(parameters['options'])
+            connectionDict[connectionKey] = (connectionName, generationDict.get(connectionKey, 0))
+        connection = QSqlDatabase.database(connectionDict[connectionKey][0], False)
+        if not connection.isOpen() and not connection.open():
+            raise Exception(connection.lastError().text())
+        return connection
+
+    @classmethod
+    def closeConnections(cls, db):
+        """
+        Marks every pooled connection with the parameters of db as stale. Must be called by the thread that owns db.
+        Each pool thread closes its stale connections on its next getConnection.
+        """
+        connectionKey = cls.getConnectionKey(cls.getConnectionParameters(db))
+        with cls.lock:
+            cls.generationDict[connectionKey] = cls.generationDict.get(connectionKey, 0) + 1
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ DsgTools
+                                 A QGIS plugin
+ Brazilian Army Cartographic Production Tools
+                              -------------------
+        begin                : 2018-03-05
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Philipe Borba - Cartographic Engineer @ Brazilian Army
+        email                : borba@dsg.eb.mil.br
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+#PyQt imports
+from PyQt4.QtCore import QPyNullVariant, QDate, QDateTime, QTime, Qt
+
+class CopyStream(object):
+    """
+    File-like object that feeds a COPY ... FROM STDIN command (text format) from an iterable of rows.
+    Rows are only formatted when psycopg2 asks for more data, so the load is streamed.
+    """
+    def __init__(self, rowIterable, encoding = 'utf-8'):
+        """
+        Constructor
+        rowIterable: iterable of value lists, one per row
+        encoding: encoding of the client connection
+        """
+        self.rowIterator = iter(rowIterable)
+        self.encoding = encoding
+        self.buffer = ''
+        self.rowCount = 0
+
+    def escapeValue(self, value):
+        """
+        Escapes a value according to COPY text format
+        """
+        if value is None or isinstance(value, QPyNullVariant):
+            return u'\\N'
+        if isinstance(value, (QDate, QDateTime, QTime)):
+            value = value.toString(Qt.ISODate)
+        elif isinstance(value, float):
+            # unicode(float) keeps only 12 significant digits, repr keeps the exact value
+            value = unicode(repr(value))
+        elif isinstance(value, (list, tuple)):
+            value = u'{' + u','.join([u'"{0}"'.format((unicode(repr(i)) if isinstance(i, float) else unicode(i)).replace(u'\\', u'\\\\').replace(u'"', u'\\"')) for i in value]) + u'}'
+        elif isinstance(value, str):
+            value = value.decode(self.encoding)
+        elif not isinstance(value, unicode):
+            value = unicode(value)
+        return value.replace(u'\\', u'\\\\').replace(u'\t', u'\\t').replace(u'\n', u'\\n').replace(u'\r', u'\\r')
+
+    def formatRow(self, row):
+        """
+        Formats a row as a COPY text line
+        """
+        return (u'\t'.join([self.escapeValue(value) for value in row]) + u'\n').encode(self.encoding)
+
+    def read(self, size = -1):
+        """
+        Reads at most size bytes (everything if size < 0)
+        """
+        chunkList = [self.buffer]
+        bufferSize = len(self.buffer)
+        while size < 0 or bufferSize < size:
+            try:
+                line = self.formatRow(next(self.rowIterator))
+            except StopIteration:
+                break
+            self.rowCount += 1
+            chunkList.append(line)
+            bufferSize += len(line)
+        data = ''.join(chunkList)
+        if size < 0:
+            self.buffer = ''
+            return data
+        self.buffer = data[size:]
+        return data[:size]
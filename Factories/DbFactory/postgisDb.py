@@ -21,15 +21,20 @@
  ***************************************************************************/
 """
 from DsgTools.Factories.DbFactory.abstractDb import AbstractDb
-from PyQt4.QtSql import QSqlQuery, QSqlDatabase
+from PyQt4.QtSql import QSqlDatabase
+from DsgTools.Factories.DbFactory.queryLogger import InstrumentedQuery as QSqlQuery
 from PyQt4.QtCore import QSettings
 from DsgTools.Factories.SqlFactory.sqlGeneratorFactory import SqlGeneratorFactory
-from qgis.core import QgsCredentials, QgsMessageLog, QgsDataSourceURI, QgsFeature, QgsVectorLayer, QgsField, QgsGeometry
+from qgis.core import QgsCredentials, QgsMessageLog, QgsDataSourceURI, QgsFeature, QgsVectorLayer, QgsField, QgsGeometry, QgsApplication
 from osgeo import ogr
 from uuid import uuid4
-import codecs, os, json, binascii, re
+from copy import deepcopy
+import codecs, os, json, binascii, re, cPickle
 import psycopg2
+from datetime import datetime
+from itertools import islice
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
+from DsgTools.Factories.DbFactory.copyStream import CopyStream
 
 class PostgisDb(AbstractDb):
     def __init__(self):
@@ -45,6 +50,15 @@ class PostgisDb(AbstractDb):
         # dict to text showing for no process or class selected
         self.dictNoClassNoProcess = { 'No Process' : self.tr("Select a process..."),
                                         'No Layer' : self.tr("Select a layer...") }
+        # psycopg2 connection used by the COPY loaders, see getPsycopg2Connection
+        self.psycopg2Conn = None
+
+    def __del__(self):
+        """
+        Destructor
+        """
+        self.closePsycopg2Connection()
+        super(PostgisDb, self).__del__()
 
     def getDatabaseParameters(self):
         """
@@ -763,6 +777,36 @@ class PostgisDb(AbstractDb):
         """
         return 'public.aux_moldura_a'
     
+    def getFrameGeometryList(self):
+        """
+        Gets the geometries (hex WKB) of the frame layer
+        """
+        self.checkAndOpenDb()
+        query = QSqlQuery(self.gen.getFrameGeometries(self.getFrameLayerName()), self.db)
+        if not query.isActive():
+            raise Exception(self.tr("Problem getting frames: ")+query.lastError().text())
+        wkbList = []
+        while query.next():
+            wkbList.append(query.value(0))
+        return wkbList
+
+    def getMultiTableExtent(self, tableList):
+        """
+        Gets the extent (xmin, ymin, xmax, ymax) of the tables of tableList (schema.table). Returns None if they are empty.
+        """
+        self.checkAndOpenDb()
+        tableTupleList = [(i[0], i[1], i[2]) for i in self.getGeomColumnTupleList() if '.'.join([i[0], i[1]]) in tableList]
+        if len(tableTupleList) == 0:
+            return None
+        query = QSqlQuery(self.gen.getMultiTableExtent(tableTupleList), self.db)
+        if not query.isActive():
+            raise Exception(self.tr("Problem getting table extent: ")+query.lastError().text())
+        while query.next():
+            if query.isNull(0):
+                return None
+            return (query.value(0), query.value(1), query.value(2), query.value(3))
+        return None
+
     def getEDGVDbsFromServer(self, parentWidget = None):
         """
         Gets edgv databases from 'this' server
@@ -949,36 +993,144 @@ class PostgisDb(AbstractDb):
         Inserts flags into database
         flagTupleList: flag tuple list
         processName: process name
+        useTransaction: when False, flags are written through self.db so that they take part in the caller's transaction
+        Flags are staged in memory and written with a single COPY stream. The srid is resolved
+        once per table and the geometry dimension is computed server side. Raises, writing no flag, when
+        a geometry has no flag table for its dimension.
         """
         self.checkAndOpenDb()
-        if len(flagTupleList) > 0:
-            if useTransaction:
-                self.db.transaction()
-            query = QSqlQuery(self.db)
-            for record in flagTupleList:
-                try:
-                    dimension = self.getDimension(record[3]) # getting geometry dimension
-                except Exception as e:
-                    raise e
-                # specific EPSG search
-                flagSRID = self.findEPSG(parameters={'tableSchema':'validation', 'tableName':'aux_flags_validacao_p', 'geometryColumn':'geom'})
+        if len(flagTupleList) == 0:
+            return 0
+        # specific EPSG search
+        flagSRID = self.findEPSG(parameters={'tableSchema':'validation', 'tableName':'aux_flags_validacao_p', 'geometryColumn':'geom'})
+        flagRowList = self.buildFlagRowList(flagTupleList, flagSRID)
+        self.invalidateMetadataCache(categoryList = ['layersWithElements'])
+        if useTransaction:
+            try:
+                self.copyFlags(flagRowList, processName, flagSRID)
+                return len(flagTupleList)
+            except psycopg2.Error as e:
+                QgsMessageLog.logMessage(self.tr('COPY unavailable, inserting flags in batches: ') + str(e), "DSG Tools Plugin", QgsMessageLog.WARNING)
+        self.insertFlagsInBatches(flagRowList, processName, flagSRID, useTransaction = useTransaction)
+        return len(flagTupleList)
+
+    def buildFlagRowList(self, flagTupleList, flagSRID):
+        """
+        Builds the flag rows that are going to be written, resolving the srid once per table
+        flagTupleList: flag tuple list (layer, feat_id, reason, geom, geometryColumn)
+        flagSRID: srid of the flag tables
+        """
+        sridDict = dict()
+        flagRowList = []
+        for record in flagTupleList:
+            layer, featId, reason, geom, geometryColumn = record[0:5]
+            if (layer, geometryColumn) not in sridDict:
                 try:
-                    tableSchema, tableName = record[0].split('.')
-                    parameters = {'tableSchema':tableSchema, 'tableName':tableName, 'geometryColumn':record[4]}
-                    srid = self.findEPSG(parameters=parameters)
+                    tableSchema, tableName = layer.split('.')
+                    parameters = {'tableSchema':tableSchema, 'tableName':tableName, 'geometryColumn':geometryColumn}
+                    sridDict[(layer, geometryColumn)] = self.findEPSG(parameters=parameters)
                 except:
-                    srid = flagSRID
-                #actual flag insertion
-                sql = self.gen.insertFlagIntoDb(record[0], record[1], record[2], record[3], srid, processName, dimension, record[4], flagSRID)
-                if not query.exec_(sql):
-                    if useTransaction:
-                        self.db.rollback()
-                    raise Exception(self.tr('Problem inserting flags: ') + query.lastError().text())
-            if useTransaction:
-                self.db.commit()
-            return len(flagTupleList)
-        else:
-            return 0
+                    sridDict[(layer, geometryColumn)] = flagSRID
+            flagRowList.append((layer, featId, reason, geom, sridDict[(layer, geometryColumn)], geometryColumn))
+        return flagRowList
+
+    def makePsycopg2Connection(self):
+        """
+        Opens a psycopg2 connection using the same parameters of self.db.
+        QSqlDatabase does not expose COPY, so bulk loaders use this connection.
+        """
+        (host, port, user, password) = self.getDatabaseParameters()
+        conn = psycopg2.connect(host=host, port=port, dbname=self.getDatabaseName(), user=user, password=password)
+        conn.set_client_encoding('UTF8')
+        return conn
+
+    def getPsycopg2Connection(self):
+        """
+        Gets the psycopg2 connection of this object, opening it on the first use. It is kept open and reused
+        by every COPY loader, each one commits or rolls back its own transaction.
+        """
+        if self.psycopg2Conn is None or self.psycopg2Conn.closed:
+            self.psycopg2Conn = self.makePsycopg2Connection()
+        return self.psycopg2Conn
+
+    def closePsycopg2Connection(self):
+        """
+        Closes the psycopg2 connection, if open. It is reopened by the next getPsycopg2Connection.
+        """
+        conn = getattr(self, 'psycopg2Conn', None)
+        self.psycopg2Conn = None
+        if conn is not None and not conn.closed:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    def rollbackPsycopg2Connection(self):
+        """
+        Rolls back the current transaction of the psycopg2 connection. Broken connections are closed instead.
+        """
+        try:
+            self.psycopg2Conn.rollback()
+        except psycopg2.Error:
+            self.closePsycopg2Connection()
+
+    def copyFlags(self, flagRowList, processName, flagSRID):
+        """
+        Writes flags with a COPY stream into a staging table and distributes them
+        into the flag tables by dimension. Raises if any flag has no flag table for its dimension.
+        """
+        conn = self.getPsycopg2Connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.gen.createFlagStagingTable())
+            cursor.copy_expert(self.gen.copyFlagsIntoStagingTable(), CopyStream(flagRowList))
+            insertedCount = 0
+            for sql in self.gen.insertFlagsFromStagingTable(processName, flagSRID).split('#'):
+                cursor.execute(sql)
+                insertedCount += cursor.rowcount
+            if insertedCount != len(flagRowList):
+                cursor.execute(self.gen.getFlagsWithoutDimension('flag_staging'))
+                rejectedList = cursor.fetchall()
+                conn.rollback()
+                self.raiseFlagsWithoutDimension(rejectedList)
+            conn.commit()
+        except psycopg2.Error:
+            self.rollbackPsycopg2Connection()
+            raise
+
+    def raiseFlagsWithoutDimension(self, rejectedList):
+        """
+        Raises the error of flags whose geometry dimension is not 0, 1 or 2 (e.g. null geometries)
+        rejectedList: list of (layer, feat_id)
+        """
+        flagList = ['{0} ({1})'.format(layer, featId) for layer, featId in rejectedList]
+        raise Exception(self.tr('Problem inserting flags: geometries without dimension 0, 1 or 2: ') + ', '.join(flagList))
+
+    def insertFlagsInBatches(self, flagRowList, processName, flagSRID, batchSize = 1000, useTransaction = True):
+        """
+        Writes flags with multi-row inserts through self.db
+        """
+        if useTransaction:
+            self.db.transaction()
+        query = QSqlQuery(self.db)
+        for i in range(0, len(flagRowList), batchSize):
+            batch = flagRowList[i:i+batchSize]
+            sql = self.gen.insertFlagBatchIntoDb(batch, processName, flagSRID)
+            if not query.exec_(sql):
+                if useTransaction:
+                    self.db.rollback()
+                raise Exception(self.tr('Problem inserting flags: ') + query.lastError().text())
+            query.next()
+            if query.value(0) != len(batch):
+                rejectedQuery = QSqlQuery(self.gen.getFlagBatchWithoutDimension(batch), self.db)
+                rejectedList = []
+                while rejectedQuery.next():
+                    rejectedList.append((rejectedQuery.value(0), rejectedQuery.value(1)))
+                if useTransaction:
+                    self.db.rollback()
+                self.raiseFlagsWithoutDimension(rejectedList)
+        if useTransaction:
+            self.db.commit()
     
     def deleteProcessFlags(self, processName=None, className=None, flagId=None):
         """
@@ -1000,7 +1152,156 @@ class PostgisDb(AbstractDb):
                 self.db.rollback()
                 raise Exception(self.tr('Problem deleting flags: ') + query.lastError().text())
         self.db.commit()
+        self.invalidateMetadataCache(categoryList = ['layersWithElements'])
             
+    def deleteFeatureFlags(self, processName, className, idList, useTransaction = True):
+        """
+        Deletes the flags raised by processName for the features of idList
+        className: schema.table of the features
+        """
+        if len(idList) == 0:
+            return
+        self.checkAndOpenDb()
+        sql = self.gen.deleteFeatureFlags(processName, className, idList)
+        query = QSqlQuery(self.db)
+        if useTransaction:
+            self.db.transaction()
+        if not query.exec_(sql):
+            if useTransaction:
+                self.db.rollback()
+            raise Exception(self.tr('Problem deleting flags: ') + query.lastError().text())
+        if useTransaction:
+            self.db.commit()
+        self.invalidateMetadataCache(categoryList = ['layersWithElements'])
+
+    def enableDirtyFeatureTracking(self, tableSchema, tableName, keyColumn, geometryColumn, useTransaction = True):
+        """
+        Installs the trigger that records changed features of tableSchema.tableName into validation.dirty_feature
+        """
+        self.checkAndOpenDb()
+        sqlList = self.gen.createDirtyFeatureStructure().split('#') + self.gen.createDirtyFeatureTrigger(tableSchema, tableName, keyColumn, geometryColumn).split('#')
+        query = QSqlQuery(self.db)
+        if useTransaction:
+            self.db.transaction()
+        for inner in sqlList:
+            if not query.exec_(inner):
+                if useTransaction:
+                    self.db.rollback()
+                raise Exception(self.tr('Problem enabling changed feature tracking: ') + query.lastError().text())
+        if useTransaction:
+            self.db.commit()
+
+    def isDirtyFeatureTrackingEnabled(self, tableSchema, tableName):
+        self.checkAndOpenDb()
+        query = QSqlQuery(self.gen.hasDirtyFeatureTrigger(tableSchema, tableName), self.db)
+        if not query.isActive():
+            raise Exception(self.tr('Problem checking changed feature tracking: ') + query.lastError().text())
+        while query.next():
+            return query.value(0)
+        return False
+
+    def getDirtyFeatureLastChangeId(self, tableSchema, tableName):
+        """
+        Gets the id of the last recorded change of tableSchema.tableName
+        """
+        self.checkAndOpenDb()
+        query = QSqlQuery(self.gen.getDirtyFeatureLastChangeId(tableSchema, tableName), self.db)
+        if not query.isActive():
+            raise Exception(self.tr('Problem getting changed features: ') + query.lastError().text())
+        while query.next():
+            return query.value(0)
+        return 0
+
+    def getDirtyFeatureIds(self, tableSchema, tableName, keyColumn, geometryColumn, processName, lastChangeId, radius, srid, wkbList = []):
+        """
+        Gets the ids of features that must be validated again by processName.
+        Returns (replacedIdSet, contextIdSet): features changed since its last checkpoint (up to lastChangeId)
+        plus their neighbours within radius, and the neighbours of those (only used as context).
+        wkbList: hex WKB geometries of uncommitted changes
+        """
+        self.checkAndOpenDb()
+        sql = self.gen.getDirtyFeatureIds(tableSchema, tableName, keyColumn, geometryColumn, processName, lastChangeId, radius, srid, wkbList)
+        query = QSqlQuery(sql, self.db)
+        if not query.isActive():
+            raise Exception(self.tr('Problem getting changed features: ') + query.lastError().text())
+        replacedIdSet, contextIdSet = set(), set()
+        while query.next():
+            if query.value(1):
+                replacedIdSet.add(query.value(0))
+            else:
+                contextIdSet.add(query.value(0))
+        return replacedIdSet, contextIdSet
+
+    def getDirtyFeatureCheckpoint(self, processName, tableSchema, tableName):
+        """
+        Gets the last change of tableSchema.tableName validated by processName (None if the process has no checkpoint)
+        """
+        self.checkAndOpenDb()
+        query = QSqlQuery(self.gen.getDirtyFeatureCheckpoint(processName, tableSchema, tableName), self.db)
+        if not query.isActive():
+            raise Exception(self.tr('Problem getting validation checkpoint: ') + query.lastError().text())
+        while query.next():
+            return query.value(0)
+        return None
+
+    def setDirtyFeatureCheckpoint(self, processName, tableSchema, tableName, lastChangeId, useTransaction = True):
+        """
+        Marks the changes of tableSchema.tableName up to lastChangeId as validated by processName.
+        Changes validated by every process with a checkpoint on the table are deleted.
+        """
+        self.checkAndOpenDb()
+        sqlList = self.gen.setDirtyFeatureCheckpoint(processName, tableSchema, tableName, lastChangeId).split('#')
+        query = QSqlQuery(self.db)
+        if useTransaction:
+            self.db.transaction()
+        for inner in sqlList:
+            if not query.exec_(inner):
+                if useTransaction:
+                    self.db.rollback()
+                raise Exception(self.tr('Problem setting validation checkpoint: ') + query.lastError().text())
+        if useTransaction:
+            self.db.commit()
+
+    def getSyntheticDataTarget(self, table):
+        """
+        Gets (tableSchema, tableName, geometryColumn, keyColumn, srid) of table (schema.table)
+        """
+        tableSchema, tableName = table.split('.')
+        geometryColumnList = [i[2] for i in self.getGeomColumnTupleList() if i[0] == tableSchema and i[1] == tableName]
+        if len(geometryColumnList) == 0:
+            raise Exception(self.tr('Table {0} has no geometry column.').format(table))
+        keyColumn = self.getPrimaryKeyColumn('"{0}"."{1}"'.format(tableSchema, tableName))
+        return tableSchema, tableName, geometryColumnList[0], keyColumn, self.findEPSG()
+
+    def executeSyntheticDataSql(self, sql, useTransaction = True):
+        self.checkAndOpenDb()
+        query = QSqlQuery(self.db)
+        if useTransaction:
+            self.db.transaction()
+        for inner in sql.split('#'):
+            if not query.exec_(inner):
+                if useTransaction:
+                    self.db.rollback()
+                raise Exception(self.tr('Problem inserting synthetic data: ') + query.lastError().text())
+        if useTransaction:
+            self.db.commit()
+
+    def insertSyntheticCoverage(self, table, count, cellSize, xOrigin, yOrigin, seed, gapRate = 0.01, overlapRate = 0.01, invalidRate = 0.001, duplicateRate = 0.001, useTransaction = True):
+        """
+        Fills table (schema.table, polygons) with a reproducible grid coverage with planted gaps, overlaps, invalid geometries and duplicates
+        """
+        tableSchema, tableName, geometryColumn, keyColumn, srid = self.getSyntheticDataTarget(table)
+        sql = self.gen.insertSyntheticCoverage(tableSchema, tableName, geometryColumn, keyColumn, srid, count, cellSize, xOrigin, yOrigin, seed, gapRate, overlapRate, invalidRate, duplicateRate)
+        self.executeSyntheticDataSql(sql, useTransaction = useTransaction)
+
+    def insertSyntheticNetwork(self, table, count, cellSize, xOrigin, yOrigin, seed, dangleRate = 0.01, duplicateRate = 0.001, useTransaction = True):
+        """
+        Fills table (schema.table, lines) with a reproducible grid network with planted dangles and duplicates
+        """
+        tableSchema, tableName, geometryColumn, keyColumn, srid = self.getSyntheticDataTarget(table)
+        sql = self.gen.insertSyntheticNetwork(tableSchema, tableName, geometryColumn, keyColumn, srid, count, cellSize, xOrigin, yOrigin, seed, dangleRate, duplicateRate)
+        self.executeSyntheticDataSql(sql, useTransaction = useTransaction)
+
     def checkAndCreateValidationStructure(self, useTransaction = True):
         """
         Checks if the validation structure is already created, if not it should be created now
@@ -1027,7 +1328,46 @@ class PostgisDb(AbstractDb):
                     raise Exception(self.tr('Problem creating structure: ') + query.lastError().text())
             if useTransaction:
                 self.db.commit()
+            self.invalidateMetadataCache()
+        self.checkAndCreateValidationProfileColumn()
+        self.checkAndCreateValidationCacheColumns()
+
+    def checkAndCreateValidationProfileColumn(self):
+        """
+        Adds the profile column to validation.process_history of databases created before it existed
+        """
+        query = QSqlQuery(self.gen.checkValidationProfileColumn(), self.db)
+        if not query.isActive():
+            raise Exception(self.tr('Problem creating structure: ')+query.lastError().text())
+        while query.next():
+            if query.value(0) > 0:
+                return
+        query = QSqlQuery(self.db)
+        if not query.exec_(self.gen.createValidationProfileColumn()):
+            raise Exception(self.tr('Problem creating structure: ') + query.lastError().text())
                 
+    def checkAndCreateValidationCacheColumns(self, useTransaction = True):
+        """
+        Adds the fingerprint and flag_count columns (see setValidationProcessFingerprint) to validation.process_history
+        of databases created before they existed
+        """
+        query = QSqlQuery(self.gen.checkValidationCacheColumns(), self.db)
+        if not query.isActive():
+            raise Exception(self.tr('Problem creating structure: ')+query.lastError().text())
+        while query.next():
+            if query.value(0) > 0:
+                return
+        query = QSqlQuery(self.db)
+        if useTransaction:
+            self.db.transaction()
+        for sql in self.gen.createValidationCacheColumns().split('#'):
+            if not query.exec_(sql):
+                if useTransaction:
+                    self.db.rollback()
+                raise Exception(self.tr('Problem creating structure: ') + query.lastError().text())
+        if useTransaction:
+            self.db.commit()
+
     def getValidationStatus(self, processName):
         """
         Gets the validation status for a specific process
@@ -1069,6 +1409,78 @@ class PostgisDb(AbstractDb):
         if not query.exec_(sql):
             raise Exception(self.tr('Problem setting status: ') + query.lastError().text())
     
+    def setValidationProcessProfile(self, processName, profile):
+        """
+        Stores the profile (dict, see ValidationProcess.getProfile) of the last execution of a process
+        """
+        self.checkAndOpenDb()
+        sql = self.gen.setValidationProfileQuery(processName, json.dumps(profile))
+        query = QSqlQuery(self.db)
+        if not query.exec_(sql):
+            raise Exception(self.tr('Problem setting profile: ') + query.lastError().text())
+
+    def getValidationProcessProfile(self, processName, finished):
+        """
+        Gets the profile of the execution of processName started at finished (datetime). Returns None if there is no profile.
+        """
+        self.checkAndOpenDb()
+        query = QSqlQuery(self.gen.getValidationProfileQuery(processName, finished), self.db)
+        if not query.isActive():
+            raise Exception(self.tr('Problem getting profile: ') + query.lastError().text())
+        while query.next():
+            return json.loads(query.value(0))
+        return None
+
+    def setValidationProcessFingerprint(self, processName, fingerprint, flagCount):
+        """
+        Stores the fingerprint (see ValidationProcess.getDataFingerprint) and the number of flags of the last execution of a process
+        """
+        self.checkAndOpenDb()
+        query = QSqlQuery(self.db)
+        if not query.exec_(self.gen.setValidationFingerprintQuery(processName, fingerprint, flagCount)):
+            raise Exception(self.tr('Problem setting fingerprint: ') + query.lastError().text())
+
+    def getValidationProcessCache(self, processName):
+        """
+        Gets (status, fingerprint, number of flags) of the last execution of a process. Returns None if it never ran.
+        """
+        self.checkAndOpenDb()
+        query = QSqlQuery(self.gen.getValidationCacheQuery(processName), self.db)
+        if not query.isActive():
+            raise Exception(self.tr('Problem getting fingerprint: ') + query.lastError().text())
+        while query.next():
+            return query.value(0), query.value(1), query.value(2)
+        return None
+
+    def getTableFingerprint(self, tableSchema, tableName):
+        """
+        Gets a cheap fingerprint of a table, that changes when rows are inserted, updated or deleted.
+        Returns None for tables without primary key.
+        """
+        keyColumn = self.getPrimaryKeyColumn('.'.join([tableSchema, tableName]))
+        if not keyColumn:
+            return None
+        self.checkAndOpenDb()
+        query = QSqlQuery(self.gen.getTableFingerprint(tableSchema, tableName, keyColumn), self.db)
+        if not query.isActive():
+            raise Exception(self.tr('Problem getting table fingerprint: ') + query.lastError().text())
+        while query.next():
+            return [query.value(0), query.value(1), query.value(2)]
+        return None
+
+    def getValidationProfileList(self):
+        """
+        Gets a list of (id, process name, finished, profile) of every profiled execution
+        """
+        self.checkAndOpenDb()
+        query = QSqlQuery(self.gen.getValidationProfileListQuery(), self.db)
+        if not query.isActive():
+            raise Exception(self.tr('Problem getting profile: ') + query.lastError().text())
+        profileList = []
+        while query.next():
+            profileList.append((query.value(0), query.value(1), query.value(2).toPyDateTime(), json.loads(query.value(3))))
+        return profileList
+
     def getRunningProc(self):
         """
         Gets the active running process into database
@@ -1098,12 +1510,15 @@ class PostgisDb(AbstractDb):
         else:
             return False
         
-    def testSpatialRule(self, class_a, necessity, predicate_function, class_b, min_card, max_card, rule, aKeyColumn, bKeyColumn, aGeomColumn, bGeomColumn):
+    def testSpatialRule(self, class_a, necessity, predicate_function, class_b, min_card, max_card, rule, aKeyColumn, bKeyColumn, aGeomColumn, bGeomColumn, checkPlan = False):
         """
         Tests spatial predicates to check whether a rule is broken
+        checkPlan: checks the query plan before running the rule (see checkSpatialIndexUsage)
         """
         self.checkAndOpenDb()
         sql = self.gen.testSpatialRule(class_a, necessity, predicate_function, class_b, min_card, max_card, aKeyColumn, bKeyColumn, aGeomColumn, bGeomColumn)
+        if checkPlan:
+            self.checkSpatialIndexUsage(sql, [class_a, class_b])
         query = QSqlQuery(sql, self.db)
         if not query.isActive():
             raise Exception(self.tr('Problem testing spatial rule: ') + query.lastError().text()) 
@@ -1117,6 +1532,46 @@ class PostgisDb(AbstractDb):
             ret.append((flagClass, feat_id, reason, geom, aGeomColumn))
         return ret
 
+    def getQueryPlan(self, sql):
+        """
+        Gets the plan of a query as a dict (EXPLAIN in JSON format)
+        """
+        self.checkAndOpenDb()
+        query = QSqlQuery(self.gen.explainQuery(sql), self.db)
+        if not query.isActive():
+            raise Exception(self.tr('Problem explaining query: ') + query.lastError().text())
+        while query.next():
+            return json.loads(query.value(0))[0]['Plan']
+
+    def getPlanNodeList(self, plan):
+        """
+        Flattens a plan into the list of its nodes
+        """
+        nodeList = [plan]
+        for child in plan.get('Plans', []):
+            nodeList += self.getPlanNodeList(child)
+        return nodeList
+
+    def checkSpatialIndexUsage(self, sql, tableList):
+        """
+        Checks whether the plan of sql uses any index. If it does not, tables are analyzed (temp tables
+        have no statistics) and the plan is checked again. Plans that still ignore indexes are logged.
+        Returns True if the final plan uses an index.
+        """
+        usesIndex = lambda plan : any(['Index Name' in node for node in self.getPlanNodeList(plan)])
+        plan = self.getQueryPlan(sql)
+        if usesIndex(plan):
+            return True
+        query = QSqlQuery(self.db)
+        for inner in self.gen.analyzeTables(tableList).split('#'):
+            if not query.exec_(inner):
+                raise Exception(self.tr('Problem analyzing tables: ') + query.lastError().text())
+        plan = self.getQueryPlan(sql)
+        if usesIndex(plan):
+            return True
+        QgsMessageLog.logMessage(self.tr('Query on {0} does not use spatial indexes (estimated cost {1}).').format(', '.join(tableList), plan['Total Cost']), "DSG Tools Plugin", QgsMessageLog.WARNING)
+        return False
+
     def getDimension(self, geom):
         """
         Gets geometry's dimension
@@ -1239,33 +1694,17 @@ class PostgisDb(AbstractDb):
         keyColumn: pk column
         """
         self.checkAndOpenDb()
-        result = []
-        sql = self.gen.prepareVertexNearEdgesStruct(tableSchema, tableName, geometryColumn, keyColumn, geomType)
-        sqlList = sql.split('#')
-        if useTransaction:
-            self.db.transaction()
-        for sql2 in sqlList:
-            query = QSqlQuery(self.db)
-            if not query.exec_(sql2):
-                if useTransaction:
-                    self.db.rollback()
-                raise Exception(self.tr('Problem preparing auxiliary structure: ') + query.lastError().text())
         # specific EPSG search
         parameters = {'tableSchema': tableSchema, 'tableName': tableName, 'geometryColumn': geometryColumn}
         epsg = self.findEPSG(parameters=parameters)
-        sql = self.gen.getVertexNearEdgesStruct(epsg, tol, geometryColumn, keyColumn)
-        query = QSqlQuery(sql,self.db)
-        if not query.isActive():
-            if useTransaction:
-                self.db.rollback()
-            raise Exception(self.tr('Problem getting vertex near edges: ') + query.lastError().text())
-        while query.next():
-            id = query.value(0)
-            geom = query.value(1)
-            result.append((id,geom))
-        if useTransaction:
-            self.db.commit()
-        return result
+        # the auxiliary (temp) tables and the search run on the same pooled connection, without freezing the interface
+        # (on self.db when the caller owns the transaction)
+        sql = '#'.join([self.gen.prepareVertexNearEdgesStruct(tableSchema, tableName, geometryColumn, keyColumn, geomType), self.gen.getVertexNearEdgesStruct(epsg, tol, geometryColumn, keyColumn)])
+        try:
+            rowList = self.getAsyncQueryResult(sql, useTransaction = useTransaction)
+        except Exception as e:
+            raise Exception(self.tr('Problem getting vertex near edges: ') + ':'.join(e.args))
+        return [(row[0], row[1]) for row in rowList]
 
     def removeFeatures(self, cl, processList, keyColumn, useTransaction = True):
         """
@@ -1287,6 +1726,7 @@ class PostgisDb(AbstractDb):
             raise Exception(self.tr('Problem deleting features from ')+cl+': '+ query.lastError().text())
         if useTransaction:
             self.db.commit()
+        self.invalidateMetadataCache(categoryList = ['layersWithElements'])
         return len(idList)
 
     def getNotSimpleRecords(self, cl, geometryColumn, keyColumn):
@@ -1430,15 +1870,68 @@ class PostgisDb(AbstractDb):
                     result.append(query.value(0))
         return result
     
-    def updateGeometries(self, tableSchema, tableName, tuplas, epsg, useTransaction = True):
+    def updateGeometries(self, tableSchema, tableName, tuplas, epsg, useTransaction = True, setBased = True, batchSize = 5000):
         """
-        Updates geometries on database
+        Updates geometries on database. Features whose ids are not in tuplas are deleted.
         tableSchema: table schema
         tableName: table name
-        tuplas: tuples used during the update
+        tuplas: dict {feature id: list of hex wkb}, the geometries of each id are unioned
         epsg: geometry srid
+        setBased: stages the new geometries in a temp table and applies them with one UPDATE ... FROM
+        and one anti-join DELETE. Otherwise one UPDATE is run per feature.
+        batchSize: number of rows per staging insert
+        Everything runs through self.db, so with useTransaction=False the update takes part in the caller's transaction.
+        """
+        if len(tuplas) == 0:
+            # the anti-join would delete every feature of the table (the NOT IN delete failed on an empty list)
+            raise Exception(self.tr('Problem updating geometries: no geometries given for {0}.{1}.').format(tableSchema, tableName))
+        emptyIdList = [featId for featId, wkbList in tuplas.iteritems() if len(wkbList) == 0]
+        if emptyIdList:
+            # the anti-join would delete these features (the union of an empty array failed)
+            raise Exception(self.tr('Problem updating geometries: no geometries given for the features {0} of {1}.{2}.').format(', '.join(map(str, emptyIdList)), tableSchema, tableName))
+        self.checkAndOpenDb()
+        startTime = datetime.now()
+        if not setBased:
+            self.updateGeometriesByFeature(tableSchema, tableName, tuplas, epsg, useTransaction = useTransaction)
+        else:
+            self.updateGeometriesWithBatches(tableSchema, tableName, tuplas, epsg, batchSize, useTransaction = useTransaction)
+        self.invalidateMetadataCache(categoryList = ['layersWithElements'])
+        QgsMessageLog.logMessage(self.tr('Geometries of {0}.{1} updated in {2} ({3} features).').format(tableSchema, tableName, str(datetime.now() - startTime), len(tuplas)), "DSG Tools Plugin", QgsMessageLog.INFO)
+
+    def getGeometryStagingRows(self, tuplas, epsg):
+        """
+        Yields (id, SRID=epsg;hexwkb) for each geometry in tuplas
+        """
+        for featId, wkbList in tuplas.iteritems():
+            for wkb in wkbList:
+                yield (featId, 'SRID={0};{1}'.format(epsg, wkb))
+
+    def updateGeometriesWithBatches(self, tableSchema, tableName, tuplas, epsg, batchSize, useTransaction = True):
+        """
+        Stages the geometries through self.db with multi-row inserts of batchSize rows and applies them
+        """
+        query = QSqlQuery(self.db)
+        if useTransaction:
+            self.db.transaction()
+        sqlList = self.gen.createGeometryStagingTable().split('#')
+        rowGenerator = self.getGeometryStagingRows(tuplas, epsg)
+        batch = list(islice(rowGenerator, batchSize))
+        while batch:
+            sqlList.append(self.gen.insertIntoGeometryStagingTable(batch))
+            batch = list(islice(rowGenerator, batchSize))
+        sqlList += self.gen.updateOriginalTableFromStaging(tableSchema, tableName).split('#')
+        for sql in sqlList:
+            if not query.exec_(sql):
+                if useTransaction:
+                    self.db.rollback()
+                raise Exception(self.tr('Problem updating geometries: ') + query.lastError().text())
+        if useTransaction:
+            self.db.commit()
+
+    def updateGeometriesByFeature(self, tableSchema, tableName, tuplas, epsg, useTransaction = True):
+        """
+        Updates geometries running one UPDATE per feature and a NOT IN delete
         """
-        self.checkAndOpenDb()
         sqls = self.gen.updateOriginalTable(tableSchema, tableName, tuplas, epsg)
         query = QSqlQuery(self.db)
         if useTransaction:
@@ -1500,6 +1993,7 @@ class PostgisDb(AbstractDb):
                     raise Exception(self.tr('Problem creating centroid structure: ') + query.lastError().text())
         if useTransaction:
             self.db.commit()
+        self.invalidateMetadataCache()
             
     def checkAndCreateCentroidAuxStruct(self, earthCoverageClasses):
         """
@@ -1594,6 +2088,7 @@ class PostgisDb(AbstractDb):
                 raise Exception(self.tr('Problem dropping centroids: ') + query.lastError().text())
         if useTransaction:
             self.db.commit()
+        self.invalidateMetadataCache()
 
     def rollbackEarthCoverage(self, classList):
         """
@@ -1711,22 +2206,12 @@ class PostgisDb(AbstractDb):
         tol: tolerance
         """
         self.checkAndOpenDb()
-        if useTransaction:
-            self.db.transaction()
-        query = QSqlQuery(self.db)
-        sql = self.gen.makeRecursiveSnapFunction(geometryColumn, keyColumn)
-        if not query.exec_(sql):
-            if useTransaction:
-                self.db.rollback()
-            raise Exception(self.tr('Problem creating recursive snap function: ') + query.lastError().text())
-        for cl in classList:
-            sql = self.gen.executeRecursiveSnap(cl, tol)
-            if not query.exec_(sql):
-                if useTransaction:
-                    self.db.rollback()
-                raise Exception(self.tr('Problem snapping class: ') + query.lastError().text())
-        if useTransaction:
-            self.db.commit()
+        # runs on a pooled connection, without freezing the interface (on self.db when the caller owns the transaction)
+        sqlList = [self.gen.makeRecursiveSnapFunction(geometryColumn, keyColumn)] + [self.gen.executeRecursiveSnap(cl, tol) for cl in classList]
+        try:
+            self.getAsyncQueryResult('#'.join(sqlList), useTransaction = useTransaction)
+        except Exception as e:
+            raise Exception(self.tr('Problem snapping class: ') + ':'.join(e.args))
     
     def runQuery(self, sql, errorMsg, params, useTransaction = True):
         self.checkAndOpenDb()
@@ -1750,67 +2235,126 @@ class PostgisDb(AbstractDb):
         return result
 
     def createAndPopulateTempTableFromMap(self, tableName, featureMap, geomColumnName, keyColumn, srid, useTransaction=True):
+        """
+        Creates tableName_temp and loads the features of featureMap into it
+        featureMap: dict {feature id: QgsFeature}
+        The features are streamed with COPY and the spatial index is created after the load.
+        """
+        self.checkAndOpenDb()
+        attributes = []
+        if len(featureMap) > 0:
+            # getting only provider fields (we ignore expression fields - type = 6)
+            attributes = [field.name() for field in featureMap.values()[0].fields() if field.type() != 6]
+        createSqlList = self.gen.createTempTable(tableName).split('#')
+        rowGenerator = lambda : self.getFeatureMapRows(featureMap, attributes, keyColumn, srid)
+        indexSql = self.gen.createSpatialIndex(tableName, geomColumnName)
+        self.bulkLoadTempTable(tableName, createSqlList, attributes + [geomColumnName], rowGenerator, srid, indexSql, useTransaction = useTransaction)
+        self.invalidateMetadataCache(categoryList = self.getGeomMetadataCategoryList())
+
+    def createTempTableFromTable(self, tableSchema, tableName, tempTableName, geomColumnName, extent = None, useTransaction=True):
+        """
+        Creates tableSchema.tempTableName as a copy of the features (with geometry) of tableSchema.tableName, server side.
+        Used instead of createAndPopulateTempTableFromMap when no layer is available (e.g. in worker threads).
+        extent: (xmin, ymin, xmax, ymax, srid) that the copied features must intersect (e.g. a tile)
+        """
         self.checkAndOpenDb()
         if useTransaction:
             self.db.transaction()
         query = QSqlQuery(self.db)
-        sql = self.gen.createTempTable(tableName)
-        sqls = sql.split('#')
-        for s in sqls:
-            if not query.exec_(s):
+        for sql in self.gen.createTempTableFromTable(tableSchema, tableName, tempTableName, geomColumnName, extent = extent).split('#'):
+            if not query.exec_(sql):
                 if useTransaction:
                     self.db.rollback()
-                raise Exception(self.tr('Problem creating temp table {}: '.format(tableName)) + query.lastError().text())
-        attributes = None
-        auxAttributes = None
+                raise Exception(self.tr('Problem creating temp table {0}: ').format(tempTableName) + query.lastError().text())
+        if useTransaction:
+            self.db.commit()
+        self.invalidateMetadataCache(categoryList = self.getGeomMetadataCategoryList())
+
+    def getFeatureMapRows(self, featureMap, attributes, keyColumn, srid):
+        """
+        Yields the values of each feature of featureMap, geometry (as SRID=srid;hexwkb) as the last value
+        """
         for feat in featureMap.values():
-            if not attributes:
-                # getting only provider fields (we ignore expression fields - type = 6)
-                attributes = [field.name() for field in feat.fields() if field.type() != 6]
-            # getting keyColumn idx
-            keyIdx = feat.fieldNameIndex(keyColumn)
-            # getting only the needed attribute values
-            values = []
-            for field in attributes:
-                if field == keyColumn:
-                    values.append(feat.id())
-                else:
-                    values.append(feat.attribute(field))
             if not feat.geometry():
                 continue
-            geometry = binascii.hexlify(feat.geometry().asWkb())
-            # adding the geometry column to attributes
-            if not auxAttributes:
-                auxAttributes = attributes[:] #this is done not to mess up original attributes list
-                auxAttributes.append(geomColumnName)
-            # adding the geometry value to values
-            values.append(geometry)
-            # preparing 
-            prepareValues = []
-            for attr in auxAttributes:
-                if attr == geomColumnName:
-                    prepareValues.append("""ST_SetSRID(ST_Multi(:{0}),{1})""".format(attr,str(srid)))
-                else:
-                    prepareValues.append(':'+attr)
-            #getting sql
-            insertSql = self.gen.populateTempTable(tableName, auxAttributes, prepareValues)
-            query.prepare(insertSql)
+            values = [feat.id() if field == keyColumn else feat.attribute(field) for field in attributes]
+            values.append(self.getMultiHexWkbWithSrid(feat.geometry(), srid))
+            yield values
+
+    def getMultiHexWkbWithSrid(self, geom, srid):
+        """
+        Gets the geometry converted to multi type in the text form SRID=srid;hexwkb accepted by PostGIS
+        """
+        multiGeom = QgsGeometry(geom)
+        multiGeom.convertToMultiType()
+        return 'SRID={0};{1}'.format(srid, binascii.hexlify(multiGeom.asWkb()))
+
+    def bulkLoadTempTable(self, tableName, createSqlList, attributes, rowGenerator, srid, indexSql, useTransaction = True):
+        """
+        Creates, populates and indexes a temp table
+        tableName: table name used by the sql generator (without the _temp suffix)
+        createSqlList: sqls that create the table
+        attributes: loaded columns, geometry column as the last one
+        rowGenerator: callable that returns an iterable of rows
+        indexSql: spatial index sql, run after the load
+        When COPY is unavailable, or the caller owns the transaction, one prepared statement is reused for all rows.
+        """
+        if useTransaction:
+            try:
+                self.bulkLoadTempTableWithCopy(tableName, createSqlList, attributes, rowGenerator, indexSql)
+                return
+            except psycopg2.Error as e:
+                QgsMessageLog.logMessage(self.tr('COPY unavailable, loading temp table {0} with a prepared statement: ').format(tableName) + str(e), "DSG Tools Plugin", QgsMessageLog.WARNING)
+        self.bulkLoadTempTableWithPreparedStatement(tableName, createSqlList, attributes, rowGenerator, srid, indexSql, useTransaction = useTransaction)
+
+    def bulkLoadTempTableWithCopy(self, tableName, createSqlList, attributes, rowGenerator, indexSql):
+        """
+        Creates, populates and indexes a temp table in a single transaction of a psycopg2 connection
+        """
+        conn = self.getPsycopg2Connection()
+        try:
+            cursor = conn.cursor()
+            for sql in createSqlList:
+                cursor.execute(sql)
+            cursor.copy_expert(self.gen.copyIntoTempTable(tableName, attributes), CopyStream(rowGenerator()))
+            cursor.execute(indexSql)
+            conn.commit()
+        except psycopg2.Error:
+            self.rollbackPsycopg2Connection()
+            raise
+
+    def bulkLoadTempTableWithPreparedStatement(self, tableName, createSqlList, attributes, rowGenerator, srid, indexSql, useTransaction = True):
+        """
+        Creates, populates and indexes a temp table through self.db, reusing one prepared statement
+        """
+        if useTransaction:
+            self.db.transaction()
+        query = QSqlQuery(self.db)
+        for s in createSqlList:
+            if not query.exec_(s):
+                if useTransaction:
+                    self.db.rollback()
+                raise Exception(self.tr('Problem creating temp table {}: '.format(tableName)) + query.lastError().text())
+        # preparing. The geometry column is the last one
+        prepareValues = [':'+attr for attr in attributes[:-1]]
+        prepareValues.append("""ST_SetSRID(ST_Multi(:{0}),{1})""".format(attributes[-1], str(srid)))
+        query.prepare(self.gen.populateTempTable(tableName, attributes, prepareValues))
+        for values in rowGenerator():
             # binding my values to avoid injections
-            for i in range(len(auxAttributes)):
-                query.bindValue(prepareValues[i], values[i])
+            for i in range(len(attributes)):
+                query.bindValue(':'+attributes[i], values[i])
             # actual query execution
             if not query.exec_():
                 if useTransaction:
                     self.db.rollback()
-                raise Exception(self.tr('Problem creating temp table {}: '.format(tableName)) + query.lastError().text())
-        indexSql = self.gen.createSpatialIndex(tableName, geomColumnName)
+                raise Exception(self.tr('Problem populating temp table {}: '.format(tableName)) + query.lastError().text())
         if not query.exec_(indexSql):
             if useTransaction:
                 self.db.rollback()
             raise Exception(self.tr('Problem creating spatial index on temp table {}: '.format(tableName)) + query.lastError().text())
         if useTransaction:
-            self.db.commit()        
-        
+            self.db.commit()
+
     def dropTempTable(self, tableName, useTransaction = True):
         self.checkAndOpenDb()
         if useTransaction:
@@ -1823,6 +2367,7 @@ class PostgisDb(AbstractDb):
             raise Exception(self.tr('Problem dropping temp table {}: '.format(tableName)) + query.lastError().text())
         if useTransaction:
             self.db.commit()
+        self.invalidateMetadataCache(categoryList = self.getGeomMetadataCategoryList())
     
     def createStyleTable(self, useTransaction = True):
         if useTransaction:
@@ -2094,6 +2639,13 @@ class PostgisDb(AbstractDb):
         return geomDict
     
     def getDbDomainDict(self, auxGeomDict, buildOtherInfo = False):
+        """
+        Cached version of getDbDomainDictFromDb (see getPersistentMetadata)
+        """
+        key = (tuple(sorted(auxGeomDict['tablePerspective'].keys())), buildOtherInfo)
+        return self.getPersistentMetadata('dbDomainDict', key, lambda : self.getDbDomainDictFromDb(auxGeomDict, buildOtherInfo = buildOtherInfo))
+
+    def getDbDomainDictFromDb(self, auxGeomDict, buildOtherInfo = False):
         """
         returns a dict like this:
         {'adm_posto_fiscal_a': {
@@ -2117,10 +2669,14 @@ class PostgisDb(AbstractDb):
         query = QSqlQuery(sql, self.db)
         if not query.isActive():
             raise Exception(self.tr("Problem getting geom schemas from db: ")+query.lastError().text())
-        geomDict = dict()
+        fkList = []
         while query.next():
             #parse done in parseFkQuery to make code cleaner.
-            tableName, fkAttribute, domainTable, domainReferencedAttribute = self.parseFkQuery(query.value(0),query.value(1))
+            fkList.append(self.parseFkQuery(query.value(0),query.value(1)))
+        #each referenced domain table is fetched only once
+        domainRowDict = self.getDomainRowDict(list(set([i[2] for i in fkList])))
+        geomDict = dict()
+        for tableName, fkAttribute, domainTable, domainReferencedAttribute in fkList:
             if tableName not in geomDict.keys():
                 geomDict[tableName] = dict()
             if 'columns' not in geomDict[tableName].keys():
@@ -2129,7 +2685,7 @@ class PostgisDb(AbstractDb):
                 geomDict[tableName]['columns'][fkAttribute] = dict()
             geomDict[tableName]['columns'][fkAttribute]['references'] = domainTable
             geomDict[tableName]['columns'][fkAttribute]['refPk'] = domainReferencedAttribute
-            values, otherKey = self.getLayerColumnDict(domainReferencedAttribute, domainTable)
+            values, otherKey = self.buildLayerColumnDict(domainReferencedAttribute, domainRowDict[domainTable])
             geomDict[tableName]['columns'][fkAttribute]['values'] = values
             geomDict[tableName]['columns'][fkAttribute]['otherKey'] = otherKey
             geomDict[tableName]['columns'][fkAttribute]['constraintList'] = []
@@ -2170,6 +2726,12 @@ class PostgisDb(AbstractDb):
         return geomDict
     
     def getCheckConstraintDict(self):
+        """
+        Cached version of getCheckConstraintDictFromDb (see getPersistentMetadata)
+        """
+        return self.getPersistentMetadata('checkConstraintDict', None, self.getCheckConstraintDictFromDb)
+
+    def getCheckConstraintDictFromDb(self):
         """
         returns a dict like this:
         {'asb_dep_abast_agua_a': {
@@ -2260,6 +2822,12 @@ class PostgisDb(AbstractDb):
         return tableName, attribute, checkList
     
     def getMultiColumnsDict(self):
+        """
+        Cached version of getMultiColumnsDictFromDb (see getPersistentMetadata)
+        """
+        return self.getPersistentMetadata('multiColumnsDict', None, self.getMultiColumnsDictFromDb)
+
+    def getMultiColumnsDictFromDb(self):
         """
         { 'table_name':[-list of columns-] } 
         """
@@ -2288,8 +2856,134 @@ class PostgisDb(AbstractDb):
             geomList.append(json.loads(query.value(0)))
         return geomList  
     
+    def getGeomMetadataCategoryList(self):
+        """
+        Metadata cache categories that list geometric tables. They must be invalidated when tables are created or dropped.
+        """
+        return ['geomTypeDict', 'geomColumnDict', 'geomColumnTupleList', 'layersWithElements']
+
+    def getPersistentMetadataCategoryList(self):
+        """
+        Metadata cache categories stored in the on-disk snapshot. They only depend on the catalog (and domain values).
+        """
+        return ['geomColumnTupleList', 'checkConstraintDict', 'notNullDict', 'multiColumnsDict', 'inheritanceTreeDict', 'dbDomainDict']
+
+    def getPersistentMetadata(self, category, key, buildMethod):
+        """
+        Gets catalog metadata from the memory cache, then from the on-disk snapshot and, at last, from the database.
+        Values read from the database are written back to the snapshot.
+        category: one of getPersistentMetadataCategoryList
+        key: hashable key inside the category
+        buildMethod: callable that reads the value from the database
+        """
+        self.checkAndOpenDb()
+        value = self.getCachedMetadata(category, key)
+        if value is None and self.loadMetadataSnapshot():
+            value = self.getCachedMetadata(category, key)
+        if value is None:
+            value = buildMethod()
+            self.setCachedMetadata(category, key, value)
+            self.saveMetadataSnapshot()
+        return deepcopy(value)
+
+    def getCatalogFingerprint(self):
+        """
+        Gets a cheap fingerprint of the catalog. It changes whenever tables, constraints, inheritance or domain values change.
+        """
+        self.checkAndOpenDb()
+        sql = self.gen.getCatalogFingerprint()
+        query = QSqlQuery(sql, self.db)
+        if not query.isActive():
+            raise Exception(self.tr('Problem getting catalog fingerprint: ') + query.lastError().text())
+        while query.next():
+            return query.value(0)
+
+    def getMetadataSnapshotPath(self):
+        """
+        Gets the path of the metadata snapshot of this database. Snapshots are identified by host, port and database oid.
+        """
+        path = self.getCachedMetadata('snapshot', 'path')
+        if path is None:
+            fileName = '{0}_{1}_{2}.pickle'.format(re.sub(r'[^\w.-]', '_', self.getHostName()), self.db.port(), self.getDbOID())
+            path = os.path.join(QgsApplication.qgisSettingsDirPath(), 'dsgtools', 'metadataSnapshots', fileName)
+            self.setCachedMetadata('snapshot', 'path', path)
+        return path
+
+    def loadMetadataSnapshot(self):
+        """
+        Loads the on-disk snapshot of this database into the metadata cache, once per connection.
+        The snapshot is discarded when its fingerprint differs from the current catalog fingerprint.
+        Returns True if the snapshot was loaded by this call.
+        """
+        if self.getCachedMetadata('snapshot', 'fingerprint') is not None:
+            return False
+        fingerprint = self.getCatalogFingerprint()
+        self.setCachedMetadata('snapshot', 'fingerprint', fingerprint)
+        path = self.getMetadataSnapshotPath()
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'rb') as snapshotFile:
+                snapshot = cPickle.load(snapshotFile)
+        except Exception as e:
+            QgsMessageLog.logMessage(self.tr('Invalid metadata snapshot, it will be rebuilt: ') + str(e), "DSG Tools Plugin", QgsMessageLog.WARNING)
+            return False
+        if snapshot.get('fingerprint') != fingerprint:
+            return False
+        for category, valueDict in snapshot['metadata'].iteritems():
+            for key, value in valueDict.iteritems():
+                if self.getCachedMetadata(category, key) is None:
+                    self.setCachedMetadata(category, key, value)
+        return True
+
+    def saveMetadataSnapshot(self):
+        """
+        Writes the persistent categories of the metadata cache to the on-disk snapshot
+        """
+        connectionCache = self.metadataCache.get(self.getMetadataCacheKey(), dict())
+        snapshot = {'fingerprint' : self.getCachedMetadata('snapshot', 'fingerprint'),
+                    'metadata' : {category : connectionCache[category] for category in self.getPersistentMetadataCategoryList() if category in connectionCache}}
+        try:
+            path = self.getMetadataSnapshotPath()
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as snapshotFile:
+                cPickle.dump(snapshot, snapshotFile, cPickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            QgsMessageLog.logMessage(self.tr('Problem writing metadata snapshot: ') + str(e), "DSG Tools Plugin", QgsMessageLog.WARNING)
+
+    def invalidateMetadataCache(self, categoryList = None):
+        """
+        Invalidates the metadata cache of this connection.
+        When the whole cache is invalidated the on-disk snapshot is removed as well.
+        When persistent categories are invalidated the catalog fingerprint is recomputed, so that the snapshot
+        is not written back with the fingerprint of the catalog before the change.
+        categoryList: if provided, only these categories are invalidated
+        """
+        fingerprint = self.getCachedMetadata('snapshot', 'fingerprint')
+        if categoryList is None:
+            try:
+                path = self.getMetadataSnapshotPath()
+                if os.path.exists(path):
+                    os.remove(path)
+            except Exception as e:
+                QgsMessageLog.logMessage(self.tr('Problem removing metadata snapshot: ') + str(e), "DSG Tools Plugin", QgsMessageLog.WARNING)
+        super(PostgisDb, self).invalidateMetadataCache(categoryList = categoryList)
+        if fingerprint is None or (categoryList is not None and not set(categoryList) & set(self.getPersistentMetadataCategoryList())):
+            # not loaded yet (loadMetadataSnapshot computes it) or not affected
+            return
+        try:
+            self.setCachedMetadata('snapshot', 'fingerprint', self.getCatalogFingerprint())
+        except Exception as e:
+            # loadMetadataSnapshot computes it again on the next access
+            self.invalidateMetadataCache(categoryList = ['snapshot'])
+            QgsMessageLog.logMessage(self.tr('Problem recomputing catalog fingerprint: ') + str(e), "DSG Tools Plugin", QgsMessageLog.WARNING)
+
     def getGeomTypeDict(self, loadCentroids=False):
         self.checkAndOpenDb()
+        geomDict = self.getCachedMetadata('geomTypeDict', loadCentroids)
+        if geomDict is not None:
+            return {key : list(value) for key, value in geomDict.items()}
         sql = self.gen.getGeomByPrimitive()
         query = QSqlQuery(sql, self.db)
         if not query.isActive():
@@ -2306,6 +3000,7 @@ class PostgisDb(AbstractDb):
                 geomDict[aux['geomtype']] = classlist
             else:
                 geomDict[aux['geomtype']] = aux['classlist']
+        self.setCachedMetadata('geomTypeDict', loadCentroids, {key : list(value) for key, value in geomDict.items()})
         return geomDict
     
     def getGeomColumnDict(self):
@@ -2313,6 +3008,9 @@ class PostgisDb(AbstractDb):
         Dict in the form 'geomName':[-list of table names-]
         """
         self.checkAndOpenDb()
+        geomDict = self.getCachedMetadata('geomColumnDict', None)
+        if geomDict is not None:
+            return {key : list(value) for key, value in geomDict.items()}
         sql = self.gen.getGeomColumnDict()
         query = QSqlQuery(sql, self.db)
         if not query.isActive():
@@ -2323,6 +3021,7 @@ class PostgisDb(AbstractDb):
             if aux['f2'] not in geomDict.keys():
                 geomDict[aux['f2']] = []
             geomDict[aux['f2']].append(aux['f1'])
+        self.setCachedMetadata('geomColumnDict', None, {key : list(value) for key, value in geomDict.items()})
         return geomDict
     
     def getGeomColumnTupleList(self, showViews = False, hideCentroids = True, primitiveFilter = [], withElements = False):
@@ -2331,6 +3030,32 @@ class PostgisDb(AbstractDb):
         centroids are hidden by default
         """
         self.checkAndOpenDb()
+        localList = self.getPersistentMetadata('geomColumnTupleList', (showViews, hideCentroids), lambda : self.getGeomColumnTupleListFromDb(showViews = showViews, hideCentroids = hideCentroids))
+        if not withElements and primitiveFilter == []:
+            return localList
+        if withElements:
+            listWithElements = self.getLayersWithElementsV2([{'tableSchema':i[0],'tableName':i[1]} for i in localList])
+            geomList = [i for i in localList if i[1] in listWithElements]
+        else:
+            geomList = localList
+        if primitiveFilter <> []:
+            geomTypeFilter = []
+            if 'p' in primitiveFilter: 
+                geomTypeFilter.append('POINT')
+                geomTypeFilter.append('MULTIPOINT')
+            if 'l' in primitiveFilter: 
+                geomTypeFilter.append('LINESTRING')
+                geomTypeFilter.append('MULTILINESTRING')
+            if 'a' in primitiveFilter:
+                geomTypeFilter.append('POLYGON')
+                geomTypeFilter.append('MULTIPOLYGON')
+            geomList = [i for i in geomList if i[3] in geomTypeFilter]
+        return geomList
+
+    def getGeomColumnTupleListFromDb(self, showViews = False, hideCentroids = True):
+        """
+        Reads the geometry column tuple list from the catalog (getGeomColumnTupleList caches it)
+        """
         centroidTableList = []
         try:
             edgvVersion = self.getDatabaseVersion()
@@ -2355,26 +3080,7 @@ class PostgisDb(AbstractDb):
                 continue
             else:
                 localList.append((query.value(0), query.value(1), query.value(2), query.value(3), query.value(4)))
-        if not withElements and primitiveFilter == []:
-            return localList
-        if withElements:
-            listWithElements = self.getLayersWithElementsV2([{'tableSchema':i[0],'tableName':i[1]} for i in localList])
-            geomList = [i for i in localList if i[1] in listWithElements]
-        else:
-            geomList = localList
-        if primitiveFilter <> []:
-            geomTypeFilter = []
-            if 'p' in primitiveFilter: 
-                geomTypeFilter.append('POINT')
-                geomTypeFilter.append('MULTIPOINT')
-            if 'l' in primitiveFilter: 
-                geomTypeFilter.append('LINESTRING')
-                geomTypeFilter.append('MULTILINESTRING')
-            if 'a' in primitiveFilter:
-                geomTypeFilter.append('POLYGON')
-                geomTypeFilter.append('MULTIPOLYGON')
-            geomList = [i for i in geomList if i[3] in geomTypeFilter]
-        return geomList
+        return localList
     
     def getGeomColumnDictV2(self, showViews = False, hideCentroids = True, primitiveFilter = [], withElements = False, excludeValidation = False):
         geomList = self.getGeomColumnTupleList(showViews = showViews, hideCentroids = hideCentroids, primitiveFilter = primitiveFilter, withElements = withElements)
@@ -2403,6 +3109,12 @@ class PostgisDb(AbstractDb):
         return filtered
 
     def getNotNullDictV2(self):
+        """
+        Cached version of getNotNullDictV2FromDb (see getPersistentMetadata)
+        """
+        return self.getPersistentMetadata('notNullDict', None, self.getNotNullDictV2FromDb)
+
+    def getNotNullDictV2FromDb(self):
         """
         Dict in the form 'tableName': { 'schema':-name of the schema'
                                         'attributes':[-list of table names-]}
@@ -2441,10 +3153,35 @@ class PostgisDb(AbstractDb):
         query = QSqlQuery(sql, self.db)
         if not query.isActive():
             raise Exception(self.tr("Problem getting layer column dict from table ")+domainTable+':'+query.lastError().text())
+        rowList = []
+        while query.next():
+            rowList.append(json.loads(query.value(0)))
+        return self.buildLayerColumnDict(refPk, rowList)
+
+    def getDomainRowDict(self, domainTableList):
+        """
+        Fetches the rows of every domain table in domainTableList in a single query.
+        Returns a dict like {domainTable: [row dict]}
+        """
+        self.checkAndOpenDb()
+        domainRowDict = {domainTable:[] for domainTable in domainTableList}
+        if len(domainTableList) == 0:
+            return domainRowDict
+        sql = self.gen.getDomainCodeDictList(domainTableList)
+        query = QSqlQuery(sql, self.db)
+        if not query.isActive():
+            raise Exception(self.tr("Problem getting domain values: ")+query.lastError().text())
+        while query.next():
+            domainRowDict[query.value(0)].append(json.loads(query.value(1)))
+        return domainRowDict
+
+    def buildLayerColumnDict(self, refPk, rowList):
+        """
+        Builds {refPk value: other column value} from the rows of a domain table
+        """
         domainDict = dict()
         otherKey = None
-        while query.next():
-            aux = json.loads(query.value(0))
+        for aux in rowList:
             if not otherKey:
                 otherKey = [key for key in aux.keys() if key <> refPk][0]
             domainDict[aux[refPk]] = aux[otherKey]
@@ -2549,6 +3286,7 @@ class PostgisDb(AbstractDb):
                 progress.step()
         if useTransaction:
             self.db.commit()
+        self.invalidateMetadataCache()
         #this close is to allow creation from template
         if closeAfterUse:
             self.db.close()
@@ -2670,6 +3408,7 @@ class PostgisDb(AbstractDb):
                 raise Exception(self.tr('Error on database creation! ')+query.lastError().text()+ self.tr(' Db will be dropped.'))
         if useTransaction:
             self.db.commit()
+        self.invalidateMetadataCache()
         self.alterSearchPath(version, useTransaction = useTransaction)
         self.setDbAsTemplate(version = version, useTransaction = useTransaction)
         self.createStyleTable(useTransaction = useTransaction)
@@ -2729,6 +3468,7 @@ class PostgisDb(AbstractDb):
             raise Exception(self.tr('Problem deleting flag: ') + query.lastError().text())
         if useTransaction:
             self.db.commit()
+        self.invalidateMetadataCache(categoryList = ['layersWithElements'])
         
     def removeEmptyGeometries(self, layer, geometryColumn, useTransaction = True):
         """
@@ -2747,6 +3487,7 @@ class PostgisDb(AbstractDb):
             raise Exception(self.tr('Problem removing empty geometries: ') + query.lastError().text())
         if useTransaction:
             self.db.commit()
+        self.invalidateMetadataCache(categoryList = ['layersWithElements'])
     
     def getParamsFromConectedDb(self):
         self.checkAndOpenDb()
@@ -3062,6 +3803,12 @@ class PostgisDb(AbstractDb):
         return valueList
     
     def getInheritanceTreeDict(self):
+        """
+        Cached version of getInheritanceTreeDictFromDb (see getPersistentMetadata)
+        """
+        return self.getPersistentMetadata('inheritanceTreeDict', None, self.getInheritanceTreeDictFromDb)
+
+    def getInheritanceTreeDictFromDb(self):
         self.checkAndOpenDb()
         inhDict = self.getInheritanceDict()
         layerList = self.listGeomClassesFromDatabase()
@@ -3437,74 +4184,53 @@ class PostgisDb(AbstractDb):
         """
         Creates and populates a postgis table with features that compose the coverage layer
         """
-        self.checkAndOpenDb()
-        if useTransaction:
-            self.db.transaction()
-        query = QSqlQuery(self.db)
         #getting srid from something like 'EPSG:31983'
         srid = coverageLayer.crs().authid().split(':')[-1]
+        self.createAndPopulateCoverageTempTableFromFeatures(coverageLayer.getFeatures, srid, useTransaction = useTransaction)
+
+    def createAndPopulateCoverageTempTableFromFeatures(self, featureGenerator, srid, useTransaction = True):
+        """
+        Creates and populates the coverage temp table with unified features (see ValidationProcess.getUnifiedFeatures)
+        featureGenerator: callable that returns an iterable of features (it may be called again if COPY fails)
+        """
+        self.checkAndOpenDb()
         #complete table name
         tableName = 'validation.coverage'
-        sql = self.gen.createCoverageTempTable(srid)
-        if not query.exec_(sql):
-            if useTransaction:
-                self.db.rollback()
-            raise Exception(self.tr('Problem creating coverage temp table: ') + query.lastError().text())
-        for feat in coverageLayer.getFeatures():
-            # getting only the needed attribute values
-            featid = feat['featid']
-            classname = feat['classname']
+        createSqlList = [self.gen.createCoverageTempTable(srid)]
+        rowGenerator = lambda : self.getCoverageRows(featureGenerator(), srid)
+        indexSql = self.gen.createSpatialIndex(tableName, 'geom')
+        self.bulkLoadTempTable(tableName, createSqlList, ['featid', 'classname', 'geom'], rowGenerator, srid, indexSql, useTransaction = useTransaction)
+        self.invalidateMetadataCache(categoryList = self.getGeomMetadataCategoryList())
+
+    def getCoverageRows(self, featureIterator, srid):
+        """
+        Yields (featid, classname, geometry) for each feature of the coverage
+        """
+        for feat in featureIterator:
             if not feat.geometry():
                 continue
-            geometry = binascii.hexlify(feat.geometry().asWkb())
-            # values list and attributes list
-            values = [featid, classname, geometry]
-            attributes = ['featid', 'classname', 'geom']
-            # preparing 
-            prepareValues = []
-            for attr in attributes:
-                if attr == 'geom':
-                    prepareValues.append("""ST_SetSRID(ST_Multi(:{0}),{1})""".format(attr,str(srid)))
-                else:
-                    prepareValues.append(':'+attr)
-            #getting sql
-            insertSql = self.gen.populateTempTable(tableName, attributes, prepareValues)
-            query.prepare(insertSql)
-            # binding my values to avoid injections
-            for i in range(len(attributes)):
-                query.bindValue(prepareValues[i], values[i])
-            # actual query execution
-            if not query.exec_():
-                if useTransaction:
-                    self.db.rollback()
-                raise Exception(self.tr('Problem populating coverage temp table: ') + query.lastError().text())
-        indexSql = self.gen.createSpatialIndex(tableName, 'geom')
-        if not query.exec_(indexSql):
-            if useTransaction:
-                self.db.rollback()
-            raise Exception(self.tr('Problem creating spatial index on coverage temp table: ') + query.lastError().text())
-        if useTransaction:
-            self.db.commit()   
+            yield [feat['featid'], feat['classname'], self.getMultiHexWkbWithSrid(feat.geometry(), srid)]
 
     def getGapsAndOverlapsRecords(self, frameTable, geomColumn, useTransaction = True):
         """
         Identify gaps and overlaps in the coverage layer
         """
         self.checkAndOpenDb()
-        # checking for gaps with frame
+        # gaps with frame, overlaps and inner gaps are independent checks: they run concurrently on pooled connections
+        # (one after the other on self.db when the caller owns the transaction)
+        checkList = [
+            (self.tr("Problem getting gaps: "), self.tr('Gap between the frame layer and coverage layer'), self.gen.checkCoverageForGapsWithFrame(frameTable, geomColumn)),
+            (self.tr("Problem getting overlaps: "), self.tr('Overlap between the features of the layer'), self.gen.checkCoverageForOverlaps('validation.coverage_temp','geom','id')),
+            (self.tr("Problem getting gaps: "), self.tr('Gap between the features of the layer'), self.gen.checkCoverageForGaps('validation.coverage_temp','geom','id'))
+        ]
+        futureList = [(errorMsg, reason, self.executeQueryAsync(sql, useTransaction = useTransaction)) for errorMsg, reason, sql in checkList]
         invalidCoverageRecordsList = []
-        sql = self.gen.checkCoverageForGapsWithFrame(frameTable, geomColumn)
-        query = QSqlQuery(sql, self.db)
-        if not query.isActive():
-            raise Exception(self.tr("Problem getting gaps: ")+query.lastError().text())
-        while query.next():
-            reason = self.tr('Gap between the frame layer and coverage layer')
-            geom = query.value(0)
-            invalidCoverageRecordsList.append( (0, reason, geom) )
-        # checking for overlaps in coverage
-        invalidCoverageRecordsList += self.getOverlapsRecords('validation.coverage_temp','geom','id')
-        # checking for inner gaps in coverage
-        invalidCoverageRecordsList += self.getGapsRecords('validation.coverage_temp','geom','id')
+        for errorMsg, reason, future in futureList:
+            try:
+                rowList = self.waitForQuery(future)
+            except Exception as e:
+                raise Exception(errorMsg + ':'.join(e.args))
+            invalidCoverageRecordsList += [(0, reason, row[0]) for row in rowList]
         return invalidCoverageRecordsList
 
     def getOverlapsRecords(self, table, geomColumn, keyColumn, useTransaction = True):
@@ -3611,13 +4337,13 @@ class PostgisDb(AbstractDb):
         Returns the number of flags raised by a process.
         """
         self.checkAndOpenDb()
-        sql = self.gen.getFlagsByProcess(processName)
+        sql = self.gen.getNumberOfFlagsByProcess(processName)
         query = QSqlQuery(sql, self.db)
         if not query.isActive():
             raise Exception(self.tr('Problem while retrieving flags dict: ') + query.lastError().text())
         nrFlags = 0
         while query.next():
-            nrFlags += 1
+            nrFlags = query.value(0)
         return nrFlags
 
     def createValidationHistoryViewTable(self, idListString=None):
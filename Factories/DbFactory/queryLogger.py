@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ DsgTools
+                                 A QGIS plugin
+ Brazilian Army Cartographic Production Tools
+                              -------------------
+        begin                : 2018-03-12
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Philipe Borba - Cartographic Engineer @ Brazilian Army
+        email                : borba@dsg.eb.mil.br
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import sys, re, json, threading
+from collections import deque
+from datetime import datetime
+from time import time
+
+#PyQt imports
+from PyQt4.QtCore import QSettings
+from PyQt4.QtSql import QSqlQuery, QSqlDatabase
+
+class QueryLogger(object):
+    """
+    Ring buffer of executed queries of a connection, plus a log of the slow ones.
+    Settings are shared by every connection and read from DsgTools options (see loadSettings).
+    """
+    loggerDict = dict()
+    settingsLoaded = False
+    enabled = False
+    slowQueryThreshold = 1.0
+    explainSlowQueries = False
+    bufferSize = 1000
+    maxSqlLength = 2000
+    # per thread callback(elapsed) called after each query (see setQueryListener)
+    listenerLocal = threading.local()
+
+    def __init__(self, connectionKey):
+        """
+        Constructor
+        connectionKey: (driverName, hostName, port, databaseName)
+        """
+        self.connectionKey = connectionKey
+        self.queryBuffer = deque(maxlen = self.bufferSize)
+        self.slowQueryBuffer = deque(maxlen = self.bufferSize)
+
+    @classmethod
+    def loadSettings(cls):
+        """
+        Reads query log settings from DsgTools options
+        """
+        settings = QSettings()
+        settings.beginGroup('PythonPlugins/DsgTools/Options')
+        cls.enabled = settings.value('queryLogEnabled') in [True, 'true']
+        cls.explainSlowQueries = settings.value('explainSlowQueries') in [True, 'true']
+        slowQueryThreshold = settings.value('slowQueryThreshold')
+        if slowQueryThreshold:
+            cls.slowQueryThreshold = float(slowQueryThreshold)
+        settings.endGroup()
+        cls.settingsLoaded = True
+
+    @classmethod
+    def getConnectionKey(cls, db):
+        """
+        Gets the key of a QSqlDatabase (same key used by AbstractDb metadata cache)
+        """
+        return (db.driverName(), db.hostName(), db.port(), db.databaseName())
+
+    @classmethod
+    def getLogger(cls, db):
+        """
+        Gets the logger of a connection, creating it if needed
+        """
+        connectionKey = cls.getConnectionKey(db)
+        if connectionKey not in cls.loggerDict:
+            cls.loggerDict[connectionKey] = QueryLogger(connectionKey)
+        return cls.loggerDict[connectionKey]
+
+    @classmethod
+    def isEnabled(cls):
+        if not cls.settingsLoaded:
+            cls.loadSettings()
+        return cls.enabled
+
+    @classmethod
+    def setQueryListener(cls, listener):
+        """
+        Sets a callback(elapsed) called after each query executed by the current thread (None removes it).
+        Used by ValidationProcess to profile the time spent on the server.
+        """
+        cls.listenerLocal.listener = listener
+
+    @classmethod
+    def getQueryListener(cls):
+        return getattr(cls.listenerLocal, 'listener', None)
+
+    @classmethod
+    def normalizeSql(cls, sql):
+        """
+        Replaces literals by ? and collapses whitespace and value lists, so that equivalent queries look alike
+        """
+        sql = sql[:10*cls.maxSqlLength]
+        sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+        sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+        sql = re.sub(r'\s+', ' ', sql).strip()
+        sql = re.sub(r'(\([?, ]*\))(\s*,\s*\([?, ]*\))+', r'\1, ...', sql)
+        return sql[:cls.maxSqlLength]
+
+    @classmethod
+    def getCaller(cls):
+        """
+        Gets Class.method of the first frame outside this module
+        """
+        frame = sys._getframe(1)
+        while frame is not None and frame.f_globals.get('__name__') == __name__:
+            frame = frame.f_back
+        if frame is None:
+            return ''
+        if 'self' in frame.f_locals:
+            return '{0}.{1}'.format(type(frame.f_locals['self']).__name__, frame.f_code.co_name)
+        return frame.f_code.co_name
+
+    def record(self, query, db, sql, elapsed):
+        """
+        Records an executed query. Slow SELECT queries get their estimated plan captured when explainSlowQueries is set
+        (PostgreSQL connections only).
+        """
+        if not query.isActive():
+            rows = None
+        elif query.isSelect():
+            rows = query.size()
+        else:
+            rows = query.numRowsAffected()
+        entry = {'timestamp' : datetime.now().isoformat(),
+                 'sql' : self.normalizeSql(sql),
+                 'elapsed' : elapsed,
+                 'rows' : rows,
+                 'caller' : self.getCaller(),
+                 'error' : query.lastError().text() if not query.isActive() else None}
+        self.queryBuffer.append(entry)
+        if elapsed >= self.slowQueryThreshold:
+            slowEntry = dict(entry)
+            if self.explainSlowQueries and query.isActive() and query.isSelect() and db.driverName() == 'QPSQL':
+                slowEntry['plan'] = self.explain(db, sql)
+            self.slowQueryBuffer.append(slowEntry)
+
+    def explain(self, db, sql):
+        """
+        Gets the estimated plan (plain EXPLAIN) of a SELECT query. The query is not executed again, since SELECTs
+        may have side effects (e.g. UpdateGeometrySRID, dsgsnap). When the caller has an open transaction, EXPLAIN
+        runs inside a savepoint that is always rolled back, so that an error does not abort the transaction.
+        """
+        explainQuery = QSqlQuery(db)
+        # SAVEPOINT fails outside transaction blocks, where no protection is needed
+        inTransaction = explainQuery.exec_('SAVEPOINT dsgtools_explain')
+        try:
+            if not explainQuery.exec_('EXPLAIN (FORMAT TEXT) {0}'.format(sql)):
+                return explainQuery.lastError().text()
+            planLineList = []
+            while explainQuery.next():
+                planLineList.append(explainQuery.value(0))
+            return '\n'.join(planLineList)
+        finally:
+            if inTransaction:
+                explainQuery.exec_('ROLLBACK TO SAVEPOINT dsgtools_explain')
+                explainQuery.exec_('RELEASE SAVEPOINT dsgtools_explain')
+
+    def getQueryLog(self):
+        return list(self.queryBuffer)
+
+    def getSlowQueryLog(self):
+        return list(self.slowQueryBuffer)
+
+    def clear(self):
+        self.queryBuffer.clear()
+        self.slowQueryBuffer.clear()
+
+    def toDict(self):
+        return {'connection' : '{0}://{1}:{2}/{3}'.format(*self.connectionKey),
+                'queries' : self.getQueryLog(),
+                'slowQueries' : self.getSlowQueryLog()}
+
+    @classmethod
+    def exportToJson(cls, path, loggerList = None):
+        """
+        Exports the logs of loggerList (every connection if None) to a JSON file
+        """
+        if loggerList is None:
+            loggerList = cls.loggerDict.values()
+        with open(path, 'w') as logFile:
+            json.dump([logger.toDict() for logger in loggerList], logFile, indent = 2)
+
+class InstrumentedQuery(QSqlQuery):
+    """
+    QSqlQuery that reports executed statements to the QueryLogger of its connection.
+    It is a drop in replacement: database classes import it as QSqlQuery.
+    """
+    def __init__(self, *args):
+        self.queryDb = None
+        sql = None
+        if QueryLogger.isEnabled() or QueryLogger.getQueryListener():
+            for arg in args:
+                if isinstance(arg, QSqlDatabase):
+                    self.queryDb = arg
+                elif isinstance(arg, basestring):
+                    sql = arg
+        if self.queryDb is None or sql is None:
+            super(InstrumentedQuery, self).__init__(*args)
+            return
+        start = time()
+        super(InstrumentedQuery, self).__init__(*args)
+        self.report(sql, time() - start)
+
+    def exec_(self, *args):
+        if self.queryDb is None or not (QueryLogger.isEnabled() or QueryLogger.getQueryListener()):
+            return super(InstrumentedQuery, self).exec_(*args)
+        start = time()
+        ret = super(InstrumentedQuery, self).exec_(*args)
+        sql = args[0] if len(args) > 0 else self.lastQuery()
+        self.report(sql, time() - start)
+        return ret
+
+    def report(self, sql, elapsed):
+        listener = QueryLogger.getQueryListener()
+        if listener:
+            listener(elapsed)
+        if QueryLogger.isEnabled():
+            QueryLogger.getLogger(self.queryDb).record(self, self.queryDb, sql, elapsed)
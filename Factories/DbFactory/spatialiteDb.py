@@ -21,7 +21,8 @@
  ***************************************************************************/
 """
 from DsgTools.Factories.DbFactory.abstractDb import AbstractDb
-from PyQt4.QtSql import QSqlQuery, QSqlDatabase
+from PyQt4.QtSql import QSqlDatabase
+from DsgTools.Factories.DbFactory.queryLogger import InstrumentedQuery as QSqlQuery
 from PyQt4.QtGui import QFileDialog
 from DsgTools.Factories.SqlFactory.sqlGeneratorFactory import SqlGeneratorFactory
 from osgeo import ogr, osr
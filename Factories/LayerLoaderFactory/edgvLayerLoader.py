@@ -30,7 +30,6 @@ from PyQt4.Qt import QObject
 
 # QGIS imports
 from qgis.core import QgsVectorLayer,QgsDataSourceURI, QgsMessageLog, QgsField, QGis
-from qgis.utils import iface
 
 #DsgTools imports
 from DsgTools.Factories.DbFactory.abstractDb import AbstractDb
@@ -65,6 +64,15 @@ class EDGVLayerLoader(QObject):
     def load(self, layerList, useQml = False, uniqueLoad = False, useInheritance = False, stylePath = None, onlyWithElements = False):
         return None
     
+    def trackLayerEdits(self, vlayer):
+        """
+        Invalidates the cached "layer has elements" answers when features are committed to vlayer
+        """
+        abstractDb = self.abstractDb
+        invalidate = lambda *args: abstractDb.invalidateMetadataCache(categoryList = ['layersWithElements'])
+        vlayer.committedFeaturesAdded.connect(invalidate)
+        vlayer.committedFeaturesRemoved.connect(invalidate)
+
     def getStyle(self, stylePath, className):
         if 'db:' in stylePath['style']:
             return self.abstractDb.getStyle(stylePath['style'].split(':')[-1], className)
@@ -83,11 +91,11 @@ class EDGVLayerLoader(QObject):
     
     def prepareLoad(self):
         dbName = self.abstractDb.getDatabaseName()
-        groupList =  iface.legendInterface().groups()
+        groupList =  self.iface.legendInterface().groups()
         if dbName in groupList:
             return groupList.index(dbName)
         else:
-            parentTreeNode = iface.legendInterface().addGroup(self.abstractDb.getDatabaseName(), -1)
+            parentTreeNode = self.iface.legendInterface().addGroup(self.abstractDb.getDatabaseName(), -1)
             return parentTreeNode
 
     def createMeasureColumn(self, layer):
@@ -29,7 +29,6 @@ from PyQt4.Qt import QObject
 
 # QGIS imports
 from qgis.core import QgsMapLayerRegistry, QgsVectorLayer,QgsDataSourceURI, QgsMessageLog, QgsCoordinateReferenceSystem, QgsMessageLog
-from qgis.utils import iface
 
 #DsgTools imports
 from DsgTools.Factories.LayerLoaderFactory.edgvLayerLoader import EDGVLayerLoader
@@ -211,10 +210,11 @@ class PostGISLayerLoader(EDGVLayerLoader):
             sql = self.abstractDb.gen.loadLayerFromDatabase(fullName, pkColumn=pkColumn)            
         self.setDataSource(schema, tableName, geomColumn, sql, pkColumn=pkColumn)
 
-        vlayer = iface.addVectorLayer(self.uri.uri(), tableName, self.provider)
+        vlayer = self.iface.addVectorLayer(self.uri.uri(), tableName, self.provider)
         crs = QgsCoordinateReferenceSystem(int(srid), QgsCoordinateReferenceSystem.EpsgCrsId)
         if vlayer:
             vlayer.setCrs(crs)
+            self.trackLayerEdits(vlayer)
             if useQml:
                 vlayer = self.setDomainsAndRestrictionsWithQml(vlayer)
             else:
@@ -223,7 +223,7 @@ class PostGISLayerLoader(EDGVLayerLoader):
                 fullPath = self.getStyle(stylePath, tableName)
                 if fullPath:
                     vlayer.applyNamedStyle(fullPath)
-            iface.legendInterface().moveLayer(vlayer, idSubgrupo)   
+            self.iface.legendInterface().moveLayer(vlayer, idSubgrupo)   
             if not vlayer.isValid():
                 QgsMessageLog.logMessage(vlayer.error().summary(), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
         vlayer = self.createMeasureColumn(vlayer)
@@ -259,7 +259,7 @@ class PostGISLayerLoader(EDGVLayerLoader):
         """
         #TODO: Avaliar se o table = deve ser diferente
         uri = "dbname='%s' host=%s port=%s user='%s' password='%s' key=code table=\"dominios\".\"%s\" sql=" % (self.database, self.host, self.port, self.user, self.password, domainTableName)
-        domLayer = iface.addVectorLayer(uri, domainTableName, self.provider)
+        domLayer = self.iface.addVectorLayer(uri, domainTableName, self.provider)
         self.iface.legendInterface().moveLayer(domLayer, domainGroup)
         return domLayer
 
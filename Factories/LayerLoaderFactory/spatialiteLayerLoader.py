@@ -29,7 +29,6 @@ from PyQt4.Qt import QObject
 
 # QGIS imports
 from qgis.core import QgsMapLayerRegistry, QgsVectorLayer,QgsDataSourceURI, QgsMessageLog, QgsCoordinateReferenceSystem, QgsMessageLog
-from qgis.utils import iface
 
 #DsgTools imports
 from DsgTools.Factories.LayerLoaderFactory.edgvLayerLoader import EDGVLayerLoader
@@ -168,16 +167,17 @@ class SpatialiteLayerLoader(EDGVLayerLoader):
                 return lyr
         self.setDataSource('', '_'.join([schema,tableName]), geomColumn, '')
 
-        vlayer = iface.addVectorLayer(self.uri.uri(), tableName, self.provider)
+        vlayer = self.iface.addVectorLayer(self.uri.uri(), tableName, self.provider)
         crs = QgsCoordinateReferenceSystem(int(srid), QgsCoordinateReferenceSystem.EpsgCrsId)
         vlayer.setCrs(crs)
+        self.trackLayerEdits(vlayer)
         vlayer = self.setDomainsAndRestrictionsWithQml(vlayer)
         vlayer = self.setMulti(vlayer,domLayerDict)
         if stylePath:
             fullPath = self.getStyle(stylePath, tableName)
             if fullPath:
                 vlayer.applyNamedStyle(fullPath)
-        iface.legendInterface().moveLayer(vlayer, idSubgrupo)   
+        self.iface.legendInterface().moveLayer(vlayer, idSubgrupo)   
         if not vlayer.isValid():
             QgsMessageLog.logMessage(vlayer.error().summary(), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
         vlayer = self.createMeasureColumn(vlayer)
@@ -195,7 +195,7 @@ class SpatialiteLayerLoader(EDGVLayerLoader):
         uri.setDatabase(self.abstractDb.db.databaseName())
         uri.setDataSource('', 'dominios_'+domainTableName, None)
         #TODO Load domain layer into a group
-        domLayer = iface.addVectorLayer(uri.uri(), domainTableName, self.provider)
+        domLayer = self.iface.addVectorLayer(uri.uri(), domainTableName, self.provider)
         self.iface.legendInterface().moveLayer(domLayer, domainGroup)
         return domLayer
 
@@ -20,6 +20,8 @@
  *                                                                         *
  ***************************************************************************/
 """
+import math
+
 from DsgTools.Factories.SqlFactory.sqlGenerator import SqlGenerator
 from DsgTools.dsgEnums import DsgEnums
 
@@ -108,6 +110,12 @@ class PostGISSqlGenerator(SqlGenerator):
             sql = '''SELECT count(*) FROM "{0}"."{1}" limit 1'''.format(schema,table)
         return sql
 
+    def getLayersWithElementsQuery(self, tableList, useInheritance):
+        only = '' if useInheritance else 'ONLY '
+        sqlList = ["""SELECT '{0}' as table_schema, '{1}' as table_name, EXISTS (SELECT 1 FROM {2}"{0}"."{1}" LIMIT 1) as has_elements""".format(schema, table, only) for schema, table in tableList]
+        sql = ' UNION ALL '.join(sqlList)
+        return sql
+
     def getElementCountFromLayerWithInh(self, layer):
         sql = "SELECT count(*) FROM "+layer
         return sql
@@ -432,6 +440,63 @@ class PostGISSqlGenerator(SqlGenerator):
         sql = "INSERT INTO validation.process_history (process_name, log, status) values ('%s','%s',%s)" % (processName,log,status)
         return sql
     
+    def checkValidationProfileColumn(self):
+        sql = "SELECT count(*) FROM information_schema.columns WHERE table_schema = 'validation' AND table_name = 'process_history' AND column_name = 'profile'"
+        return sql
+
+    def createValidationProfileColumn(self):
+        sql = "ALTER TABLE validation.process_history ADD COLUMN profile text"
+        return sql
+
+    def setValidationProfileQuery(self, processName, profile):
+        """
+        Sets the profile (json) of the last history entry of a process
+        """
+        sql = """UPDATE validation.process_history SET profile = '{1}' WHERE id = (SELECT max(id) FROM validation.process_history WHERE process_name = '{0}')""".format(processName, profile.replace("'", "''"))
+        return sql
+
+    def getValidationProfileQuery(self, processName, finished):
+        """
+        Gets the profile of the execution of processName that started at finished (see compact_process_history)
+        """
+        sql = """SELECT profile FROM validation.process_history WHERE process_name = '{0}' AND finished >= '{1}' AND profile IS NOT NULL ORDER BY id LIMIT 1""".format(processName, finished)
+        return sql
+
+    def getValidationProfileListQuery(self):
+        sql = """SELECT id, process_name, finished, profile FROM validation.process_history WHERE profile IS NOT NULL ORDER BY id"""
+        return sql
+
+    def checkValidationCacheColumns(self):
+        sql = "SELECT count(*) FROM information_schema.columns WHERE table_schema = 'validation' AND table_name = 'process_history' AND column_name = 'fingerprint'"
+        return sql
+
+    def createValidationCacheColumns(self):
+        sql = """ALTER TABLE validation.process_history ADD COLUMN fingerprint text#
+        ALTER TABLE validation.process_history ADD COLUMN flag_count integer"""
+        return sql
+
+    def setValidationFingerprintQuery(self, processName, fingerprint, flagCount):
+        """
+        Sets the fingerprint (input data and parameters) and the number of flags of the last history entry of a process
+        """
+        sql = """UPDATE validation.process_history SET fingerprint = '{1}', flag_count = {2} WHERE id = (SELECT max(id) FROM validation.process_history WHERE process_name = '{0}')""".format(processName, fingerprint, flagCount)
+        return sql
+
+    def getValidationCacheQuery(self, processName):
+        sql = """SELECT status, fingerprint, flag_count FROM validation.process_history WHERE process_name = '{0}' ORDER BY id DESC LIMIT 1""".format(processName)
+        return sql
+
+    def getTableFingerprint(self, tableSchema, tableName, keyColumn):
+        """
+        Gets the row count, the max id and the sum of the hashes of the row versions (xmin changes on every insert and update)
+        """
+        sql = """SELECT count(*), coalesce(max("{2}")::text, ''), coalesce(sum(hashtext(xmin::text)::bigint), 0)::text FROM "{0}"."{1}" """.format(tableSchema, tableName, keyColumn)
+        return sql
+
+    def getNumberOfFlagsByProcess(self, processName):
+        sql = """SELECT count(*) FROM validation.aux_flags_validacao WHERE process_name = '{0}'""".format(processName)
+        return sql
+
     def insertFlagIntoDb(self, layer, feat_id, reason, geom, srid, processName, dimension, geometryColumn, flagSRID):
         if dimension == 0:
             tableName = 'aux_flags_validacao_p'
@@ -442,7 +507,74 @@ class PostGISSqlGenerator(SqlGenerator):
         sql = u"""INSERT INTO validation.{0} (process_name, layer, feat_id, reason, geom, dimension, geometry_column) values 
         ('{1}','{2}',{3},'{4}',ST_Transform(ST_SetSRID(ST_Multi('{5}'),{6}),{7}), {8}, '{9}');""".format(tableName, processName, layer, str(feat_id), reason, geom, srid, flagSRID, dimension, geometryColumn)
         return sql
-    
+
+    def getFlagTableDict(self):
+        return {0:'aux_flags_validacao_p', 1:'aux_flags_validacao_l', 2:'aux_flags_validacao_a'}
+
+    def createFlagStagingTable(self):
+        sql = """
+        CREATE TEMP TABLE flag_staging (
+            layer varchar(200),
+            feat_id bigint,
+            reason text,
+            geom geometry,
+            srid integer,
+            geometry_column varchar(200)
+        ) ON COMMIT DROP"""
+        return sql
+
+    def copyFlagsIntoStagingTable(self):
+        sql = """COPY flag_staging (layer, feat_id, reason, geom, srid, geometry_column) FROM STDIN"""
+        return sql
+
+    def insertFlagsFromSource(self, source, processName, flagSRID, dimension):
+        sql = u"""INSERT INTO validation.{0} (process_name, layer, feat_id, reason, geom, dimension, geometry_column)
+        SELECT '{1}', src.layer, src.feat_id, src.reason, ST_Transform(ST_SetSRID(ST_Multi(src.geom), src.srid), {2}), {3}, src.geometry_column
+        FROM {4} as src WHERE ST_Dimension(src.geom) = {3}""".format(self.getFlagTableDict()[dimension], processName, flagSRID, dimension, source)
+        return sql
+
+    def insertFlagsFromStagingTable(self, processName, flagSRID):
+        sqlList = [self.insertFlagsFromSource('flag_staging', processName, flagSRID, dimension) for dimension in sorted(self.getFlagTableDict().keys())]
+        return '#'.join(sqlList)
+
+    def getFlagBatchCte(self, flagRowList):
+        """
+        Builds the flags CTE of a batch of flags.
+        flagRowList: list of (layer, feat_id, reason, geom, srid, geometryColumn)
+        """
+        valueList = []
+        for layer, feat_id, reason, geom, srid, geometryColumn in flagRowList:
+            valueList.append(u"""('{0}',{1}::bigint,'{2}','{3}'::geometry,{4},'{5}')""".format(layer, str(feat_id), reason.replace("'", "''"), geom, srid, geometryColumn))
+        sql = u"""flags (layer, feat_id, reason, geom, srid, geometry_column) AS (VALUES {0})""".format(',\n'.join(valueList))
+        return sql
+
+    def insertFlagBatchIntoDb(self, flagRowList, processName, flagSRID):
+        """
+        Builds a single statement that inserts a batch of flags into the three flag tables
+        and returns the number of inserted flags.
+        flagRowList: list of (layer, feat_id, reason, geom, srid, geometryColumn)
+        """
+        dimensions = sorted(self.getFlagTableDict().keys())
+        cteList = [self.getFlagBatchCte(flagRowList)]
+        for dimension in dimensions:
+            cteList.append(u"""flags_{0} AS ({1} RETURNING 1)""".format(dimension, self.insertFlagsFromSource('flags', processName, flagSRID, dimension)))
+        sql = u"""WITH {0}
+        SELECT {1}""".format(',\n'.join(cteList), ' + '.join([u"""(SELECT count(*) FROM flags_{0})""".format(dimension) for dimension in dimensions]))
+        return sql
+
+    def getFlagsWithoutDimension(self, source):
+        """
+        Gets (layer, feat_id) of the flags of source whose geometry dimension has no flag table (e.g. null geometries)
+        """
+        dimensions = sorted(self.getFlagTableDict().keys())
+        sql = u"""SELECT layer, feat_id FROM {0} WHERE coalesce(ST_Dimension(geom), -1) NOT IN ({1})""".format(source, ','.join(map(str, dimensions)))
+        return sql
+
+    def getFlagBatchWithoutDimension(self, flagRowList):
+        sql = u"""WITH {0}
+        {1}""".format(self.getFlagBatchCte(flagRowList), self.getFlagsWithoutDimension('flags'))
+        return sql
+
     def getRunningProc(self):
         sql = "SELECT process_name, status FROM validation.process_history ORDER BY finished DESC LIMIT 1;"
         return sql
@@ -491,51 +623,60 @@ class PostGISSqlGenerator(SqlGenerator):
         if class_a!=class_b:
             sameClassRestriction=''
         else:
-            sameClassRestriction=' WHERE a.{0} <> b.{1} '.format(aKeyColumn, bKeyColumn)
-                    
+            sameClassRestriction=' AND a.{0} <> b.{1} '.format(aKeyColumn, bKeyColumn)
+
+        # neighbour filter: the && prefilter lets the gist indexes prune the pairs of every predicate that implies bbox intersection
+        if predicate_function == 'ST_Disjoint':
+            # pairs that are not disjoint are the intersecting ones
+            neighbourFilter = 'a.{0} && b.{1} AND ST_Intersects(a.{0}, b.{1})'
+        elif predicate_function in ['ST_Equals', 'ST_Intersects', 'ST_Touches', 'ST_Crosses', 'ST_Within', 'ST_Overlaps', 'ST_Contains', 'ST_Covers', 'ST_CoveredBy']:
+            neighbourFilter = 'a.{0} && b.{1} AND {2}(a.{0}, b.{1})'
+        else:
+            neighbourFilter = '{2}(a.{0}, b.{1})'
+        neighbourFilter = neighbourFilter.format(aGeomColumn, bGeomColumn, predicate_function) + sameClassRestriction
+        # features of class_a are only evaluated when class_b has some other feature to be compared with
+        hasCandidates = """EXISTS (SELECT 1 FROM {0} as b WHERE true {1})""".format(class_b, sameClassRestriction)
+
         if predicate_function == 'ST_Disjoint':
             if necessity == '\'f\'':
-                sql = """SELECT DISTINCT foo.id, foo.geom FROM
-                (SELECT a.{4} id, SUM(CASE WHEN {0}(a.{6},b.{7}) = 'f' THEN 1 ELSE 0 END) count, a.{6} geom 
-                    FROM {1} as a,{2} as b {3} GROUP BY a.{4}, a.{6}) as foo
-                WHERE foo.count > 0
-                """.format(predicate_function, class_a, class_b, sameClassRestriction, aKeyColumn, bKeyColumn, aGeomColumn, bGeomColumn)                
+                sql = """SELECT a.{2} id, a.{3} geom FROM {0} as a
+                WHERE EXISTS (SELECT 1 FROM {1} as b WHERE {4})
+                """.format(class_a, class_b, aKeyColumn, aGeomColumn, neighbourFilter)
             elif necessity == '\'t\'':
-                sql = """SELECT DISTINCT foo.id, foo.geom FROM
-                (SELECT a.{4} id, SUM(CASE WHEN {0}(a.{6},b.{7}) = 'f' THEN 1 ELSE 0 END) count, a.{6} geom 
-                    FROM {1} as a,{2} as b {3} GROUP BY a.{4}, a.{6}) as foo
-                WHERE foo.count = 0
-                """.format(predicate_function, class_a, class_b, sameClassRestriction, aKeyColumn, bKeyColumn, aGeomColumn, bGeomColumn)
+                sql = """SELECT a.{2} id, a.{3} geom FROM {0} as a
+                WHERE {5} AND NOT EXISTS (SELECT 1 FROM {1} as b WHERE {4})
+                """.format(class_a, class_b, aKeyColumn, aGeomColumn, neighbourFilter, hasCandidates)
         else:
             if necessity == '\'f\'':# must (be)
-                if max_card == '*':
-                    sql = """SELECT DISTINCT foo.id, foo.geom FROM
-                    (SELECT a.{4} id, SUM(CASE WHEN {0}(a.{6},b.{7}) THEN 1 ELSE 0 END) count, a.{6} geom 
-                        FROM {1} as a,{2} as b {3} GROUP BY a.{4}, a.{6}) as foo
-                    WHERE foo.count < {8}
-                    """.format(predicate_function, class_a, class_b, sameClassRestriction, aKeyColumn, bKeyColumn, aGeomColumn, bGeomColumn, min_card)
-                elif min_card is None and max_card is None:
-                    sql = """SELECT DISTINCT foo.id, foo.geom FROM
-                    (SELECT a.{4} id, SUM(CASE WHEN {0}(a.{6},b.{7}) THEN 1 ELSE 0 END) count, a.{6} geom 
-                        FROM {1} as a,{2} as b {3} GROUP BY a.{4}, a.{6}) as foo
-                    WHERE foo.count != 0;
-                    """.format(predicate_function, class_a, class_b, sameClassRestriction, aKeyColumn, bKeyColumn, aGeomColumn, bGeomColumn, min_card)
+                if min_card is None and max_card is None:
+                    sql = """SELECT a.{2} id, a.{3} geom FROM {0} as a
+                    WHERE EXISTS (SELECT 1 FROM {1} as b WHERE {4})
+                    """.format(class_a, class_b, aKeyColumn, aGeomColumn, neighbourFilter)
                 else:
-                    sql = """SELECT DISTINCT foo.id, foo.geom FROM
-                    (SELECT a.{4} id, SUM(CASE WHEN {0}(a.{6},b.{7}) THEN 1 ELSE 0 END) count, a.{6} geom 
-                        FROM {1} as a,{2} as b {3} GROUP BY a.{4}, a.{6}) as foo
-                    WHERE foo.count < {8} OR foo.count > {9}
-                    """.format(predicate_function, class_a, class_b, sameClassRestriction, aKeyColumn, bKeyColumn, aGeomColumn, bGeomColumn, min_card, max_card)
+                    # neighbours are only counted up to the first one that decides the rule
+                    if max_card == '*':
+                        limit = int(min_card)
+                        cardinalityFilter = 'foo.count < {0}'.format(min_card)
+                    else:
+                        limit = int(max_card) + 1
+                        cardinalityFilter = 'foo.count < {0} OR foo.count > {1}'.format(min_card, max_card)
+                    sql = """SELECT a.{2} id, a.{3} geom FROM {0} as a
+                    CROSS JOIN LATERAL (SELECT count(*) count FROM (SELECT 1 FROM {1} as b WHERE {4} LIMIT {6}) as neighbours) as foo
+                    WHERE {5} AND ({7})
+                    """.format(class_a, class_b, aKeyColumn, aGeomColumn, neighbourFilter, hasCandidates, limit, cardinalityFilter)
             elif necessity == '\'t\'':# must not (be)
-                if class_a!=class_b:
-                    sameClassRestriction=''
-                else:
-                    sameClassRestriction=' AND a.{0} <> b.{1} '.format(aKeyColumn, bKeyColumn)
-                    
-                sql = """SELECT DISTINCT a.{5} id, (ST_Dump(ST_Intersection(a.{7}, b.{8}))).geom as geom
-                FROM {0} as a, {1} as b 
-                    WHERE {2}(a.{7},b.{8}) = {3} {4}
-                """.format(class_a, class_b, predicate_function, necessity, sameClassRestriction, aKeyColumn, bKeyColumn, aGeomColumn, bGeomColumn)
+                sql = """SELECT DISTINCT a.{2} id, (ST_Dump(ST_Intersection(a.{3}, b.{4}))).geom as geom
+                FROM {0} as a JOIN {1} as b ON {5}
+                """.format(class_a, class_b, aKeyColumn, aGeomColumn, bGeomColumn, neighbourFilter)
+        return sql
+
+    def explainQuery(self, sql):
+        sql = """EXPLAIN (FORMAT JSON) {0}""".format(sql)
+        return sql
+
+    def analyzeTables(self, tableList):
+        tableList = ['"'+'"."'.join(table.replace('"','').split('.'))+'"' for table in tableList]
+        sql = '#'.join(["""ANALYZE {0}""".format(table) for table in tableList])
         return sql
     
     def getDimension(self, geom):
@@ -745,6 +886,25 @@ class PostGISSqlGenerator(SqlGenerator):
             sqls.append(sql)
         return sqls
     
+    def createGeometryStagingTable(self):
+        sql = """DROP TABLE IF EXISTS geometry_staging#
+        CREATE TEMP TABLE geometry_staging (id bigint NOT NULL, geom geometry NOT NULL)"""
+        return sql
+
+    def insertIntoGeometryStagingTable(self, rowList):
+        valueList = ["""({0},'{1}'::geometry)""".format(featId, wkb) for featId, wkb in rowList]
+        sql = """INSERT INTO geometry_staging (id, geom) VALUES {0}""".format(','.join(valueList))
+        return sql
+
+    def updateOriginalTableFromStaging(self, tableSchema, tableName):
+        sql = """ANALYZE geometry_staging#
+        UPDATE "{0}"."{1}" as t SET geom = ST_Multi(u.geom)
+        FROM (SELECT id, ST_Union(ST_Multi(geom)) as geom FROM geometry_staging GROUP BY id) as u
+        WHERE t.id = u.id#
+        DELETE FROM "{0}"."{1}" as t WHERE NOT EXISTS (SELECT 1 FROM geometry_staging as s WHERE s.id = t.id)#
+        DROP TABLE geometry_staging""".format(tableSchema, tableName)
+        return sql
+
     def getOrphanTableElementCount(self, orphan):
         orphan = '"'+'"."'.join(orphan.replace('"','').split('.'))+'"'
         sql = "select id from %s limit 1" % orphan
@@ -900,6 +1060,20 @@ class PostGISSqlGenerator(SqlGenerator):
         '''.format(schema,tableName)
         return sql
     
+    def createTempTableFromTable(self, tableSchema, tableName, tempTableName, geomColumnName, extent = None):
+        """
+        extent: (xmin, ymin, xmax, ymax, srid) that the copied features must intersect. None copies every feature.
+        """
+        whereClause = '''"{0}" is not null'''.format(geomColumnName)
+        if extent:
+            whereClause += ''' and "{0}" && ST_MakeEnvelope({1!r}, {2!r}, {3!r}, {4!r}, {5})'''.format(geomColumnName, *extent)
+        sql = '''
+        DROP TABLE IF EXISTS "{0}"."{2}"#
+        CREATE TABLE "{0}"."{2}" as (select * from "{0}"."{1}" where {4})#
+        create index "{2}_gist" on "{0}"."{2}" using gist ("{3}")
+        '''.format(tableSchema, tableName, tempTableName, geomColumnName, whereClause)
+        return sql
+
     def dropTempTable(self, tableName):
         tableName = '"'+'"."'.join(tableName.replace('"','').split('.'))+'"'
         sql = '''DROP TABLE IF EXISTS {0}'''.format(tableName)
@@ -912,6 +1086,12 @@ class PostGISSqlGenerator(SqlGenerator):
         sql = """INSERT INTO {0}_temp"({1}) VALUES ({2})""".format(tableName, columnTupleString, valueTuppleString)
         return sql
     
+    def copyIntoTempTable(self, tableName, attributes):
+        tableName = '"'+'"."'.join(tableName.split('.'))
+        columnTupleString = '"'+'","'.join(map(str,attributes))+'"'
+        sql = """COPY {0}_temp"({1}) FROM STDIN""".format(tableName, columnTupleString)
+        return sql
+
     def createSpatialIndex(self, tableName, geomColumnName='geom'):
         tableName = '"'+'"."'.join(tableName.replace('"','').split('.'))
         sql = 'create index "{0}_temp_gist" on {1}_temp" using gist ({2})'.format(tableName.split('.')[-1].replace('"',''), tableName, geomColumnName)
@@ -1070,6 +1250,11 @@ class PostGISSqlGenerator(SqlGenerator):
         sql = """select row_to_json(a) from (select * from {0}) as a""".format(domainTable)
         return sql
 
+    def getDomainCodeDictList(self, domainTableList):
+        sqlList = ["""select '{0}' as domain_table, row_to_json(a) from (select * from {0}) as a""".format(domainTable) for domainTable in domainTableList]
+        sql = ' union all '.join(sqlList)
+        return sql
+
     def getGeomStructDict(self):
         sql = """select row_to_json(a) from (
                     select table_name, array_agg(row_to_json(row(column_name::text, is_nullable))) from information_schema.columns where 
@@ -1469,6 +1654,32 @@ class PostGISSqlGenerator(SqlGenerator):
         sql = '''INSERT INTO public.{0} ({1}, dboid) VALUES ('{2}',{3})'''.format(tableName, idName, recDict['id'], dbOid)
         return sql
     
+    def getCatalogFingerprint(self):
+        """
+        Gets the count and the hash of the (oid, xmin) of the relations, constraints and inheritances of every user schema,
+        and the count and the hash of the row versions of each domain table. Dropped objects change the count and the hash.
+        The system schemas, the validation schema and the _temp tables of the validation processes are ignored.
+        """
+        sql = """with rel as (
+                    select c.oid, c.xmin from pg_catalog.pg_class c join pg_catalog.pg_namespace n on n.oid = c.relnamespace
+                    where n.nspname not like 'pg\\_%' and n.nspname not in ('information_schema', 'validation') and c.relkind in ('r', 'v', 'm', 'f')
+                    and c.relname not like '%\\_temp'
+                ), con as (
+                    select oid, xmin from pg_catalog.pg_constraint where conrelid in (select oid from rel)
+                ), inh as (
+                    select inhrelid, inhparent, xmin from pg_catalog.pg_inherits where inhrelid in (select oid from rel)
+                ), dom as (
+                    select (xpath('/row/h/text()', query_to_xml(format('select count(*) || ''_'' || coalesce(sum(hashtext(xmin::text)::bigint), 0) as h from %I.%I', table_schema, table_name), false, true, '')))[1]::text as h, table_name
+                    from information_schema.tables where table_schema = 'dominios' and table_type = 'BASE TABLE'
+                )
+                select md5(concat_ws('_',
+                    (select count(*) || '_' || coalesce(sum(hashtext(oid::text || ':' || xmin::text)::bigint), 0) from rel),
+                    (select count(*) || '_' || coalesce(sum(hashtext(oid::text || ':' || xmin::text)::bigint), 0) from con),
+                    (select count(*) || '_' || coalesce(sum(hashtext(inhrelid::text || ':' || inhparent::text || ':' || xmin::text)::bigint), 0) from inh),
+                    (select string_agg(table_name || ':' || h, '_' order by table_name) from dom)
+                ))"""
+        return sql
+
     def getDbOID(self, dbName):
         sql = '''SELECT oid from pg_database where datname = '{0}' '''.format(dbName)
         return sql
@@ -1854,3 +2065,177 @@ class PostGISSqlGenerator(SqlGenerator):
         :param tableName: (str) target table name. 
         """
         return "SELECT * FROM INFORMATION_SCHEMA.TABLES WHERE table_schema = '{0}' AND table_name = '{1}';".format(schemaName, tableName)
+
+    def createDirtyFeatureStructure(self):
+        """
+        Creates the change table (filled by triggers) and the checkpoint table used by incremental validation.
+        Only the key and the bounding box of the old and new geometries of each change are stored.
+        """
+        sql = """CREATE SCHEMA IF NOT EXISTS validation#
+        CREATE TABLE IF NOT EXISTS validation.dirty_feature (
+            id bigserial NOT NULL,
+            table_schema varchar(200) NOT NULL,
+            table_name varchar(200) NOT NULL,
+            feat_id bigint,
+            bbox geometry,
+            changed_at timestamp NOT NULL DEFAULT now(),
+            CONSTRAINT dirty_feature_pk PRIMARY KEY (id)
+        )#
+        CREATE INDEX IF NOT EXISTS dirty_feature_table_idx ON validation.dirty_feature (table_schema, table_name, id)#
+        CREATE TABLE IF NOT EXISTS validation.dirty_feature_checkpoint (
+            process_name varchar(200) NOT NULL,
+            table_schema varchar(200) NOT NULL,
+            table_name varchar(200) NOT NULL,
+            last_change_id bigint NOT NULL,
+            CONSTRAINT dirty_feature_checkpoint_pk PRIMARY KEY (process_name, table_schema, table_name)
+        )#
+        CREATE OR REPLACE FUNCTION validation.register_dirty_feature() RETURNS trigger AS $body$
+        DECLARE
+            featId bigint;
+            featBbox geometry;
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                EXECUTE format('SELECT ($1).%I, ST_Envelope(($1).%I)', TG_ARGV[0], TG_ARGV[1]) INTO featId, featBbox USING OLD;
+                INSERT INTO validation.dirty_feature (table_schema, table_name, feat_id, bbox) VALUES (TG_TABLE_SCHEMA, TG_TABLE_NAME, featId, featBbox);
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                EXECUTE format('SELECT ($1).%I, ST_Envelope(($1).%I)', TG_ARGV[0], TG_ARGV[1]) INTO featId, featBbox USING NEW;
+                INSERT INTO validation.dirty_feature (table_schema, table_name, feat_id, bbox) VALUES (TG_TABLE_SCHEMA, TG_TABLE_NAME, featId, featBbox);
+            END IF;
+            RETURN NULL;
+        END;
+        $body$ LANGUAGE plpgsql"""
+        return sql
+
+    def createDirtyFeatureTrigger(self, tableSchema, tableName, keyColumn, geometryColumn):
+        sql = """DROP TRIGGER IF EXISTS dsgtools_dirty_feature ON "{0}"."{1}"#
+        CREATE TRIGGER dsgtools_dirty_feature AFTER INSERT OR UPDATE OR DELETE ON "{0}"."{1}"
+        FOR EACH ROW EXECUTE PROCEDURE validation.register_dirty_feature('{2}', '{3}')""".format(tableSchema, tableName, keyColumn, geometryColumn)
+        return sql
+
+    def hasDirtyFeatureTrigger(self, tableSchema, tableName):
+        sql = """SELECT EXISTS (SELECT 1 FROM information_schema.tables WHERE table_schema = 'validation' AND table_name = 'dirty_feature') 
+        AND EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'dsgtools_dirty_feature' AND tgrelid = '"{0}"."{1}"'::regclass)""".format(tableSchema, tableName)
+        return sql
+
+    def getDirtyFeatureLastChangeId(self, tableSchema, tableName):
+        # checkpoints are kept when the changes they cover are pruned
+        sql = """SELECT greatest(
+            (SELECT coalesce(max(id), 0) FROM validation.dirty_feature WHERE table_schema = '{0}' AND table_name = '{1}'),
+            (SELECT coalesce(max(last_change_id), 0) FROM validation.dirty_feature_checkpoint WHERE table_schema = '{0}' AND table_name = '{1}')
+        )""".format(tableSchema, tableName)
+        return sql
+
+    def getDirtyFeatureIds(self, tableSchema, tableName, keyColumn, geometryColumn, processName, lastChangeId, radius, srid, wkbList = []):
+        """
+        Gets (id, replaced) rows. Replaced features are the ones changed since the checkpoint of processName (up to lastChangeId)
+        plus the features within radius of the bounding boxes of their old and new geometries. The remaining rows are the neighbours of the
+        replaced features, needed as context. wkbList (hex WKB) adds geometries that are not in the change table yet.
+        """
+        extraGeomSql = ''
+        if len(wkbList) > 0:
+            extraGeomSql = """UNION ALL
+                SELECT NULL::bigint AS feat_id, ST_SetSRID(ST_GeomFromWKB(decode(wkb, 'hex')), {0}) AS bbox
+                FROM unnest(ARRAY[{1}]) AS wkb""".format(srid, ','.join(["'{0}'".format(wkb) for wkb in wkbList]))
+        sql = """WITH dirty AS (
+            SELECT feat_id, bbox FROM validation.dirty_feature
+            WHERE table_schema = '{0}' AND table_name = '{1}' AND id <= {5}
+            AND id > coalesce((SELECT last_change_id FROM validation.dirty_feature_checkpoint 
+                WHERE process_name = '{4}' AND table_schema = '{0}' AND table_name = '{1}'), 0)
+            {7}
+        ), replaced AS (
+            SELECT feat_id AS id FROM dirty WHERE feat_id IS NOT NULL
+            UNION
+            SELECT t."{2}" FROM "{0}"."{1}" AS t JOIN dirty ON dirty.bbox IS NOT NULL AND ST_DWithin(t."{3}", dirty.bbox, {6})
+        )
+        SELECT id, TRUE FROM replaced
+        UNION
+        SELECT t."{2}", FALSE FROM "{0}"."{1}" AS t JOIN "{0}"."{1}" AS n ON ST_DWithin(t."{3}", n."{3}", {6})
+        WHERE n."{2}" IN (SELECT id FROM replaced) AND t."{2}" NOT IN (SELECT id FROM replaced)""".format(tableSchema, tableName, keyColumn, geometryColumn, processName, lastChangeId, radius, extraGeomSql)
+        return sql
+
+    def getDirtyFeatureCheckpoint(self, processName, tableSchema, tableName):
+        sql = """SELECT last_change_id FROM validation.dirty_feature_checkpoint WHERE process_name = '{0}' AND table_schema = '{1}' AND table_name = '{2}'""".format(processName, tableSchema, tableName)
+        return sql
+
+    def setDirtyFeatureCheckpoint(self, processName, tableSchema, tableName, lastChangeId):
+        """
+        Stores the checkpoint and prunes the changes already read by every process with a checkpoint on the table
+        """
+        sql = """DELETE FROM validation.dirty_feature_checkpoint WHERE process_name = '{0}' AND table_schema = '{1}' AND table_name = '{2}'#
+        INSERT INTO validation.dirty_feature_checkpoint (process_name, table_schema, table_name, last_change_id) VALUES ('{0}', '{1}', '{2}', {3})#
+        DELETE FROM validation.dirty_feature WHERE table_schema = '{1}' AND table_name = '{2}' 
+        AND id <= (SELECT min(last_change_id) FROM validation.dirty_feature_checkpoint WHERE table_schema = '{1}' AND table_name = '{2}')""".format(processName, tableSchema, tableName, lastChangeId)
+        return sql
+
+    def deleteFeatureFlags(self, processName, className, idList):
+        sql = """DELETE FROM validation.aux_flags_validacao WHERE process_name = '{0}' AND layer = '{1}' AND feat_id IN ({2})""".format(processName, className, ','.join(map(str, idList)))
+        return sql
+
+    def getFrameGeometries(self, frameTable, geometryColumn = 'geom'):
+        tableSchema, tableName = frameTable.split('.')
+        sql = """SELECT encode(ST_AsBinary(ST_Force2D("{2}")), 'hex') FROM "{0}"."{1}" WHERE "{2}" IS NOT NULL""".format(tableSchema, tableName, geometryColumn)
+        return sql
+
+    def getMultiTableExtent(self, tableTupleList):
+        """
+        tableTupleList: list of (tableSchema, tableName, geometryColumn)
+        """
+        extentList = ['SELECT ST_Extent("{2}")::geometry AS extent FROM "{0}"."{1}"'.format(tableSchema, tableName, geometryColumn) for tableSchema, tableName, geometryColumn in tableTupleList]
+        sql = """SELECT ST_XMin(extent), ST_YMin(extent), ST_XMax(extent), ST_YMax(extent) FROM (SELECT ST_Extent(extent) AS extent FROM ({0}) AS a) AS b""".format(' UNION ALL '.join(extentList))
+        return sql
+
+    def getPseudoRandomExpression(self, valueExpression, seed):
+        """
+        Reproducible pseudo random number in [0, 1) computed from valueExpression (unlike random(), it does not depend on the plan)
+        """
+        hashSql = 'abs(sin(({0}) * 12.9898 + {1} * 78.233)) * 43758.5453'.format(valueExpression, seed)
+        return '({0} - floor({0}))'.format(hashSql)
+
+    def insertSyntheticCoverage(self, tableSchema, tableName, geometryColumn, keyColumn, srid, count, cellSize, xOrigin, yOrigin, seed, gapRate, overlapRate, invalidRate, duplicateRate):
+        """
+        Inserts count grid cells (squares of side cellSize). Shrunk cells plant gaps, enlarged cells plant overlaps and
+        bow ties plant invalid geometries. A fraction (duplicateRate) of the cells is inserted again as duplicates.
+        """
+        columns = int(math.ceil(math.sqrt(count)))
+        delta = cellSize * 0.05
+        sql = """INSERT INTO "{0}"."{1}" ("{2}")
+        SELECT ST_Multi(CASE WHEN r < {11} THEN ST_SetSRID(ST_MakePolygon(ST_MakeLine(ARRAY[ST_MakePoint(x, y), ST_MakePoint(x + {5}, y + {5}), ST_MakePoint(x + {5}, y), ST_MakePoint(x, y + {5}), ST_MakePoint(x, y)])), {4})
+            ELSE ST_MakeEnvelope(x - d, y - d, x + {5} + d, y + {5} + d, {4}) END)
+        FROM (
+            SELECT {7} + (i % {6}) * {5} AS x, {8} + (i / {6}) * {5} AS y, r,
+            CASE WHEN r < {11} + {9} THEN -{12} WHEN r < {11} + {9} + {10} THEN {12} ELSE 0 END AS d
+            FROM (SELECT i, {13} AS r FROM generate_series(0, {14} - 1) AS i) AS a
+        ) AS b#
+        INSERT INTO "{0}"."{1}" ("{2}") SELECT "{2}" FROM "{0}"."{1}" WHERE {15} < {16}""".format(tableSchema, tableName, geometryColumn, keyColumn, srid, cellSize, columns, xOrigin, yOrigin,
+                                                                                                   gapRate, overlapRate, invalidRate, delta, self.getPseudoRandomExpression('i', seed), count,
+                                                                                                   self.getPseudoRandomExpression('"{0}"'.format(keyColumn), seed + 1), duplicateRate)
+        return sql
+
+    def insertSyntheticNetwork(self, tableSchema, tableName, geometryColumn, keyColumn, srid, count, cellSize, xOrigin, yOrigin, seed, dangleRate, duplicateRate):
+        """
+        Inserts count lines of a jittered grid network (each node is linked to its right and upper neighbours).
+        A fraction (dangleRate) of the lines is cut short to plant dangles and a fraction (duplicateRate) is inserted again as duplicates.
+        """
+        columns = int(math.ceil(math.sqrt(count / 2.0)))
+        node = lambda column, row : self.getSyntheticNodeExpression(column, row, cellSize, xOrigin, yOrigin, seed)
+        sql = """INSERT INTO "{0}"."{1}" ("{2}")
+        SELECT ST_Multi(CASE WHEN r < {7} THEN ST_LineSubstring(line, 0, 0.8) ELSE line END)
+        FROM (
+            SELECT ST_SetSRID(ST_MakeLine({4}, CASE WHEN i % 2 = 0 THEN {5} ELSE {6} END), {3}) AS line, r
+            FROM (SELECT i, (i / 2) % {8} AS c, (i / 2) / {8} AS rw, {9} AS r FROM generate_series(0, {10} - 1) AS i) AS a
+        ) AS b#
+        INSERT INTO "{0}"."{1}" ("{2}") SELECT "{2}" FROM "{0}"."{1}" WHERE {11} < {12}""".format(tableSchema, tableName, geometryColumn, srid, node('c', 'rw'), node('c + 1', 'rw'), node('c', 'rw + 1'),
+                                                                                                   dangleRate, columns, self.getPseudoRandomExpression('i', seed), count,
+                                                                                                   self.getPseudoRandomExpression('"{0}"'.format(keyColumn), seed + 1), duplicateRate)
+        return sql
+
+    def getSyntheticNodeExpression(self, column, row, cellSize, xOrigin, yOrigin, seed):
+        """
+        Point of the node (column, row) of a grid, moved by up to 15% of cellSize (the same node always gets the same point)
+        """
+        nodeId = '({0}) * 100003 + ({1})'.format(column, row)
+        jitter = cellSize * 0.3
+        sql = 'ST_MakePoint({0} + ({1}) * {2} + ({3} - 0.5) * {4}, {5} + ({6}) * {2} + ({7} - 0.5) * {4})'.format(xOrigin, column, cellSize, self.getPseudoRandomExpression(nodeId, seed + 2), jitter,
+                                                                                                            yOrigin, row, self.getPseudoRandomExpression(nodeId, seed + 3))
+        return sql
@@ -200,6 +200,11 @@ class SpatialiteSqlGenerator(SqlGenerator):
         layer = '_'.join([schema, table])
         return self.getElementCountFromLayer(layer)
     
+    def getLayersWithElementsQuery(self, tableList, useInheritance):
+        sqlList = ["""SELECT '{0}' as table_schema, '{1}' as table_name, EXISTS (SELECT 1 FROM {0}_{1} LIMIT 1) as has_elements""".format(schema, table) for schema, table in tableList]
+        sql = ' UNION ALL '.join(sqlList)
+        return sql
+
     def getFullTablesName(self, name):
         sql = "SELECT f_table_name as name FROM geometry_columns WHERE f_table_name LIKE '%{0}%' ORDER BY name".format(name)
         return sql
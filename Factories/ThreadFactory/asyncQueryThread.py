@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ DsgTools
+                                 A QGIS plugin
+ Brazilian Army Cartographic Production Tools
+                              -------------------
+        begin                : 2018-03-14
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Philipe Borba - Cartographic Engineer @ Brazilian Army
+        email                : borba@dsg.eb.mil.br
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import threading
+
+from PyQt4.QtCore import QObject, pyqtSignal
+
+from DsgTools.Factories.ThreadFactory.genericThread import GenericThread
+from DsgTools.Factories.DbFactory.connectionPool import ConnectionPool
+from DsgTools.Factories.DbFactory.queryLogger import InstrumentedQuery as QSqlQuery
+
+class QueryFuture(QObject):
+    """
+    Result of an asynchronous query. Results are delivered by the signals (queued to the thread
+    that created the future, usually the GUI thread) or by result(), which blocks until the query ends.
+    """
+    queryFinished = pyqtSignal(str, object)
+    queryFailed = pyqtSignal(str, str)
+
+    def __init__(self, id):
+        """
+        Constructor
+        id: id of the thread that runs the query
+        """
+        super(QueryFuture, self).__init__()
+        self.id = id
+        self.event = threading.Event()
+        self.rows = None
+        self.error = None
+
+    def setResult(self, rows):
+        self.rows = rows
+        self.event.set()
+        self.queryFinished.emit(self.id, rows)
+
+    def setError(self, error):
+        self.error = error
+        self.event.set()
+        self.queryFailed.emit(self.id, error)
+
+    def done(self):
+        return self.event.is_set()
+
+    def wait(self, timeout = None):
+        """
+        Waits at most timeout seconds for the query. Returns whether it ended.
+        """
+        return self.event.wait(timeout)
+
+    def result(self, timeout = None):
+        """
+        Waits for the query and returns its rows (list of tuples). Raises an Exception if the query failed.
+        timeout: seconds to wait. None waits forever.
+        """
+        if not self.event.wait(timeout):
+            raise Exception(self.tr('Query timed out'))
+        if self.error is not None:
+            raise Exception(self.error)
+        return self.rows
+
+class AsyncQueryThread(GenericThread):
+    def __init__(self, db, sql, useTransaction = True):
+        """
+        Constructor. Must be called by the thread that owns db.
+        db: QSqlDatabase whose parameters are used to get a pooled connection
+        sql: statements separated by # (rows of the last one are returned)
+        useTransaction: runs all statements in a single transaction
+        """
+        super(AsyncQueryThread, self).__init__()
+        self.connectionParameters = ConnectionPool.getConnectionParameters(db)
+        self.sqlList = sql.split('#')
+        self.useTransaction = useTransaction
+        self.future = QueryFuture(self.id)
+
+    def run(self):
+        self.runOn(None)
+
+    def runOn(self, connection):
+        """
+        Executes the statements in the current thread and sets the result of the future
+        connection: QSqlDatabase owned by the current thread. None uses a pooled connection of the current thread.
+        """
+        try:
+            if connection is None:
+                connection = ConnectionPool.getConnection(self.connectionParameters)
+            self.future.setResult(self.executeQuery(connection))
+        except Exception as e:
+            self.future.setError(':'.join([unicode(arg) for arg in e.args]))
+
+    def executeQuery(self, connection):
+        """
+        Executes the statements in connection and returns the rows of the last one
+        """
+        if self.useTransaction:
+            connection.transaction()
+        query = QSqlQuery(connection)
+        for inner in self.sqlList:
+            if not query.exec_(inner):
+                if self.useTransaction:
+                    connection.rollback()
+                raise Exception(self.tr('Problem executing query: ') + query.lastError().text())
+        rows = []
+        columnCount = query.record().count()
+        while query.next():
+            rows.append(tuple([query.value(i) for i in range(columnCount)]))
+        if self.useTransaction:
+            connection.commit()
+        return rows
+
+    def tr(self, message):
+        return self.future.tr(message)
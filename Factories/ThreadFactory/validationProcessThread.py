@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ DsgTools
+                                 A QGIS plugin
+ Brazilian Army Cartographic Production Tools
+                              -------------------
+        begin                : 2018-03-15
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Philipe Borba - Cartographic Engineer @ Brazilian Army
+        email                : borba@dsg.eb.mil.br
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import threading
+
+from PyQt4.QtSql import QSqlDatabase
+
+from qgis.core import QgsMessageLog
+
+from DsgTools.Factories.ThreadFactory.genericThread import GenericThread
+from DsgTools.Factories.DbFactory.dbFactory import DbFactory
+from DsgTools.Factories.DbFactory.connectionPool import ConnectionPool
+
+class ValidationProcessThread(GenericThread):
+    def __init__(self, process, runProcess):
+        """
+        Constructor. Must be called by the thread that owns the connection of process.abstractDb.
+        process: validation process (must be parallelSafe)
+        runProcess: callable that runs the process and returns its execute() code
+        """
+        super(ValidationProcessThread, self).__init__()
+        self.process = process
+        self.connectionParameters = ConnectionPool.getConnectionParameters(process.abstractDb.db)
+        self.runProcess = runProcess
+        self.ret = 0
+        self.finished = threading.Event()
+
+    def run(self):
+        """
+        Runs the process with a database object bound to a pooled connection of this thread
+        """
+        originalDb = self.process.abstractDb
+        workerDb = DbFactory().createDbFactory(originalDb.db.driverName())
+        try:
+            workerDb.db = ConnectionPool.getConnection(self.connectionParameters)
+            self.process.abstractDb = workerDb
+            self.ret = self.runProcess(self.process)
+        except Exception as e:
+            QgsMessageLog.logMessage(':'.join([unicode(arg) for arg in e.args]), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
+            self.ret = 0
+        finally:
+            self.process.abstractDb = originalDb
+            # the pooled connection belongs to the pool, it must not be closed with workerDb
+            workerDb.db = QSqlDatabase()
+            self.finished.set()
+            self.signals.processingFinished.emit(self.ret, self.process.processAlias, self.id)
@@ -22,7 +22,7 @@
  ***************************************************************************/
 """
 from qgis.core import QgsPoint, QgsGeometry, QgsFeature
-import string, os
+import string, os, math
 from PyQt4.QtCore import QObject
 
 class UtmGrid(QObject):
@@ -241,6 +241,23 @@ class UtmGrid(QObject):
         poly = self.makeQgsPolygon(x, y, x + dx, y + dy)
         return poly
     
+    def getGridCellList(self, xmin, ymin, xmax, ymax, scale):
+        """Gets the frame polygons of the given scale that cover the
+        given geographic extent. Sheets of every scale are aligned with
+        the 1:1.000.000 sheets, so no map index is needed
+        """
+        dx = self.getSpacingX(scale)
+        dy = self.getSpacingY(scale)
+        cellList = []
+        i = int(math.floor(xmin/dx))
+        while i*dx < xmax:
+            j = int(math.floor(ymin/dy))
+            while j*dy < ymax:
+                cellList.append(self.makeQgsPolygon(i*dx, j*dy, (i+1)*dx, (j+1)*dy))
+                j += 1
+            i += 1
+        return cellList
+
     def populateQgsLayer(self, iNomen, stopScale, layer):
         """Generic recursive method to create frame polygon for the given
         stopScale within the given map index (iNomen)
@@ -156,6 +156,7 @@ class GenericDbManager(QObject):
                 self.adminDb.updateRecordFromPropertyTable(settingType, settingName, edgvVersion, newJsonDict)
                 for abstractDb in rollbackList:
                     abstractDb.db.commit()
+                    abstractDb.invalidateMetadataCache()
                 self.adminDb.db.commit()
                 successList = [i for i in propertyDict[settingName]]
             except Exception as e:
@@ -285,6 +286,7 @@ class GenericDbManager(QObject):
                 dbOid = abstractDb.getDbOID()
                 self.adminDb.insertInstalledRecordIntoAdminDb(settingType, recDict, dbOid)
                 abstractDb.db.commit()
+                abstractDb.invalidateMetadataCache()
                 self.adminDb.db.commit()
             except Exception as e:
                 abstractDb.db.rollback()
@@ -323,6 +325,7 @@ class GenericDbManager(QObject):
                         abstractDb.removeRecordFromPropertyTable(settingType, configName, edgvVersion)
                         self.adminDb.removeRecordFromPropertyTable(settingType, configName, edgvVersion)
                         abstractDb.db.commit()
+                        abstractDb.invalidateMetadataCache()
                         self.adminDb.db.commit()
                         successList.append(dbName)
                     except Exception as e:
@@ -355,6 +358,7 @@ class GenericDbManager(QObject):
                     abstractDb.removeRecordFromPropertyTable(settingType, configName, edgvVersion)
                     self.adminDb.uninstallPropertyOnAdminDb(settingType, configName, edgvVersion, dbName = dbName)
                     abstractDb.db.commit()
+                    abstractDb.invalidateMetadataCache()
                     self.adminDb.db.commit()
                 except Exception as e:
                     abstractDb.db.rollback()
@@ -21,16 +21,19 @@
  ***************************************************************************/
 """
 from qgis.core import QgsMessageLog, QgsVectorLayer, QgsMapLayerRegistry, QgsGeometry, QgsVectorDataProvider, QgsFeatureRequest, QgsExpression, QgsFeature
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 import processing, binascii
 
 class CleanGeometriesProcess(ValidationProcess):
+    modifiesClasses = True
+    processAlias = QT_TRANSLATE_NOOP('CleanGeometriesProcess', 'Clean Geometries')
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Clean Geometries')
         
         if not self.instantiating:
             # getting tables with elements
@@ -22,7 +22,7 @@
 """
 from qgis.core import QgsMessageLog, QgsVectorLayer, QgsMapLayerRegistry, QgsGeometry, QgsField, QgsVectorDataProvider, QgsFeatureRequest, QgsExpression, QgsFeature, QgsSpatialIndex, QGis
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
-from PyQt4.QtCore import QVariant
+from PyQt4.QtCore import QVariant, QT_TRANSLATE_NOOP
 import processing, binascii
 import json
 
@@ -30,12 +30,14 @@ import json
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 
 class CloseEarthCoveragePolygonsProcess(ValidationProcess):
+    modifiesClasses = True
+    processAlias = QT_TRANSLATE_NOOP('CloseEarthCoveragePolygonsProcess', 'Close Earth Coverage Polygons')
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Close Earth Coverage Polygons')
         
     def preProcess(self):
         """
@@ -60,21 +62,46 @@ class CloseEarthCoveragePolygonsProcess(ValidationProcess):
         Gets flags candidates and filters those who are within other flags
         areaLayers: list of layers with possible flags
         """
-        
-        feats = [i for i in areaLyr.dataProvider().getFeatures(QgsFeatureRequest(QgsExpression('destid = -1000 or destid = -2000')))]
-        idx = QgsSpatialIndex()
+        areaDict = self.getAreasByDestId(areaLyr)
+        candidateList = areaDict[-1000] + areaDict[-2000]
+        idx, candidateDict = self.makeIndex(candidateList)
         updateDict = dict()
         destIdx = areaLyr.fieldNameIndex('destid')
-        for feat1 in feats:
-            for feat2 in feats:
-                if feat2['destid'] <> -1000:
-                    continue 
-                if feat1.id() <> feat2.id() and not feat1.geometry().equals(feat2.geometry()):
-                    combine = feat1.geometry().combine(feat2.geometry())
-                    if feat2.geometry().equals(combine):
-                        updateDict[feat2.id()] = {destIdx:None}
+        for feat2 in areaDict[-1000]:
+            geom2 = feat2.geometry()
+            bbox2 = geom2.boundingBox()
+            engine = self.getPreparedEngine(geom2)
+            for id in idx.intersects(bbox2):
+                geom1 = candidateDict[id].geometry()
+                if id == feat2.id() or not bbox2.contains(geom1.boundingBox()):
+                    continue
+                # feat2 contains another candidate, therefore it is not a flag
+                if engine.contains(geom1.geometry()) and not geom1.equals(geom2):
+                    updateDict[feat2.id()] = {destIdx:None}
+                    break
         areaLyr.dataProvider().changeAttributeValues(updateDict)
-        pass
+
+    def getAreasByDestId(self, areaLyr):
+        """
+        Reads the areas once and splits them by destid category:
+        -1000 (area without centroid), -2000 (area with conflicted centroid) and 0 (reclassified areas, destid >= 0)
+        """
+        areaDict = {-1000 : [], -2000 : [], 0 : []}
+        for feat in areaLyr.dataProvider().getFeatures():
+            destId = feat['destid']
+            if destId in (-1000, -2000):
+                areaDict[destId].append(feat)
+            elif destId is not None and destId >= 0:
+                areaDict[0].append(feat)
+        return areaDict
+
+    def getPreparedEngine(self, geom):
+        """
+        Gets a prepared geometry engine of geom, for repeated predicate tests. geom must be kept while the engine is used.
+        """
+        engine = QgsGeometry.createGeometryEngine(geom.geometry())
+        engine.prepareGeometry()
+        return engine
         
     def defineQueryLayer(self, delimiterList):
         """
@@ -131,39 +158,43 @@ class CloseEarthCoveragePolygonsProcess(ValidationProcess):
         """
         frame = self.loadLayerBeforeValidationProcess(self.frameLayer)
         frameFeat = frame.getFeatures().next()
+        areaDict = self.getAreasByDestId(areaLyr)
         
-        #getting all geometries
-        geoms = [i.geometryAndOwnership() for i in areaLyr.dataProvider().getFeatures(QgsFeatureRequest(QgsExpression('destid >= 0')))]
-        
-        #combining them
-        combined = geoms[0]
-        for geom in geoms:
-            combined = combined.combine(geom)
-        
-        #getting earth coverage hole
-        hole = frameFeat.geometry().difference(combined)
+        #combining all reclassified geometries at once
+        if len(areaDict[0]) > 0:
+            combined = QgsGeometry.unaryUnion([feat.geometry() for feat in areaDict[0]])
+            #getting earth coverage hole
+            hole = frameFeat.geometry().difference(combined)
+        else:
+            combined = None
+            hole = QgsGeometry(frameFeat.geometry())
         hole = hole.buffer(0.1, 5)
         
         #making the flags
         flagTupleList = []
-        areasWithConflictedCentroids = [i for i in areaLyr.dataProvider().getFeatures(QgsFeatureRequest(QgsExpression('destid = -2000')))]
-        for feat in areasWithConflictedCentroids:
-            if feat.geometry().within(hole):
+        holeEngine = self.getPreparedEngine(hole)
+        conflictedGeomList = []
+        for feat in areaDict[-2000]:
+            if holeEngine.contains(feat.geometry().geometry()):
                 #After detecting that feat is indeed a flag (area with conflicted centroids), combines it with the rest of earth coverage
-                combined = combined.combine(feat.geometry())
+                conflictedGeomList.append(feat.geometry())
                 flagTupleList.append((feat['cl'], -1, self.tr('Area with conflicted centroid.'), binascii.hexlify(feat.geometry().asWkb()), 'geom'))
+        if len(conflictedGeomList) > 0:
+            combined = QgsGeometry.unaryUnion(([combined] if combined else []) + conflictedGeomList)
         
         destIdx = areaLyr.fieldNameIndex('destid')
         notFlagDict = dict()
         
         #create a buffer to check which flags are within, if they are, these are not flags 
-        earthCoveragePolygonsAndAreasWithoutCentroid = combined.buffer(0.1,5)
-        for feat in areaLyr.dataProvider().getFeatures(QgsFeatureRequest(QgsExpression('destid = -1000'))):
-            if feat.geometry().within(earthCoveragePolygonsAndAreasWithoutCentroid):
-                notFlagDict[feat.id()] = {destIdx:None}
-        areaLyr.dataProvider().changeAttributeValues(notFlagDict)
-        areasWithoutCentroids = [i for i in areaLyr.dataProvider().getFeatures(QgsFeatureRequest(QgsExpression('destid = -1000')))]
-        for feat in areasWithoutCentroids:
+        if combined:
+            earthCoveragePolygonsAndAreasWithoutCentroid = combined.buffer(0.1,5)
+            coverageEngine = self.getPreparedEngine(earthCoveragePolygonsAndAreasWithoutCentroid)
+            for feat in areaDict[-1000]:
+                if coverageEngine.contains(feat.geometry().geometry()):
+                    notFlagDict[feat.id()] = {destIdx:None}
+            areaLyr.dataProvider().changeAttributeValues(notFlagDict)
+        for feat in areaDict[-1000]:
+            if feat.id() not in notFlagDict:
                 flagTupleList.append((feat['cl'], -1, self.tr('Area without centroid.'), binascii.hexlify(feat.geometry().asWkb()), 'geom'))
         #finishing the raise flags step
         if len(flagTupleList) > 0:
@@ -174,29 +205,35 @@ class CloseEarthCoveragePolygonsProcess(ValidationProcess):
             msg = self.tr('There are no area building errors.')
             self.setStatus(msg, 1)     
     
-    def relateAreasWithCentroids(self, cl, areaLyr, centroidLyr, relateDict, centroidIdx):
+    def relateAreasWithCentroids(self, cl, areaLyr, centroidDict, relateDict, centroidIdx):
         """
         Alters a input dict that relates each area with a centroid feature list. This list might be empty.
+        centroidDict: {id : centroid feature} (see makeIndex)
         """
         relateDict[cl] = dict()
         for areaFeat in areaLyr.dataProvider().getFeatures(QgsFeatureRequest(QgsExpression("cl = '%s'" % cl))):
             areaId = areaFeat.id()
             relateDict[cl][areaId] = []
-            bbox = areaFeat.geometry().boundingBox()
-            candidates = self.getCandidates(centroidIdx, bbox)
+            areaGeom = areaFeat.geometry()
+            candidates = self.getCandidates(centroidIdx, areaGeom.boundingBox())
+            if len(candidates) == 0:
+                continue
+            engine = self.getPreparedEngine(areaGeom)
             for candidate in candidates:
-                feat = [i for i in centroidLyr.dataProvider().getFeatures(QgsFeatureRequest(candidate))][0]
-                if feat.geometry().within(areaFeat.geometry()):
+                feat = centroidDict[candidate]
+                if engine.contains(feat.geometry().geometry()):
                     relateDict[cl][areaId].append(feat)
 
-    def makeIndex(self, centroidLyr):
+    def makeIndex(self, featureList):
         """
-        creates a spatial index for the centroid layer
+        creates a spatial index and a {id : feature} dict for a layer (e.g. the centroid layer) or a feature list
         """
-        centroidIdx = QgsSpatialIndex()
-        for feat in centroidLyr.getFeatures():
-            centroidIdx.insertFeature(feat)
-        return centroidIdx
+        idx = QgsSpatialIndex()
+        featureDict = dict()
+        for feat in (featureList.getFeatures() if isinstance(featureList, QgsVectorLayer) else featureList):
+            idx.insertFeature(feat)
+            featureDict[feat.id()] = feat
+        return idx, featureDict
 
     def getCandidates(self, idx, bbox):
         return idx.intersects(bbox)
@@ -207,15 +244,16 @@ class CloseEarthCoveragePolygonsProcess(ValidationProcess):
         area with conflicted centroid: destid = 0
         """
         destIdx = areaLyr.fieldNameIndex('destid')
+        changeDict = dict()
         for id in relateDict[cl].keys():
             numberOfCentroids = len(relateDict[cl][id])
             if numberOfCentroids == 1:
                 if relateDict[cl][id][0]['cl'] == cl:
                     # perfect case - must be reclassified
-                    areaLyr.dataProvider().changeAttributeValues({id : {destIdx:relateDict[cl][id][0]['featid']}})
+                    changeDict[id] = {destIdx:relateDict[cl][id][0]['featid']}
             elif numberOfCentroids == 0:
                 # area without centroid - this must become a flag
-                areaLyr.dataProvider().changeAttributeValues({id : {destIdx:-1000}})
+                changeDict[id] = {destIdx:-1000}
             else:
                 #first sweep: identify centroids with conflicted classes
                 conflictedCentroids = [feat for feat in relateDict[cl][id] if feat['cl'] <> cl]
@@ -224,9 +262,9 @@ class CloseEarthCoveragePolygonsProcess(ValidationProcess):
                 for conf in conflictedChildCentroids:
                     conflictedDict[conf] = 1
                 if len(conflictedCentroids) > 0:
-                    areaLyr.dataProvider().changeAttributeValues({id:{destIdx:-2000}})
+                    changeDict[id] = {destIdx:-2000}
                 elif len(conflictedDict.keys())>1:
-                    areaLyr.dataProvider().changeAttributeValues({id:{destIdx:-2000}})
+                    changeDict[id] = {destIdx:-2000}
                 else:
                     sameClassCentroids = relateDict[cl][id]
                     #get original centroid layer
@@ -255,27 +293,24 @@ class CloseEarthCoveragePolygonsProcess(ValidationProcess):
                                     break
                         break
                     if duplicated:
-                        areaLyr.dataProvider().changeAttributeValues({id : {destIdx:relateDict[cl][id][0]['featid']}})
+                        changeDict[id] = {destIdx:relateDict[cl][id][0]['featid']}
                     else:
-                        areaLyr.dataProvider().changeAttributeValues({id:{destIdx:-2000}})
+                        changeDict[id] = {destIdx:-2000}
+        areaLyr.dataProvider().changeAttributeValues(changeDict)
     
     def reclassifyAreasWithCentroids(self, coverageClassList, areaLyr, centroidLyr, relateDict):
         """
-        Reclassifies areas with centroids
+        Reclassifies areas with centroids. Areas are read once and grouped by class.
         """
-        lyrDict = dict()
+        reclassDict = {cl : dict() for cl in coverageClassList}
+        for feat in areaLyr.dataProvider().getFeatures():
+            if feat['cl'] in reclassDict and feat['destid'] > 0:
+                reclassDict[feat['cl']][feat['destid']] = feat.geometry()
         for cl in coverageClassList:
+            if len(reclassDict[cl]) == 0:
+                continue
             lyr = QgsVectorLayer(self.abstractDb.getURI(cl, False).uri(), cl, "postgres")
-            classFeats = [i for i in areaLyr.dataProvider().getFeatures(QgsFeatureRequest(QgsExpression("cl = '%s'" % cl)))]
-            reclassFeats = []
-            for i in classFeats:
-                if i['destid'] > 0:
-                    reclassFeats.append(i)
-            reclassDict = dict()
-            deleteList = []
-            for feat in reclassFeats:
-                reclassDict[feat['destid']]=feat.geometry()
-            lyr.dataProvider().changeGeometryValues(reclassDict)
+            lyr.dataProvider().changeGeometryValues(reclassDict[cl])
 
     def createAuxStruct(self, epsg):
         """
@@ -349,7 +384,7 @@ class CloseEarthCoveragePolygonsProcess(ValidationProcess):
             
             #building centroid index
             self.populateCentroidLyr(coverageClassList, centroidLyr)
-            centroidIdx = self.makeIndex(centroidLyr)
+            centroidIdx, centroidDict = self.makeIndex(centroidLyr)
             
             relateDict = dict()
             for cl in coverageClassList:
@@ -359,11 +394,12 @@ class CloseEarthCoveragePolygonsProcess(ValidationProcess):
                 lineLyr = self.defineQueryLayer(earthCoverageDict[cl])
                 #close areas from lines
                 self.runPolygonize(cl, areaLyr, lineLyr)
-                self.relateAreasWithCentroids(cl, areaLyr, centroidLyr, relateDict, centroidIdx)
+                self.relateAreasWithCentroids(cl, areaLyr, centroidDict, relateDict, centroidIdx)
                 # reclassifying areas
                 self.prepareReclassification(cl, areaLyr, centroidLyr, relateDict)
-                self.reclassifyAreasWithCentroids(coverageClassList, areaLyr, centroidLyr, relateDict)
                 localProgress.step()
+            # every class is reclassified at once
+            self.reclassifyAreasWithCentroids(coverageClassList, areaLyr, centroidLyr, relateDict)
             self.raiseFlags(areaLyr)     
             return 1
         except Exception as e:
@@ -22,11 +22,11 @@
 """
 
 from qgis.core import QgsMessageLog, QgsVectorLayer, QgsGeometry, QgsFeature, QgsWKBTypes, QgsRectangle, \
-                      QgsFeatureRequest, QgsDataSourceURI
-from PyQt4.QtGui import QMessageBox
+                      QgsFeatureRequest, QgsDataSourceURI, QgsSpatialIndex
 
 import processing, binascii
 from collections import OrderedDict
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.GeometricTools.DsgGeometryHandler import DsgGeometryHandler
 
@@ -35,7 +35,96 @@ class HidrographyFlowParameters(list):
         super(HidrographyFlowParameters, self).__init__()
         self.values = x
 
+class NodeClassificationContext(object):
+    """
+    Reference geometries of a node classification run (frame contours, water bodies, water sinks and network lines),
+    read once and kept in spatial indexes, so that each node is classified without new requests to the layers.
+    Prepared geometries are built on demand and reused by all nodes next to the same reference feature.
+    """
+    def __init__(self, frameLyrContourList=None, waterBodiesLayers=None, waterSinkLayer=None, networkLayer=None):
+        """
+        Class constructor. References that are not given are not cached (classification then requests their layers).
+        :param frameLyrContourList: (list-of-QgsGeometry) border lines of the frame layer.
+        :param waterBodiesLayers: (list-of-QgsVectorLayer) layers composing the water bodies on map.
+        :param waterSinkLayer: (QgsVectorLayer) water sink layer.
+        :param networkLayer: (QgsVectorLayer) network lines layer. It should not be given if lines are changed during
+                             classification, since cached geometries are not updated.
+        """
+        self.indexDict = dict()
+        self.engineDict = dict()
+        if frameLyrContourList is not None:
+            self.indexDict['frame'] = self.indexGeometries(frameLyrContourList)
+        if waterBodiesLayers is not None:
+            # point primitive layers are ignored: they neither intersect as water bodies nor contain lines
+            self.indexDict['waterBodies'] = self.indexGeometries(geom for lyr in waterBodiesLayers if lyr.geometryType() != 0 \
+                                                                       for geom in self.getLayerGeometries(lyr))
+        if waterSinkLayer:
+            self.indexDict['waterSink'] = self.indexGeometries(self.getLayerGeometries(waterSinkLayer))
+        if networkLayer is not None:
+            self.indexDict['network'] = self.indexGeometries(self.getLayerGeometries(networkLayer))
+
+    def getLayerGeometries(self, layer):
+        """
+        Yields the geometries of all features of a layer.
+        :param layer: (QgsVectorLayer) layer to be read.
+        """
+        for feat in layer.getFeatures(QgsFeatureRequest().setSubsetOfAttributes([])):
+            geom = feat.geometry()
+            if geom:
+                yield QgsGeometry(geom)
+
+    def indexGeometries(self, geometryList):
+        """
+        Builds a spatial index of a list of geometries.
+        :param geometryList: (iterable-of-QgsGeometry) geometries to be indexed.
+        :return: (tuple) spatial index and its dict of geometries ( { (int)id : (QgsGeometry)geom } ).
+        """
+        idx = QgsSpatialIndex()
+        geomDict = dict()
+        for i, geom in enumerate(geometryList):
+            feat = QgsFeature(i)
+            feat.setGeometry(geom)
+            idx.insertFeature(feat)
+            geomDict[i] = geom
+        return idx, geomDict
+
+    def hasReference(self, name):
+        """
+        :param name: (str) reference name ('frame', 'waterBodies', 'waterSink' or 'network').
+        :return: (bool) whether reference geometries are cached.
+        """
+        return name in self.indexDict
+
+    def getCandidates(self, name, bbRect):
+        """
+        Gets the ids of cached reference geometries whose bounding boxes intersect a rectangle.
+        :param name: (str) reference name.
+        :param bbRect: (QgsRectangle) search rectangle.
+        :return: (list-of-int) ids of candidate geometries.
+        """
+        return self.indexDict[name][0].intersects(bbRect)
+
+    def getGeometry(self, name, geomId):
+        return self.indexDict[name][1][geomId]
+
+    def getPreparedEngine(self, name, geomId):
+        """
+        Gets (building it once) the prepared geometry engine of a cached reference geometry.
+        :param name: (str) reference name.
+        :param geomId: (int) geometry id.
+        :return: (QgsGeometryEngine) prepared engine.
+        """
+        key = (name, geomId)
+        if key not in self.engineDict:
+            engine = QgsGeometry.createGeometryEngine(self.getGeometry(name, geomId).geometry())
+            engine.prepareGeometry()
+            self.engineDict[key] = engine
+        return self.engineDict[key]
+
 class CreateNetworkNodesProcess(ValidationProcess):
+    modifiesClasses = True
+    processAlias = QT_TRANSLATE_NOOP('CreateNetworkNodesProcess', 'Create Network Nodes')
+
     # enum for node types
     Flag, Sink, WaterwayBegin, UpHillNode, DownHillNode, Confluence, Ramification, AttributeChange, NodeNextToWaterBody, AttributeChangeFlag, NodeOverload, DisconnectedLine = range(12)
     def __init__(self, postgisDb, iface, instantiating=False):
@@ -46,7 +135,6 @@ class CreateNetworkNodesProcess(ValidationProcess):
         :param instantiating: (bool) indication of whether method is being instatiated.
         """
         super(CreateNetworkNodesProcess, self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Create Network Nodes')
         self.hidNodeLayerName = 'aux_hid_nodes_p'
         self.canvas = self.iface.mapCanvas()
         self.DsgGeometryHandler = DsgGeometryHandler(iface)
@@ -192,30 +280,37 @@ class CreateNetworkNodesProcess(ValidationProcess):
         # if a nodeList is not found, method doesn't change anything
         return bool(nodeList)
 
-    def nodeOnFrame(self, node, frameLyrContourList, searchRadius):
+    def nodeOnFrame(self, node, frameLyrContourList, searchRadius, context=None):
         """
         Identify whether or not node is over the frame. Returns True if point is over the frame and false if
         node is not on frame. If identification fails, returns 'None'.
         :param node: node (QgsPoint) to be identified as over the frame layer or not.
         :param frameLyrContourList: (list-of-QgsGeometry) border line for the frame layer to be checked.
         :param searchRadius: maximum distance to frame layer such that the feature is considered touching it.
+        :param context: (NodeClassificationContext) cached reference geometries.
         :return: (bool) whether node is as close as searchRaius to frame contour.
         """
         qgisPoint = QgsGeometry.fromPoint(node)
         # building a buffer around node with search radius for intersection with Layer Frame
         buf = qgisPoint.buffer(searchRadius, -1)
+        if context is not None and context.hasReference('frame'):
+            for geomId in context.getCandidates('frame', buf.boundingBox()):
+                if context.getPreparedEngine('frame', geomId).intersects(buf.geometry()):
+                    return True
+            return False
         for frameContour in frameLyrContourList:
             if buf.intersects(frameContour):
                 # it is condition enough one of the frame contours to be next to node
                 return True
         return False
 
-    def nodeNextToWaterBodies(self, node, waterBodiesLayers, searchRadius):
+    def nodeNextToWaterBodies(self, node, waterBodiesLayers, searchRadius, context=None):
         """
         Identify whether or not node is next to a water body feature.
         :param node: (QgsPoint) node to be identified as next to a water body feature.
         :param waterBodiesLayers: (list-of-QgsVectorLayer) list of layers composing the water bodies on map.
         :param searchRadius: (float) maximum distance to frame layer such that the feature is considered touching it.
+        :param context: (NodeClassificationContext) cached reference geometries.
         :return: (bool) whether node is as close as searchRaius to a water body element.
         """        
         qgisPoint = QgsGeometry.fromPoint(node)
@@ -223,6 +318,11 @@ class CreateNetworkNodesProcess(ValidationProcess):
         buf = qgisPoint.buffer(searchRadius, -1)
         # building bounding box around node for feature requesting
         bbRect = buf.boundingBox()
+        if context is not None and context.hasReference('waterBodies'):
+            for geomId in context.getCandidates('waterBodies', bbRect):
+                if context.getPreparedEngine('waterBodies', geomId).intersects(buf.geometry()):
+                    return True
+            return False
         # check if buffer intersects features from water bodies layers
         for lyr in waterBodiesLayers:
             if lyr.geometryType() == 0:
@@ -234,19 +334,25 @@ class CreateNetworkNodesProcess(ValidationProcess):
                     return True
         return False
 
-    def nodeIsWaterSink(self, node, waterSinkLayer, searchRadius):
+    def nodeIsWaterSink(self, node, waterSinkLayer, searchRadius, context=None):
         """
         Identify whether or not node is next to a water body feature. If no water sink layer is given, method returns False
         :param node: (QgsPoint) node to be identified as coincident with a water sink feature.
         :param waterSinkLayer: (QgsVectorLayer) layer containing the water sinks on map.
         :param searchRadius: (float) maximum distance to frame layer such that the feature is considered touching it.
+        :param context: (NodeClassificationContext) cached reference geometries.
         :return: (bool) whether node is as close as searchRaius to a water body element.
         """
         if not waterSinkLayer:
             return False
         qgisPoint = QgsGeometry.fromPoint(node)
         # building bounding box around node for feature requesting
-        bbRect = qgisPoint.buffer(searchRadius, -1).boundingBox()
+        bbRect = QgsRectangle(node.x() - searchRadius, node.y() - searchRadius, node.x() + searchRadius, node.y() + searchRadius)
+        if context is not None and context.hasReference('waterSink'):
+            for geomId in context.getCandidates('waterSink', bbRect):
+                if qgisPoint.distance(context.getGeometry('waterSink', geomId)) <= searchRadius:
+                    return True
+            return False
         # check if qgisPoint (node geometry) is over a sink classified point
         for feat in waterSinkLayer.getFeatures(QgsFeatureRequest(bbRect)):
             if qgisPoint.distance(feat.geometry()) <= searchRadius:
@@ -254,11 +360,12 @@ class CreateNetworkNodesProcess(ValidationProcess):
                 return True
         return False
 
-    def checkIfHasLineInsideWaterBody(self, node, waterBodiesLayers, searchRadius=1.0):
+    def checkIfHasLineInsideWaterBody(self, node, waterBodiesLayers, searchRadius=1.0, context=None):
         """
         Checks whether one of ending lines connected to given node is inside of a water body feature.
         :param node: (QgsPoint) node to be identified having an ending line inside of a water body.
         :param waterBodiesLayers: (list-of-QgsVectorLayer) list of layers composing the water bodies on map.
+        :param context: (NodeClassificationContext) cached reference geometries.
         :return: (bool) whether node is as close as searchRaius to a water body element.
         """
         qgisPoint = QgsGeometry.fromPoint(node)
@@ -266,6 +373,14 @@ class CreateNetworkNodesProcess(ValidationProcess):
         buf = qgisPoint.buffer(searchRadius, -1)
         # building bounding box around node for feature requesting
         bbRect = buf.boundingBox()
+        if context is not None and context.hasReference('waterBodies'):
+            candidateList = context.getCandidates('waterBodies', bbRect)
+            for line in self.nodeDict[node]['end']:
+                lineGeom = line.geometry()
+                for geomId in candidateList:
+                    if context.getPreparedEngine('waterBodies', geomId).contains(lineGeom.geometry()):
+                        return True
+            return False
         # check if any wb feature inside of buffer area contains any ending line
         for line in self.nodeDict[node]['end']:
             for lyr in waterBodiesLayers:
@@ -319,12 +434,13 @@ class CreateNetworkNodesProcess(ValidationProcess):
         # comparing their dictionary of attributes, it is decided whether they share the exact same set of attributes (fields and values)
         return atrLineIn != atrLineOut
 
-    def isFirstOrderDangle(self, node, networkLayer, searchRadius):
+    def isFirstOrderDangle(self, node, networkLayer, searchRadius, context=None):
         """
         Checks whether node is a dangle into network (connected to a first order line).
         :param node: (QgsPoint) node to be validated.
         :param networkLayer: (QgsVectorLayer) network layer (line layer).
         :param searchRadius: (float) limit distance to another line.
+        :param context: (NodeClassificationContext) cached reference geometries.
         :return: (bool) indication whether node is a dangle.
         """
         qgisPoint = QgsGeometry.fromPoint(node)
@@ -332,10 +448,14 @@ class CreateNetworkNodesProcess(ValidationProcess):
         buf = qgisPoint.buffer(searchRadius, -1)
         # building bounding box around node for feature requesting
         bbRect = buf.boundingBox()
+        if context is not None and context.hasReference('network'):
+            geometryList = [context.getGeometry('network', geomId) for geomId in context.getCandidates('network', bbRect)]
+        else:
+            geometryList = (feat.geometry() for feat in networkLayer.getFeatures(QgsFeatureRequest(bbRect)))
         # check if buffer intersects features from water bodies layers
         count = 0
-        for feat in networkLayer.getFeatures(QgsFeatureRequest(bbRect)):
-            if buf.intersects(feat.geometry()):
+        for geom in geometryList:
+            if buf.intersects(geom):
                 count += 1
                 res = (count > 1)
                 if res:
@@ -396,7 +516,7 @@ class CreateNetworkNodesProcess(ValidationProcess):
         # in case next node is not yet classified, method is ineffective
         return False
 
-    def nodeType(self, nodePoint, networkLayer, frameLyrContourList, waterBodiesLayers, searchRadius, nodeTypeDict, waterSinkLayer=None, networkLayerGeomType=None):
+    def nodeType(self, nodePoint, networkLayer, frameLyrContourList, waterBodiesLayers, searchRadius, nodeTypeDict, waterSinkLayer=None, networkLayerGeomType=None, context=None):
         """
         Get the node type given all lines that flows from/to it.
         :param nodePoint: (QgsPoint) point to be classified.
@@ -407,6 +527,7 @@ class CreateNetworkNodesProcess(ValidationProcess):
         :param nodeTypeDict: (dict) dict with all currently classified nodes and their types.
         :param waterSinkLayer: (QgsVectorLayer) water sink layer.
         :param networkLayerGeomType: (int) network layer geometry type code.
+        :param context: (NodeClassificationContext) cached reference geometries (see classifyAllNodes).
         :return: returns the (int) point type.
         """
         # to reduce calculation time in expense of memory, which is cheap
@@ -425,7 +546,7 @@ class CreateNetworkNodesProcess(ValidationProcess):
         # case 1: all lines either flow in or out 
         if startXORendLine:
             # case 1.a: point is over the frame
-            if self.nodeOnFrame(node=nodePoint, frameLyrContourList=frameLyrContourList, searchRadius=searchRadius):
+            if self.nodeOnFrame(node=nodePoint, frameLyrContourList=frameLyrContourList, searchRadius=searchRadius, context=context):
                 # case 1.a.i: waterway is flowing away from mapped area (point over the frame has one line ending line)
                 if hasEndLine:
                     return CreateNetworkNodesProcess.DownHillNode
@@ -435,27 +556,27 @@ class CreateNetworkNodesProcess(ValidationProcess):
             # case 1.b: point that legitimately only flows from
             elif hasEndLine:
                 # case 1.b.i
-                if self.nodeNextToWaterBodies(node=nodePoint, waterBodiesLayers=waterBodiesLayers, searchRadius=searchRadius):
+                if self.nodeNextToWaterBodies(node=nodePoint, waterBodiesLayers=waterBodiesLayers, searchRadius=searchRadius, context=context):
                     # it is considered that every free node on map is a starting node. The only valid exceptions are nodes that are
                     # next to water bodies and water sink holes.
                     if sizeFlowIn == 1:
                         # a node next to water has to be a lose end
                         return CreateNetworkNodesProcess.NodeNextToWaterBody
                 # force all lose ends to be waterway beginnings if they're not dangles (which are flags)
-                elif self.isFirstOrderDangle(node=nodePoint, networkLayer=networkLayer, searchRadius=self.parameters['Search Radius']):
+                elif self.isFirstOrderDangle(node=nodePoint, networkLayer=networkLayer, searchRadius=self.parameters['Search Radius'], context=context):
                     # check if node is connected to a disconnected line
                     if self.checkIfLineIsDisconnected(node=nodePoint, networkLayer=networkLayer, nodeTypeDict=nodeTypeDict, geomType=networkLayerGeomType):
                         return CreateNetworkNodesProcess.DisconnectedLine
                     # case 1.b.ii: node is in fact a water sink and should be able to take an 'in' flow
-                    elif self.nodeIsWaterSink(node=nodePoint, waterSinkLayer=waterSinkLayer, searchRadius=searchRadius):
+                    elif self.nodeIsWaterSink(node=nodePoint, waterSinkLayer=waterSinkLayer, searchRadius=searchRadius, context=context):
                         # if a node is indeed a water sink (operator has set it to a sink)
                         return CreateNetworkNodesProcess.Sink
                     return CreateNetworkNodesProcess.WaterwayBegin
             # case 1.c: point that legitimately only flows out
-            elif hasStartLine and self.isFirstOrderDangle(node=nodePoint, networkLayer=networkLayer, searchRadius=self.parameters['Search Radius']):
+            elif hasStartLine and self.isFirstOrderDangle(node=nodePoint, networkLayer=networkLayer, searchRadius=self.parameters['Search Radius'], context=context):
                 if self.checkIfLineIsDisconnected(node=nodePoint, networkLayer=networkLayer, nodeTypeDict=nodeTypeDict, geomType=networkLayerGeomType):
                     return CreateNetworkNodesProcess.DisconnectedLine
-                elif self.nodeIsWaterSink(node=nodePoint, waterSinkLayer=waterSinkLayer, searchRadius=searchRadius):
+                elif self.nodeIsWaterSink(node=nodePoint, waterSinkLayer=waterSinkLayer, searchRadius=searchRadius, context=context):
                     # in case there's a wrongly acquired line connected to a water sink
                     return CreateNetworkNodesProcess.Sink
                 return CreateNetworkNodesProcess.WaterwayBegin
@@ -492,6 +613,9 @@ class CreateNetworkNodesProcess(ValidationProcess):
         :return: a (dict) dictionary of node and its node type ( { (QgsPoint)node : (int)nodeType } ). 
         """
         networkLayerGeomType = networkLayer.geometryType()
+        # reference geometries are read and indexed once for all nodes
+        context = NodeClassificationContext(frameLyrContourList=frameLyrContourList, waterBodiesLayers=waterBodiesLayers, \
+                                            waterSinkLayer=waterSinkLayer, networkLayer=networkLayer)
         nodeTypeDict = dict()
         nodeKeys = self.nodeDict.keys()
         if not nodeList:
@@ -502,7 +626,7 @@ class CreateNetworkNodesProcess(ValidationProcess):
                 continue
             nodeTypeDict[node] = self.nodeType(nodePoint=node, networkLayer=networkLayer, frameLyrContourList=frameLyrContourList, \
                                     waterBodiesLayers=waterBodiesLayers, searchRadius=searchRadius, waterSinkLayer=waterSinkLayer, \
-                                    nodeTypeDict=nodeTypeDict, networkLayerGeomType=networkLayerGeomType)
+                                    nodeTypeDict=nodeTypeDict, networkLayerGeomType=networkLayerGeomType, context=context)
         return nodeTypeDict
 
     def clearHidNodeLayer(self, nodeLayer, nodeIdList=None, commitToLayer=False):
@@ -561,7 +685,7 @@ class CreateNetworkNodesProcess(ValidationProcess):
             return self.layerLoader.load([layerName], uniqueLoad=uniqueLoad)[layerName]
         except Exception as e:
             errorMsg = self.tr('Could not load the class {0}! (If you manually removed {0} from database, reloading QGIS/DSGTools Plugin might sort out the problem.\n').format(layerName)+':'.join(e.args)
-            QMessageBox.critical(self.canvas, self.tr('Error!'), errorMsg)
+            self.showMessage(self.tr('Error!'), errorMsg, critical=True, parent=self.canvas)
 
     def execute(self):
         """
@@ -21,16 +21,19 @@
  ***************************************************************************/
 """
 from qgis.core import QgsVectorLayer,QgsDataSourceURI, QgsMessageLog, QgsFeature, QgsFeatureRequest
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 
 class DeaggregateGeometriesProcess(ValidationProcess):
+    modifiesClasses = True
+    processAlias = QT_TRANSLATE_NOOP('DeaggregateGeometriesProcess', 'Deaggregate Geometries')
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Deaggregate Geometries')
         
         if not self.instantiating:
             # getting tables with elements
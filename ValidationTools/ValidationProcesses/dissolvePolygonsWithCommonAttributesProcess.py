@@ -22,16 +22,18 @@
 """
 from qgis.core import QgsMessageLog, QgsVectorLayer, QgsMapLayerRegistry, QgsGeometry, QgsVectorDataProvider, QgsFeatureRequest, QgsExpression, QgsFeature, QgsDataSourceURI, QgsSpatialIndex, QgsField
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
-from PyQt4.QtCore import QVariant
+from PyQt4.QtCore import QVariant, QT_TRANSLATE_NOOP
 import processing, binascii
 
 class DissolvePolygonsWithCommonAttributesProcess(ValidationProcess):
+    modifiesClasses = True
+    processAlias = QT_TRANSLATE_NOOP('DissolvePolygonsWithCommonAttributesProcess', 'Dissolve polygons with common attributes')
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Dissolve polygons with common attributes')
         
         if not self.instantiating:
             # getting tables with elements
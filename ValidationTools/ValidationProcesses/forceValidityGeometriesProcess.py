@@ -21,16 +21,19 @@
  ***************************************************************************/
 """
 from qgis.core import QgsMessageLog, QgsVectorLayer
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 
 class ForceValidityGeometriesProcess(ValidationProcess):
+    modifiesClasses = True
+    processAlias = QT_TRANSLATE_NOOP('ForceValidityGeometriesProcess', 'Force Geometries Validity')
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Force Geometries Validity')
         
         # we should use this code here when the pre Process is used
         #self.flagsDict = self.abstractDb.getFlagsDictByProcess('IdentifyInvalidGeometriesProcess')
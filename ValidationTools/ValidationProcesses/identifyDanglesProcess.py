@@ -22,9 +22,9 @@
  *                                                                         *
  ***************************************************************************/
 """
-from qgis.core import QgsMessageLog, QgsGeometry, QgsFeatureRequest, QgsExpression, QgsFeature, QgsSpatialIndex, QGis, QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsField, QgsFeatureIterator, QgsMapLayerRegistry
+from qgis.core import QgsMessageLog, QgsGeometry, QgsFeatureRequest, QgsExpression, QgsFeature, QgsSpatialIndex, QGis, QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsField, QgsFeatureIterator, QgsMapLayerRegistry, QgsRectangle, QgsPoint
 
-from PyQt4.QtCore import QVariant
+from PyQt4.QtCore import QVariant, QT_TRANSLATE_NOOP
 
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.ValidationTools.ValidationProcesses.unbuildEarthCoveragePolygonsProcess import UnbuildEarthCoveragePolygonsProcess
@@ -32,16 +32,23 @@ from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 
 from collections import deque, OrderedDict
 
-import binascii
+import binascii, struct
+import numpy
 
 from collections import OrderedDict
+
+# compiled structs used to read WKB (see IdentifyDanglesProcess.readWkbHeader)
+wkbStructDict = {fmt : struct.Struct(fmt) for fmt in ['<I', '>I', '<dd', '>dd']}
+
 class IdentifyDanglesProcess(ValidationProcess):
+    processAlias = QT_TRANSLATE_NOOP('IdentifyDanglesProcess', 'Identify Dangles')
+    supportsResultCache = True
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Identify Dangles')
         
         if not self.instantiating:
             # getting tables with elements
@@ -130,9 +137,11 @@ class IdentifyDanglesProcess(ValidationProcess):
             self.finishedWithError()
             return 0            
     
-    def buildInitialAndEndPointDict(self, lyr, tableSchema, tableName):
+    def buildInitialAndEndPointDict(self, lyr, tableSchema, tableName, tolerance = 10**-8):
         """
         Calculates initial point and end point from each line from lyr.
+        Returns a dict {point : list of ids of the lines that start or end on it}. Points closer than tolerance
+        are the same point (see groupCoincidentPoints).
         """
         if isinstance(lyr, list):
             featureList = lyr
@@ -145,54 +154,164 @@ class IdentifyDanglesProcess(ValidationProcess):
                 featureList = lyr.getFeatures()
                 size = len(lyr.allFeatureIds())
         localProgress = ProgressWidget(1, size, self.tr('Building search structure for {0}.{1}').format(tableSchema,tableName), parent=self.iface.mapCanvas())
-        # start and end points dict
-        endVerticesDict = {}
-        # iterating over features to store start and end points
+        # start and end points of each part, read from the WKB
+        coordList = []
+        idList = []
         for feat in featureList:
-            geom = feat.geometry()
-            if geom.isMultipart():
-                multiLine = geom.asMultiPolyline()
-                for j in xrange(len(multiLine)):
-                    line = multiLine[j]
-                    startPoint = line[0]
-                    endPoint = line[len(line) - 1]
-                    # storing start point in the dict
-                    if startPoint not in endVerticesDict.keys():
-                        endVerticesDict[startPoint] = []
-                    endVerticesDict[startPoint].append(feat.id())
-                    # storing end point in the dict
-                    if endPoint not in endVerticesDict.keys():
-                        endVerticesDict[endPoint] = []
-                    endVerticesDict[endPoint].append(feat.id())
-            else:
-                line = geom.asPolyline()
-                startPoint = line[0]
-                endPoint = line[len(line) - 1]
-                # storing start point in the dict
-                if startPoint not in endVerticesDict.keys():
-                    endVerticesDict[startPoint] = []
-                endVerticesDict[startPoint].append(feat.id())
-                # storing end point in the dict
-                if endPoint not in endVerticesDict.keys():
-                    endVerticesDict[endPoint] = []
-                endVerticesDict[endPoint].append(feat.id())
+            endPointList = self.getLineEndPointList(feat.geometry())
+            for endPoints in endPointList:
+                coordList += endPoints
+            idList += [feat.id()] * (2 * len(endPointList))
             localProgress.step()
+        coordArray = numpy.array(coordList, dtype = float).reshape(-1, 2)
+        idArray = numpy.array(idList, dtype = numpy.int64)
+        groupArray = self.groupCoincidentPoints(coordArray, tolerance)
+        # stable sort keeps the order of the features inside each group, the first point is the key of the group
+        order = numpy.argsort(groupArray, kind = 'mergesort')
+        sortedGroupArray = groupArray[order]
+        startList = numpy.nonzero(numpy.r_[True, sortedGroupArray[1:] != sortedGroupArray[:-1]])[0].tolist() + [len(order)]
+        coordList = coordArray[order].tolist()
+        idList = idArray[order].tolist()
+        endVerticesDict = {}
+        for start, end in zip(startList[:-1], startList[1:]):
+            endVerticesDict[QgsPoint(coordList[start][0], coordList[start][1])] = idList[start:end]
         return endVerticesDict
+
+    def readWkbHeader(self, wkb, offset):
+        """
+        Reads byte order, geometry type (without dimension flags) and number of coordinates of each vertex of a WKB geometry
+        """
+        byteOrder = '<' if wkb[offset] == '\x01' else '>'
+        wkbType = wkbStructDict[byteOrder + 'I'].unpack_from(wkb, offset + 1)[0]
+        isoDimension = (wkbType & 0xffff) / 1000
+        hasZ = bool(wkbType & 0x80000000) or isoDimension in (1, 3)
+        hasM = bool(wkbType & 0x40000000) or isoDimension in (2, 3)
+        return byteOrder, (wkbType & 0xffff) % 1000, 2 + hasZ + hasM, offset + 5
+
+    def readWkbLineString(self, wkb, offset, byteOrder, dimension):
+        """
+        Reads the vertices of a WKB line string (offset after the header) as a (n, 2) array
+        """
+        nPoints = wkbStructDict[byteOrder + 'I'].unpack_from(wkb, offset)[0]
+        coordArray = numpy.frombuffer(wkb, dtype = numpy.dtype(byteOrder + 'f8'), count = nPoints * dimension, offset = offset + 4)
+        return coordArray.reshape(nPoints, dimension)[:, :2], offset + 4 + 8 * nPoints * dimension
+
+    def getLineEndPointList(self, geom):
+        """
+        Gets [x0, y0, x1, y1] (start and end points) of each part of a line geometry. Only the end points are read from the WKB.
+        """
+        if not geom or geom.isEmpty():
+            return []
+        wkb = geom.asWkb()
+        byteOrder, wkbType, dimension, offset = self.readWkbHeader(wkb, 0)
+        if wkbType == 2: #LineString
+            partList = [(byteOrder, dimension, offset)]
+        elif wkbType == 5: #MultiLineString
+            partList = []
+            nParts = wkbStructDict[byteOrder + 'I'].unpack_from(wkb, offset)[0]
+            offset += 4
+            for i in xrange(nParts):
+                partByteOrder, partType, partDimension, offset = self.readWkbHeader(wkb, offset)
+                partList.append((partByteOrder, partDimension, offset))
+                offset += 4 + 8 * partDimension * wkbStructDict[partByteOrder + 'I'].unpack_from(wkb, offset)[0]
+        else:
+            return [line[0].tolist() + line[-1].tolist() for line in self.getLinePartList(geom)]
+        endPointList = []
+        for byteOrder, dimension, offset in partList:
+            nPoints = wkbStructDict[byteOrder + 'I'].unpack_from(wkb, offset)[0]
+            if nPoints == 0:
+                continue
+            pointStruct = wkbStructDict[byteOrder + 'dd']
+            endPointList.append(list(pointStruct.unpack_from(wkb, offset + 4) + pointStruct.unpack_from(wkb, offset + 4 + 8 * dimension * (nPoints - 1))))
+        return endPointList
+
+    def getLinePartList(self, geom):
+        """
+        Gets the vertices of each part of a line geometry as (n, 2) arrays. Empty parts are skipped.
+        """
+        if not geom or geom.isEmpty():
+            return []
+        wkb = geom.asWkb()
+        byteOrder, wkbType, dimension, offset = self.readWkbHeader(wkb, 0)
+        if wkbType == 2: #LineString
+            lineList = [self.readWkbLineString(wkb, offset, byteOrder, dimension)[0]]
+        elif wkbType == 5: #MultiLineString
+            lineList = []
+            nParts = wkbStructDict[byteOrder + 'I'].unpack_from(wkb, offset)[0]
+            offset += 4
+            for i in xrange(nParts):
+                partByteOrder, partType, partDimension, offset = self.readWkbHeader(wkb, offset)
+                line, offset = self.readWkbLineString(wkb, offset, partByteOrder, partDimension)
+                lineList.append(line)
+        else:
+            # curves and other types
+            lines = geom.asMultiPolyline() if geom.isMultipart() else [geom.asPolyline()]
+            lineList = [numpy.array([[point.x(), point.y()] for point in line], dtype = float).reshape(-1, 2) for line in lines]
+        return [line for line in lineList if len(line) > 0]
+
+    def groupCoincidentPoints(self, coordArray, tolerance):
+        """
+        Groups points closer than tolerance. Points are hashed into a grid of tolerance sized cells and the points
+        of a cell form a group. Points alone in their cells join the group of a point within tolerance in the
+        neighbouring cells, if any.
+        coordArray: (n, 2) array
+        Returns the group of each point (array)
+        """
+        n = len(coordArray)
+        if n == 0:
+            return numpy.zeros(0, dtype = numpy.int64)
+        cellArray = numpy.floor(coordArray / tolerance).astype(numpy.int64)
+        order = numpy.lexsort((cellArray[:, 1], cellArray[:, 0]))
+        sortedCellArray = cellArray[order]
+        isFirst = numpy.ones(n, dtype = bool)
+        isFirst[1:] = numpy.any(sortedCellArray[1:] != sortedCellArray[:-1], axis = 1)
+        groupArray = numpy.empty(n, dtype = numpy.int64)
+        groupArray[order] = numpy.cumsum(isFirst) - 1
+        singleIndexArray = numpy.nonzero(numpy.bincount(groupArray)[groupArray] == 1)[0]
+        if len(singleIndexArray) == 0:
+            return groupArray
+        # cells are coded by the ranks of their x and y cells, so that neighbouring cells are found by binary search
+        xCellArray = numpy.unique(cellArray[:, 0])
+        yCellArray = numpy.unique(cellArray[:, 1])
+        getCode = lambda xRank, yRank : xRank * len(yCellArray) + yRank
+        codeArray = getCode(numpy.searchsorted(xCellArray, cellArray[:, 0]), numpy.searchsorted(yCellArray, cellArray[:, 1]))
+        codeOrder = numpy.argsort(codeArray, kind = 'mergesort')
+        sortedCodeArray = codeArray[codeOrder]
+        pairList = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if dx == 0 and dy == 0:
+                    continue
+                xNeighbourArray = cellArray[singleIndexArray, 0] + dx
+                yNeighbourArray = cellArray[singleIndexArray, 1] + dy
+                xRank = numpy.minimum(numpy.searchsorted(xCellArray, xNeighbourArray), len(xCellArray) - 1)
+                yRank = numpy.minimum(numpy.searchsorted(yCellArray, yNeighbourArray), len(yCellArray) - 1)
+                code = getCode(xRank, yRank)
+                position = numpy.minimum(numpy.searchsorted(sortedCodeArray, code), n - 1)
+                found = (xCellArray[xRank] == xNeighbourArray) & (yCellArray[yRank] == yNeighbourArray) & (sortedCodeArray[position] == code)
+                # first point of each occupied neighbouring cell
+                pairList += zip(singleIndexArray[found].tolist(), codeOrder[position[found]].tolist())
+        for i, j in pairList:
+            # every point of the neighbouring cell must be checked
+            start = numpy.searchsorted(sortedCodeArray, codeArray[j])
+            end = numpy.searchsorted(sortedCodeArray, codeArray[j], side = 'right')
+            for k in codeOrder[start:end].tolist():
+                if numpy.hypot(*(coordArray[k] - coordArray[i])) <= tolerance:
+                    groupArray[i] = groupArray[k]
+                    break
+        return groupArray
     
     def searchDanglesOnPointDict(self, endVerticesDict, tableSchema, tableName):
         """
         Counts the number of points on each endVerticesDict's key and returns a list of QgsPoint built from key candidate.
         """
         pointList = []
-        idList = []
         # actual search for dangles
-        localProgress = ProgressWidget(1, len(endVerticesDict.keys()), self.tr('Searching dangles on {0}.{1}').format(tableSchema, tableName), parent=self.iface.mapCanvas())
-        for point in endVerticesDict.keys():
+        localProgress = ProgressWidget(1, len(endVerticesDict), self.tr('Searching dangles on {0}.{1}').format(tableSchema, tableName), parent=self.iface.mapCanvas())
+        for point, idList in endVerticesDict.iteritems():
             # this means we only have one occurrence of point, therefore it is a dangle
-            if len(endVerticesDict[point]) > 1:
-                localProgress.step()
-                continue
-            pointList.append(point)
+            if len(idList) == 1:
+                pointList.append(point)
             localProgress.step()
         return pointList
 
@@ -256,43 +375,89 @@ class IdentifyDanglesProcess(ValidationProcess):
 
     def filterPointListWithFilterLayer(self, pointList, filterLayer, searchRadius, isRefLyr = False, ignoreNotSplit = False):
         """
-        Builds buffer areas from each point and evaluates the intersecting lines. If there are more than two intersections, it is a dangle.
+        Evaluates the lines within searchRadius of each point.
+        With the filter layer, points on a line are not dangles.
+        With the reference layer (isRefLyr), points are not dangles when every line within searchRadius touches them
+        (or contains them, with ignoreNotSplit).
         """
+        if len(pointList) == 0:
+            return []
         spatialIdx, allFeatureDict = self.buildSpatialIndexAndIdDict(filterLayer)
-        notDangleIndexList = []
-        for i in range(len(pointList)):
-            candidateCount = 0
-            qgisPoint = QgsGeometry.fromPoint(pointList[i])
-            #search radius to narrow down candidates
-            buffer = qgisPoint.buffer(searchRadius, -1)
-            bufferBB = buffer.boundingBox()
-            #gets candidates from spatial index
-            candidateIds = spatialIdx.intersects(bufferBB)
-            #if there is only one feat in candidateIds, that means that it is not a dangle
-            bufferCount = len([id for id in candidateIds if buffer.intersects(allFeatureDict[id].geometry())])
-            for id in candidateIds:
-                if not isRefLyr:
-                    if buffer.intersects(allFeatureDict[id].geometry()) and \
-                    qgisPoint.distance(allFeatureDict[id].geometry()) < 10**-9: #float problem, tried with intersects and touches and did not get results
-                        notDangleIndexList.append(i)
-                        break
+        pointArray = numpy.array([[point.x(), point.y()] for point in pointList], dtype = float)
+        # (point, line) pairs given by the spatial index, lines are read only once
+        lineDict = dict()
+        pairPointList = []
+        pairLineList = []
+        for i, (x, y) in enumerate(pointArray.tolist()):
+            for id in spatialIdx.intersects(QgsRectangle(x - searchRadius, y - searchRadius, x + searchRadius, y + searchRadius)):
+                if id not in lineDict:
+                    lineDict[id] = self.getSegmentAndBoundaryArrays(allFeatureDict[id].geometry())
+                if lineDict[id] is None:
+                    continue
+                pairPointList.append(i)
+                pairLineList.append(id)
+        notDangleArray = numpy.zeros(len(pointList), dtype = bool)
+        if len(pairPointList) > 0:
+            pairPointArray = numpy.array(pairPointList, dtype = numpy.int64)
+            distanceArray = self.getPairDistances(pointArray, pairPointArray, [lineDict[id][0] for id in pairLineList])
+            onLineArray = distanceArray < 10**-9 #float problem, tried with intersects and touches and did not get results
+            if not isRefLyr:
+                notDangleArray[pairPointArray[onLineArray]] = True
+            else:
+                nearArray = distanceArray <= searchRadius
+                if ignoreNotSplit:
+                    acceptedArray = onLineArray
                 else:
-                    if ignoreNotSplit:
-                        if buffer.intersects(allFeatureDict[id].geometry()) and \
-                        (qgisPoint.distance(allFeatureDict[id].geometry()) < 10**-9 or \
-                        qgisPoint.intersects(allFeatureDict[id].geometry())): #float problem, tried with intersects and touches and did not get results
-                            candidateCount += 1
-                    else:
-                        if buffer.intersects(allFeatureDict[id].geometry()) and \
-                        (qgisPoint.touches(allFeatureDict[id].geometry())): #float problem, tried with intersects and touches and did not get results
-                            candidateCount += 1
-                    if candidateCount == bufferCount:
-                        notDangleIndexList.append(i)
-        filteredDangleList = []
-        for i in range(len(pointList)):
-            if i not in notDangleIndexList:
-                filteredDangleList.append(pointList[i])
-        return filteredDangleList
+                    # touches: the point is on the boundary of the line
+                    acceptedArray = self.getPairDistances(pointArray, pairPointArray, [lineDict[id][1] for id in pairLineList]) < 10**-9
+                nearCount = numpy.bincount(pairPointArray[nearArray], minlength = len(pointList))
+                acceptedCount = numpy.bincount(pairPointArray[nearArray & acceptedArray], minlength = len(pointList))
+                notDangleArray = (nearCount > 0) & (acceptedCount == nearCount)
+        return [point for point, notDangle in zip(pointList, notDangleArray.tolist()) if not notDangle]
+
+    def getSegmentAndBoundaryArrays(self, geom):
+        """
+        Gets the segments ((n, 4) array of x1, y1, x2, y2) and the boundary points as degenerated segments ((m, 4) array)
+        of a line. The boundary points are the end points that occur an odd number of times (closed lines have no boundary).
+        Returns None for lines without vertices.
+        """
+        lineList = self.getLinePartList(geom)
+        if len(lineList) == 0:
+            return None
+        segmentList = []
+        endPointCountDict = dict()
+        for line in lineList:
+            if len(line) == 1:
+                segmentList.append(numpy.hstack([line, line]))
+            else:
+                segmentList.append(numpy.hstack([line[:-1], line[1:]]))
+            for endPoint in [tuple(line[0].tolist()), tuple(line[-1].tolist())]:
+                endPointCountDict[endPoint] = endPointCountDict.get(endPoint, 0) + 1
+        boundaryList = [endPoint + endPoint for endPoint, count in endPointCountDict.iteritems() if count % 2 == 1]
+        # lines without boundary are never touched, far away segments keep the distance computation simple
+        boundaryArray = numpy.array(boundaryList, dtype = float).reshape(-1, 4) if len(boundaryList) > 0 else numpy.array([[numpy.inf] * 4])
+        return numpy.vstack(segmentList), boundaryArray
+
+    def getPairDistances(self, pointArray, pairPointArray, segmentArrayList):
+        """
+        Computes (vectorized) the distance between each point of pairPointArray (indexes of pointArray) and the
+        nearest segment of its segment array in segmentArrayList
+        """
+        sizeArray = numpy.array([len(segmentArray) for segmentArray in segmentArrayList], dtype = numpy.int64)
+        segmentArray = numpy.vstack(segmentArrayList)
+        pairPointCoordArray = pointArray[numpy.repeat(pairPointArray, sizeArray)]
+        px, py = pairPointCoordArray[:, 0], pairPointCoordArray[:, 1]
+        ax, ay, bx, by = segmentArray[:, 0], segmentArray[:, 1], segmentArray[:, 2], segmentArray[:, 3]
+        dx = bx - ax
+        dy = by - ay
+        squaredLength = dx * dx + dy * dy
+        # infinite segments (see getSegmentAndBoundaryArrays) give nan, i.e. no distance
+        with numpy.errstate(invalid = 'ignore'):
+            t = numpy.nan_to_num(numpy.clip(((px - ax) * dx + (py - ay) * dy) / numpy.where(squaredLength > 0, squaredLength, 1), 0, 1))
+            distanceArray = numpy.hypot(px - (ax + t * dx), py - (ay + t * dy))
+        distanceArray[numpy.isnan(distanceArray)] = numpy.inf
+        startArray = numpy.r_[0, numpy.cumsum(sizeArray)[:-1]]
+        return numpy.minimum.reduceat(distanceArray, startArray)
 
     def filterPseudoDangles(self, pointList, filterLayer, searchRadius):
         spatialIdx, allFeatureDict = self.buildSpatialIndexAndIdDict(filterLayer)
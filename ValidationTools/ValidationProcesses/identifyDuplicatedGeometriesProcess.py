@@ -21,16 +21,22 @@
  ***************************************************************************/
 """
 from qgis.core import QgsMessageLog
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 
 class IdentifyDuplicatedGeometriesProcess(ValidationProcess):
+    processAlias = QT_TRANSLATE_NOOP('IdentifyDuplicatedGeometriesProcess', 'Identify Duplicated Geometries')
+    supportsIncremental = True
+    supportsResultCache = True
+    parallelSafe = True
+    supportsTiling = True
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Identify Duplicated Geometries')
         
         if not self.instantiating:
             # getting tables with elements
@@ -50,7 +56,7 @@ class IdentifyDuplicatedGeometriesProcess(ValidationProcess):
         try:
             self.startTimeCount()
             self.setStatus(self.tr('Running'), 3) #now I'm running!
-            self.abstractDb.deleteProcessFlags(self.getName()) #erase previous flags
+            self.deleteProcessFlags() #erase previous flags
             classesWithElem = self.parameters['Classes']
             if len(classesWithElem) == 0:
                 self.setStatus(self.tr('No classes selected!. Nothing to be done.'), 1) #Finished
@@ -21,18 +21,22 @@
  ***************************************************************************/
 """
 from qgis.core import QgsMessageLog, QgsVectorLayer, QgsMapLayerRegistry
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.DsgGeometrySnapper.dsgGeometrySnapper import DsgGeometrySnapper
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 
 from collections import OrderedDict
 class IdentifyGapsAndOverlapsProcess(ValidationProcess):
+    processAlias = QT_TRANSLATE_NOOP('IdentifyGapsAndOverlapsProcess', 'Identify Earth Coverage Gaps and Overlaps')
+    supportsTiling = True
+    supportsResultCache = True
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(IdentifyGapsAndOverlapsProcess,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Identify Earth Coverage Gaps and Overlaps')
 
         if not self.instantiating:
             # getting tables with elements
@@ -80,11 +84,10 @@ class IdentifyGapsAndOverlapsProcess(ValidationProcess):
                 classlist.append(lyr)
                 localProgress.step()
 
-            # creating the unified layer
-            coverage = self.createUnifiedLayer(classlist)
-
-            # creating the temporary coverage layer on postgis
-            self.abstractDb.createAndPopulateCoverageTempTable(coverage)
+            # creating the temporary coverage layer on postgis, streaming the unified features
+            with self.profilePhase('Temp Table Staging'):
+                srid = classlist[0].crs().authid().split(':')[-1]
+                self.abstractDb.createAndPopulateCoverageTempTableFromFeatures(lambda : self.getUnifiedFeatures(classlist), srid)
 
             # running the process
             localProgress = ProgressWidget(0, 1, self.tr('Running process for coverage_temp'), parent=self.iface.mapCanvas())
@@ -99,12 +102,6 @@ class IdentifyGapsAndOverlapsProcess(ValidationProcess):
                     featId, reason, geom = r
                     recordFlagList.append(('validation.coverage_temp', featId, reason, geom, 'geom'))
 
-            #removing the coverage layer
-            try:
-                QgsMapLayerRegistry.instance().removeMapLayer(coverage.id())
-            except:
-                QgsMessageLog.logMessage(self.tr('Error while trying to remove coverage layer.'), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
-            
             # storing flags
             if len(recordFlagList) > 0:
                 numberOfProblems = self.addFlag(recordFlagList)
@@ -21,16 +21,20 @@
  ***************************************************************************/
 """
 from qgis.core import QgsMessageLog, QgsVectorLayer, QgsMapLayerRegistry, QgsGeometry, QgsVectorDataProvider, QgsFeatureRequest, QgsExpression, QgsFeature
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 
 class IdentifyGapsProcess(ValidationProcess):
+    processAlias = QT_TRANSLATE_NOOP('IdentifyGapsProcess', 'Identify Layer Gaps')
+    supportsResultCache = True
+    parallelSafe = True
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Identify Layer Gaps')
         
         if not self.instantiating:
             # getting tables with elements
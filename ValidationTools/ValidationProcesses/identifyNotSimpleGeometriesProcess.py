@@ -21,16 +21,22 @@
  ***************************************************************************/
 """
 from qgis.core import QgsMessageLog
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 
 class IdentifyNotSimpleGeometriesProcess(ValidationProcess):
+    processAlias = QT_TRANSLATE_NOOP('IdentifyNotSimpleGeometriesProcess', 'Identify Not Simple Geometries')
+    supportsIncremental = True
+    supportsResultCache = True
+    parallelSafe = True
+    supportsTiling = True
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Identify Not Simple Geometries')
 
         if not self.instantiating:
             # getting tables with elements
@@ -49,7 +55,7 @@ class IdentifyNotSimpleGeometriesProcess(ValidationProcess):
         QgsMessageLog.logMessage(self.tr('Starting ')+self.getName()+self.tr(' Process.'), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
         try:
             self.setStatus(self.tr('Running'), 3) #now I'm running!
-            self.abstractDb.deleteProcessFlags(self.getName()) #erase previous flags
+            self.deleteProcessFlags() #erase previous flags
             classesWithElem = self.parameters['Classes']
             self.startTimeCount()
             if len(classesWithElem) == 0:
@@ -20,21 +20,24 @@
  *                                                                         *
  ***************************************************************************/
 """
-from qgis.core import QgsMessageLog, QgsFeature, QgsGeometry, QgsVertexId, QGis, QgsMapLayerRegistry
+from qgis.core import QgsMessageLog, QgsFeature, QgsGeometry, QgsVertexId, QGis, QgsMapLayerRegistry, QgsPoint
 import math, processing
+import numpy
 from math import pi
-from itertools import combinations
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 from DsgTools.GeometricTools.DsgGeometryHandler import DsgGeometryHandler
 
 class IdentifyOutOfBoundsAnglesInCoverageProcess(ValidationProcess):
+    processAlias = QT_TRANSLATE_NOOP('IdentifyOutOfBoundsAnglesInCoverageProcess', 'Identify Out Of Bounds Angles in Coverage')
+    supportsResultCache = True
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(IdentifyOutOfBoundsAnglesInCoverageProcess,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Identify Out Of Bounds Angles in Coverage')
         self.geometryHandler = DsgGeometryHandler(iface, parent = iface.mapCanvas())
         
         if not self.instantiating:
@@ -62,50 +65,64 @@ class IdentifyOutOfBoundsAnglesInCoverageProcess(ValidationProcess):
             raise Exception(self.tr('Problem executing grass7:v.clean.advanced. Check your installed libs.\n'))
         return processing.getObject(grass_output['output'])
     
-    def getSegmentDict(self, lineLyr):
-        segmentDict = dict()
-        geomList = []
+    def getSegmentArrays(self, lineLyr):
+        """
+        Gets the first segment at each end of the lines of lineLyr. Repeated lines are found by their WKB.
+        Returns (node coordinates, coordinates of the other point of each segment) as (n, 2) arrays.
+        """
+        wkbSet = set()
+        nodeList = []
+        otherList = []
         for feat in lineLyr.getFeatures():
             geom = feat.geometry()
-            if geom not in geomList:
-                geomList.append(geom)
-                lineList = geom.asPolyline()
-                if lineList[0] not in segmentDict:
-                    segmentDict[lineList[0]] = []
-                segmentDict[lineList[0]].append(QgsGeometry.fromPolyline([lineList[0], lineList[1]]))
-                if lineList[-1] not in segmentDict:
-                    segmentDict[lineList[-1]] = []
-                segmentDict[lineList[-1]].append(QgsGeometry.fromPolyline([lineList[-1], lineList[-2]]))
-        return segmentDict
-    
-    def getAngleBetweenSegments(self, part):
-        line = part.asPolyline()
-        vertexAngle = (line[1].azimuth(line[0]) - line[1].azimuth(line[2]) + 360)
-        vertexAngle = math.fmod(vertexAngle, 360)
-        if vertexAngle > 180:
-            vertexAngle = 360 - vertexAngle
-        return vertexAngle
+            if not geom:
+                continue
+            wkb = geom.asWkb()
+            if wkb in wkbSet:
+                continue
+            wkbSet.add(wkb)
+            lineList = geom.asPolyline()
+            if len(lineList) < 2:
+                continue
+            nodeList += [(lineList[0].x(), lineList[0].y()), (lineList[-1].x(), lineList[-1].y())]
+            otherList += [(lineList[1].x(), lineList[1].y()), (lineList[-2].x(), lineList[-2].y())]
+        return numpy.array(nodeList, dtype = float).reshape(-1, 2), numpy.array(otherList, dtype = float).reshape(-1, 2)
 
-    def getOutOfBountsAngleInSegmentList(self, segmentList, angle):
-        for line1, line2 in combinations(segmentList, 2):
-            geom = line1.combine(line2)
-            part = geom.mergeLines()
-            if len(part.asPolyline()) > 2:
-                vertexAngle = self.getAngleBetweenSegments(part)
-                if vertexAngle < angle:
-                    return vertexAngle
-        return None
+    def getNodeAngleArrays(self, nodeArray, otherArray):
+        """
+        Computes the smallest angle (degrees) between the segments of each node with more than one segment.
+        The azimuths of the segments of a node are sorted, so the smallest angle is between neighbouring azimuths.
+        Overlapping segments (angle 0) are not considered.
+        Returns (node coordinates (m, 2), smallest angle (m)) arrays.
+        """
+        if len(nodeArray) == 0:
+            return nodeArray, numpy.zeros(0)
+        delta = otherArray - nodeArray
+        azimuthArray = numpy.mod(numpy.degrees(numpy.arctan2(delta[:, 0], delta[:, 1])), 360)
+        # grouping segments by node (same coordinates) and sorting them by azimuth inside each node
+        order = numpy.lexsort((azimuthArray, nodeArray[:, 1], nodeArray[:, 0]))
+        sortedNodeArray = nodeArray[order]
+        sortedAzimuthArray = azimuthArray[order]
+        isFirst = numpy.r_[True, numpy.any(sortedNodeArray[1:] != sortedNodeArray[:-1], axis = 1)]
+        startArray = numpy.nonzero(isFirst)[0]
+        countArray = numpy.diff(numpy.r_[startArray, len(order)])
+        # angle between each azimuth and the next one of the same node, the last one is compared with the first one
+        nextArray = numpy.arange(1, len(order) + 1)
+        isLast = numpy.r_[isFirst[1:], True]
+        nextArray[isLast] = startArray
+        gapArray = numpy.mod(sortedAzimuthArray[nextArray] - sortedAzimuthArray, 360)
+        angleArray = numpy.minimum(gapArray, 360 - gapArray)
+        angleArray[angleArray < 10**-9] = numpy.inf
+        nodeAngleArray = numpy.minimum.reduceat(angleArray, startArray)
+        multiple = (countArray > 1) & numpy.isfinite(nodeAngleArray)
+        return sortedNodeArray[startArray[multiple]], nodeAngleArray[multiple]
     
     def getOutOfBoundsAngleList(self, coverageLines, angle):
         lineLyr = self.getLineEdges(coverageLines)
-        segmentDict = self.getSegmentDict(lineLyr)
-        errorList = []
-        for point, segmentList in segmentDict.iteritems():
-            if len(segmentList) > 1:
-                vertexAngle = self.getOutOfBountsAngleInSegmentList(segmentList, angle)
-                if vertexAngle:
-                    errorList.append((vertexAngle, point))
-        return errorList
+        nodeArray, otherArray = self.getSegmentArrays(lineLyr)
+        nodeArray, nodeAngleArray = self.getNodeAngleArrays(nodeArray, otherArray)
+        outOfBounds = nodeAngleArray < angle
+        return [(vertexAngle, QgsPoint(x, y)) for vertexAngle, (x, y) in zip(nodeAngleArray[outOfBounds].tolist(), nodeArray[outOfBounds].tolist())]
 
     def buildAndRaiseOutOfBoundsFlag(self, flagLyr, geomTupleList):
         """
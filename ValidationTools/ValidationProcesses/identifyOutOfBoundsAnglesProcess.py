@@ -23,17 +23,20 @@
 from qgis.core import QgsMessageLog, QgsFeature, QgsGeometry, QgsVertexId, QGis
 import math
 from math import pi
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 from DsgTools.GeometricTools.DsgGeometryHandler import DsgGeometryHandler
 
 class IdentifyOutOfBoundsAnglesProcess(ValidationProcess):
+    processAlias = QT_TRANSLATE_NOOP('IdentifyOutOfBoundsAnglesProcess', 'Identify Out Of Bounds Angles')
+    supportsResultCache = True
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(IdentifyOutOfBoundsAnglesProcess,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Identify Out Of Bounds Angles')
         self.geometryHandler = DsgGeometryHandler(iface, parent = iface.mapCanvas())
         
         if not self.instantiating:
@@ -21,16 +21,22 @@
  ***************************************************************************/
 """
 from qgis.core import QgsMessageLog, QgsVectorLayer, QgsMapLayerRegistry, QgsGeometry, QgsVectorDataProvider, QgsFeatureRequest, QgsExpression, QgsFeature
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 
 class IdentifyOverlapsProcess(ValidationProcess):
+    processAlias = QT_TRANSLATE_NOOP('IdentifyOverlapsProcess', 'Identify Layer Overlaps')
+    supportsIncremental = True
+    supportsResultCache = True
+    parallelSafe = True
+    supportsTiling = True
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Identify Layer Overlaps')
         
         if not self.instantiating:
             # getting tables with elements
@@ -50,7 +56,7 @@ class IdentifyOverlapsProcess(ValidationProcess):
         self.startTimeCount()
         try:
             self.setStatus(self.tr('Running'), 3) #now I'm running!
-            self.abstractDb.deleteProcessFlags(self.getName()) #erase previous flags
+            self.deleteProcessFlags() #erase previous flags
             classesWithElem = self.parameters['Classes']
             self.startTimeCount()
             if len(classesWithElem) == 0:
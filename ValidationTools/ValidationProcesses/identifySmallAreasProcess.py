@@ -21,17 +21,20 @@
  ***************************************************************************/
 """
 from qgis.core import QgsMessageLog
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 import binascii
 
 class IdentifySmallAreasProcess(ValidationProcess):
+    processAlias = QT_TRANSLATE_NOOP('IdentifySmallAreasProcess', 'Identify Small Areas')
+    supportsResultCache = True
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Identify Small Areas')
         
         if not self.instantiating:
             # getting tables with elements
@@ -21,18 +21,21 @@
  ***************************************************************************/
 """
 from qgis.core import QgsMessageLog, QGis
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.ValidationTools.ValidationProcesses.identifyDanglesProcess import IdentifyDanglesProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 import binascii
 
 class IdentifySmallLinesProcess(ValidationProcess):
+    processAlias = QT_TRANSLATE_NOOP('IdentifySmallLinesProcess', 'Identify Small Lines')
+    supportsResultCache = True
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Identify Small Lines')
         
         if not self.instantiating:
             # getting tables with elements
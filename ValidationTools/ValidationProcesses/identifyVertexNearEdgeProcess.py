@@ -21,16 +21,20 @@
  ***************************************************************************/
 """
 from qgis.core import QgsMessageLog
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 
 class IdentifyVertexNearEdgeProcess(ValidationProcess):
+    processAlias = QT_TRANSLATE_NOOP('IdentifyVertexNearEdgeProcess', 'Identify Vertex Near Edge')
+    supportsIncremental = True
+    supportsResultCache = True
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Identify Vertex Near Edge')
         
         if not self.instantiating:
             # getting tables with elements
@@ -42,6 +46,12 @@ class IdentifyVertexNearEdgeProcess(ValidationProcess):
                 interfaceDictList.append({self.tr('Category'):cat, self.tr('Layer Name'):lyrName, self.tr('Geometry\nColumn'):geom, self.tr('Geometry\nType'):geomType, self.tr('Layer\nType'):tableType})
             self.parameters = {self.tr('Tolerance'): 1.0, 'Classes': interfaceDictList, 'Only Selected':False}
 
+    def getIncrementalRadius(self):
+        """
+        Reimplementation: vertices within the tolerance of changed features are affected too
+        """
+        return self.parameters[self.tr('Tolerance')]
+
     def execute(self):
         """
         Reimplementation of the execute method from the parent class
@@ -50,7 +60,7 @@ class IdentifyVertexNearEdgeProcess(ValidationProcess):
         self.startTimeCount()
         try:
             self.setStatus(self.tr('Running'), 3) #now I'm running!
-            self.abstractDb.deleteProcessFlags(self.getName()) #erase previous flags
+            self.deleteProcessFlags() #erase previous flags
             classesWithElem = self.parameters['Classes']
             self.startTimeCount()
             if len(classesWithElem) == 0:
@@ -20,18 +20,21 @@
  *                                                                         *
  ***************************************************************************/
 """
-from qgis.core import QgsMessageLog, QgsGeometry, QgsDataSourceURI
+from qgis.core import QgsMessageLog, QgsGeometry, QgsDataSourceURI, QgsFeatureRequest
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 import binascii
 
 class MergeLinesProcess(ValidationProcess):
+    modifiesClasses = True
+    processAlias = QT_TRANSLATE_NOOP('MergeLinesProcess', 'Merge lines with common attributes')
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Merge lines with common attributes')
         
         if not self.instantiating:
             # getting tables with elements
@@ -88,70 +91,43 @@ class MergeLinesProcess(ValidationProcess):
                 keyColumn = uri.keyColumn()
 
                 localProgress = ProgressWidget(1, size, self.tr('Running process on ') + classAndGeom['tableName'], parent=self.iface.mapCanvas())
-                # iterating over features to store them in groups having same attributes
-                featuresDict = {}
+                # iterating over features to store their attribute keys and end points
+                featureDict = dict()
+                keyDict = dict()
+                endPointDict = dict()
                 columns = None
                 for feat in featureList:
                     # getting the column names only once
                     if not columns:
-                        columns = [field.name() for field in feat.fields() if (field.type() != 6 and field.name() != keyColumn)]
-                    attributes = []
-                    for column in columns:
-                        # iterating only over allowed attribute names
-                        if column in attributeNames:
-                            continue
-                        # creating a key using the selected attributes
-                        if not feat[column]:
-                            attributes.append('')
-                        else:
-                            attributes.append(u'{}'.format(feat[column]))
-                    # making a string out of the key
-                    attributes = ''.join(attributes)
-                    if attributes not in featuresDict.keys():
-                        featuresDict[attributes] = []
-                    # storing the features
-                    featuresDict[attributes].append(feat)
-
+                        columns = [field.name() for field in feat.fields() if (field.type() != 6 and field.name() != keyColumn and field.name() not in attributeNames)]
+                    # creating a key using the allowed attributes
+                    keyDict[feat.id()] = tuple([u'{}'.format(feat[column]) if feat[column] else '' for column in columns])
+                    featureDict[feat.id()] = feat
+                    endPointDict[feat.id()] = self.getEndPoints(feat.geometry())
                     localProgress.step()
+                # node degrees consider every line of the layer, not only the selected ones
+                nodeDict = self.buildNodeDict(endPointDict, lyr if self.parameters['Only Selected'] else None)
+                chainList = self.buildChainList(featureDict, keyDict, endPointDict, nodeDict)
 
-                localProgress = ProgressWidget(1, len(featuresDict.keys()), self.tr('Merging lines for ') + classAndGeom['tableName'], parent=self.iface.mapCanvas())
+                localProgress = ProgressWidget(1, len(chainList), self.tr('Merging lines for ') + classAndGeom['tableName'], parent=self.iface.mapCanvas())
                 lyr.startEditing()
                 lyr.beginEditCommand('Merging lines')
                 idsToRemove = []
-                # iterating over the dictionary
-                for key in featuresDict.keys():
-                    # getting all features of a group
-                    features = featuresDict[key]
-                    for feature in features:
-                        # if the feature is already in the remove list there is no point in checking it
-                        if feature.id() in idsToRemove:
-                            continue
-                        geom = feature.geometry()
-                        for other in features:
-                            # the same idea applies here
-                            if other.id() == feature.id():
-                                continue
-                            if other.id() in idsToRemove:
-                                continue
-                            # checking the spatial predicate touches
-                            if geom.touches(other.geometry()):
-                                # this generates a multi geometry
-                                geom = geom.combine(other.geometry())
-                                # this make a single line string if the multi geometries are neighbors
-                                geom = geom.mergeLines()
-                                # making a "single" multi geometry (useful for databases that use multi types)
-                                geom.convertToMultiType()
-                                # marking the other feature as to be removed
-                                idsToRemove.append(other.id())
-                                # updating feature
-                                feature.setGeometry(geom)
-                                # updating layer
-                                lyr.updateFeature(feature)
+                for chain in chainList:
+                    # merging each chain once, the first feature of the chain is kept
+                    geom = QgsGeometry.unaryUnion([featureDict[id].geometry() for id in chain])
+                    # this make a single line string if the lines are neighbors
+                    geom = geom.mergeLines()
+                    # making a "single" multi geometry (useful for databases that use multi types)
+                    geom.convertToMultiType()
+                    lyr.changeGeometry(chain[0], geom)
+                    idsToRemove += chain[1:]
                     localProgress.step()
                     
                 lyr.deleteFeatures(idsToRemove)
                 lyr.endEditCommand()
                 localProgress.step()
+                QgsMessageLog.logMessage(self.tr('{0} lines of {1} merged into {2} lines.').format(len(idsToRemove) + len(chainList), classAndGeom['tableName'], len(chainList)), "DSG Tools Plugin", QgsMessageLog.INFO)
                 self.logLayerTime(classAndGeom['tableSchema']+'.'+classAndGeom['tableName'])
 
             self.setStatus(self.tr('All lines were merged.'), 1) #Finished with flags
@@ -159,4 +135,76 @@ class MergeLinesProcess(ValidationProcess):
         except Exception as e:
             QgsMessageLog.logMessage(':'.join(e.args), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
             self.finishedWithError()
-            return 0
\ No newline at end of file
+            return 0
+
+    def getEndPoints(self, geom):
+        """
+        Gets the start and end points ((x, y) tuples) of each part of a line
+        """
+        if not geom or geom.isEmpty():
+            return []
+        lines = geom.asMultiPolyline() if geom.isMultipart() else [geom.asPolyline()]
+        endPoints = []
+        for line in lines:
+            if len(line) > 0:
+                endPoints += [(line[0].x(), line[0].y()), (line[-1].x(), line[-1].y())]
+        return endPoints
+
+    def buildNodeDict(self, endPointDict, lyr = None):
+        """
+        Builds the endpoint adjacency: {node : list of ids of the lines that start or end on it}.
+        lyr: when given, its lines that are not in endPointDict are also counted (their ids are None)
+        """
+        nodeDict = dict()
+        for id, endPoints in endPointDict.iteritems():
+            for node in endPoints:
+                nodeDict.setdefault(node, []).append(id)
+        if lyr is not None:
+            for feat in lyr.getFeatures(QgsFeatureRequest().setSubsetOfAttributes([])):
+                if feat.id() in endPointDict:
+                    continue
+                for node in self.getEndPoints(feat.geometry()):
+                    nodeDict.setdefault(node, []).append(None)
+        return nodeDict
+
+    def buildChainList(self, featureDict, keyDict, endPointDict, nodeDict):
+        """
+        Gets the chains (lists of ids in traversal order) of lines with the same attributes that meet at degree 2 nodes.
+        Each line belongs to a single chain, lines that can not be merged are not returned.
+        """
+        # links of each line: the other line of each of its degree 2 nodes
+        linkDict = dict()
+        for node, idList in nodeDict.iteritems():
+            if len(idList) != 2:
+                continue
+            a, b = idList
+            if a is None or b is None or a == b or keyDict[a] != keyDict[b]:
+                continue
+            # multi part lines are not chained
+            if len(endPointDict[a]) != 2 or len(endPointDict[b]) != 2:
+                continue
+            linkDict.setdefault(a, []).append(b)
+            linkDict.setdefault(b, []).append(a)
+        visited = set()
+        chainList = []
+        for id in featureDict:
+            if id in visited or id not in linkDict:
+                continue
+            # walking to one end of the chain (or around a ring)
+            start, previous = id, None
+            while True:
+                nextList = [other for other in linkDict.get(start, []) if other != previous]
+                if len(nextList) == 0 or nextList[0] == id:
+                    break
+                previous, start = start, nextList[0]
+            # walking the chain from that end
+            chain = []
+            current, previous = start, None
+            while current is not None and current not in visited:
+                visited.add(current)
+                chain.append(current)
+                nextList = [other for other in linkDict.get(current, []) if other != previous and other not in visited]
+                previous, current = current, (nextList[0] if len(nextList) > 0 else None)
+            if len(chain) > 1:
+                chainList.append(chain)
+        return chainList
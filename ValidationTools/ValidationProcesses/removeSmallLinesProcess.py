@@ -21,16 +21,19 @@
  ***************************************************************************/
 """
 from qgis.core import QgsMessageLog
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 
 class RemoveSmallLinesProcess(ValidationProcess):
+    modifiesClasses = True
+    processAlias = QT_TRANSLATE_NOOP('RemoveSmallLinesProcess', 'Remove Small Lines')
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Remove Small Lines')
         
         #self.flagsDict = self.abstractDb.getFlagsDictByProcess('IdentifySmallLinesProcess')
         #self.parameters = {'Classes': self.flagsDict.keys()}
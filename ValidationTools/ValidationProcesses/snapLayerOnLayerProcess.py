@@ -21,6 +21,7 @@
  ***************************************************************************/
 """
 from qgis.core import QgsMessageLog, QgsVectorLayer
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.DsgGeometrySnapper.dsgGeometrySnapper import DsgGeometrySnapper
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
@@ -28,12 +29,15 @@ from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 from collections import OrderedDict
 
 class SnapLayerOnLayerProcess(ValidationProcess):
+    modifiesClasses = True
+    processAlias = QT_TRANSLATE_NOOP('SnapLayerOnLayerProcess', 'Snap Layer on Layer')
+    supportsTiling = True
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(SnapLayerOnLayerProcess, self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Snap Layer on Layer')
         
         if not self.instantiating:
             # getting tables with elements
@@ -67,7 +71,7 @@ class SnapLayerOnLayerProcess(ValidationProcess):
             # preparing reference layer
             refcl = self.classesWithElemDict[refKey]
             reflyr = self.loadLayerBeforeValidationProcess(refcl)
-            snapper = DsgGeometrySnapper(reflyr)
+            snapper = DsgGeometrySnapper(reflyr, request = self.getFeatureRequest())
             snapper.featureSnapped.connect(self.updateProgress)
             tol = self.parameters['Snap']
             msg = ''
@@ -83,7 +87,7 @@ class SnapLayerOnLayerProcess(ValidationProcess):
                 if self.parameters['Only Selected']:
                     featureList = lyr.selectedFeatures()
                 else:
-                    featureList = lyr.getFeatures()
+                    featureList = lyr.getFeatures(self.getFeatureRequest())
                 features = [feature for feature in featureList]
                 self.localProgress = ProgressWidget(1, len(features) - 1, self.tr('Processing features on ') + clDict['tableName'], parent=self.iface.mapCanvas())
 
@@ -21,18 +21,21 @@
  ***************************************************************************/
 """
 from qgis.core import QgsMessageLog
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 
 from collections import OrderedDict
 
 class SnapLinesToFrameProcess(ValidationProcess):
+    modifiesClasses = True
+    processAlias = QT_TRANSLATE_NOOP('SnapLinesToFrameProcess', 'Snap Lines to Frame')
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(SnapLinesToFrameProcess,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Snap Lines to Frame')
         
         if not self.instantiating:
             # getting tables with elements
@@ -22,14 +22,14 @@
 """
 import os, binascii
 
-from PyQt4 import QtGui
-from PyQt4.QtCore import pyqtSlot, pyqtSignal
+from PyQt4.QtCore import pyqtSlot, pyqtSignal, QT_TRANSLATE_NOOP
 
 from qgis.core import QgsMessageLog, QgsDataSourceURI, QgsGeometry, QgsFeatureRequest, QgsVectorLayerEditBuffer
 
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 
 class SpatialRuleEnforcer(ValidationProcess):
+    processAlias = QT_TRANSLATE_NOOP('SpatialRuleEnforcer', 'Spatial Rule Enforcer')
     # signal to update flags
     ruleTested = pyqtSignal()
     #this relates the predicate with the methods present in the QgsGeometry class
@@ -54,7 +54,6 @@ class SpatialRuleEnforcer(ValidationProcess):
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
         self.iface = iface
         self.rulesFile = os.path.join(os.path.dirname(__file__), '..', 'ValidationRules', 'ruleLibrary.rul')
-        self.processAlias = self.tr('Spatial Rule Enforcer')
         
     def connectEditingSignals(self):
         """
@@ -280,7 +279,7 @@ class SpatialRuleEnforcer(ValidationProcess):
             with open(self.rulesFile, 'r') as f:
                 rules = [line.rstrip('\n') for line in f]
         except Exception as e:
-            QtGui.QMessageBox.warning(self, self.tr('Warning!'), self.tr('Problem reading file!'))
+            self.showMessage(self.tr('Warning!'), self.tr('Problem reading file!'))
             return
         
         ret = list()
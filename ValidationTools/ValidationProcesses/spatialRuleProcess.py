@@ -22,14 +22,15 @@
 """
 import os
 
-from PyQt4 import QtGui
 
 from qgis.core import QgsMessageLog, QgsDataSourceURI
 
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 
 class SpatialRuleProcess(ValidationProcess):
+    processAlias = QT_TRANSLATE_NOOP('SpatialRuleProcess', 'Spatial Rule Checker')
     #this relates the predicate with the PostGIS ST functions
     predicates = {0:'ST_Equals',
                   1:'ST_Disjoint',
@@ -53,7 +54,9 @@ class SpatialRuleProcess(ValidationProcess):
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
         
         self.rulesFile = os.path.join(os.path.dirname(__file__), '..', 'ValidationRules', 'ruleLibrary.rul')
-        self.processAlias = self.tr('Spatial Rule Checker')
+        
+        if not self.instantiating:
+            self.parameters = {'Check Query Plan':False}
         
     def getRules(self):
         """
@@ -63,7 +66,7 @@ class SpatialRuleProcess(ValidationProcess):
             with open(self.rulesFile, 'r') as f:
                 rules = [line.rstrip('\n') for line in f]
         except Exception as e:
-            QtGui.QMessageBox.warning(self, self.tr('Warning!'), self.tr('Problem reading file!'))
+            self.showMessage(self.tr('Warning!'), self.tr('Problem reading file!'))
             return
         
         ret = list()
@@ -109,7 +112,7 @@ class SpatialRuleProcess(ValidationProcess):
                 #running the process in the temp table
                 localProgress = ProgressWidget(0, 1, self.tr('Running process on ') + class_a, parent=self.iface.mapCanvas())
                 localProgress.step()
-                invalidGeomRecordList = self.abstractDb.testSpatialRule(class_a, rule[1], rule[2], class_b, rule[4], rule[5], rule[6], aKeyColumn, bKeyColumn, aGeomColumn, bGeomColumn)
+                invalidGeomRecordList = self.abstractDb.testSpatialRule(class_a, rule[1], rule[2], class_b, rule[4], rule[5], rule[6], aKeyColumn, bKeyColumn, aGeomColumn, bGeomColumn, checkPlan = self.parameters.get('Check Query Plan', False))
                 localProgress.step()
                                 
                 # dropping temp table
@@ -22,16 +22,18 @@
 """
 import qgis.utils
 from qgis.core import QgsMessageLog, QgsVectorLayer, QgsMapLayerRegistry, QgsGeometry, QgsVectorDataProvider, QgsFeatureRequest, QgsExpression, QgsFeature
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 import processing, binascii
 
 class TopologicalDouglasSimplificationProcess(ValidationProcess):
+    processAlias = QT_TRANSLATE_NOOP('TopologicalDouglasSimplificationProcess', 'Topological Douglas Peucker Simplification')
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(self.__class__,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Topological Douglas Peucker Simplification')
         
         if not self.instantiating:
             # getting tables with elements
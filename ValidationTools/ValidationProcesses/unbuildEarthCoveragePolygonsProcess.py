@@ -23,7 +23,7 @@
 from qgis.core import QgsMessageLog, QgsVectorLayer, QgsMapLayerRegistry, QgsGeometry, QgsField, QgsVectorDataProvider, QgsFeatureRequest, QgsExpression, QgsFeature, QgsSpatialIndex, QGis
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
 from DsgTools.ValidationTools.ValidationProcesses.cleanGeometriesProcess import CleanGeometriesProcess
-from PyQt4.QtCore import QVariant
+from PyQt4.QtCore import QVariant, QT_TRANSLATE_NOOP
 import processing, binascii
 import json
 
@@ -31,12 +31,14 @@ import json
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
 
 class UnbuildEarthCoveragePolygonsProcess(ValidationProcess):
+    modifiesClasses = True
+    processAlias = QT_TRANSLATE_NOOP('UnbuildEarthCoveragePolygonsProcess', 'Unbuild Earth Coverage Polygons')
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
         """
         super(UnbuildEarthCoveragePolygonsProcess,self).__init__(postgisDb, iface, instantiating)
-        self.processAlias = self.tr('Unbuild Earth Coverage Polygons')
         self.instantiating = instantiating
         if not self.instantiating:
             self.earthCoverageDict, self.frameLayer = self.getParametersFromDb()
@@ -22,20 +22,46 @@
 """
 import binascii
 from datetime import datetime
-import json, processing
+from time import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from uuid import uuid4
+import json, hashlib, processing
 # Qt imports
-from PyQt4.QtGui import QMessageBox
-from PyQt4.QtCore import QVariant
+from PyQt4.QtGui import QMessageBox, QApplication
+from PyQt4.QtCore import QVariant, QCoreApplication, QThread, QT_TRANSLATE_NOOP
 from PyQt4.Qt import QObject
 
 #QGIS imports
-from qgis.core import QGis, QgsVectorLayer, QgsCoordinateReferenceSystem, QgsGeometry, QgsFeature, QgsDataSourceURI, QgsFeatureRequest, QgsMessageLog, QgsExpression, QgsField, QgsWKBTypes
+from qgis.core import QGis, QgsVectorLayer, QgsCoordinateReferenceSystem, QgsGeometry, QgsFeature, QgsDataSourceURI, QgsFeatureRequest, QgsMessageLog, QgsExpression, QgsField, QgsWKBTypes, QgsRectangle, QgsMapLayerRegistry
 
 # DSGTools imports
 from DsgTools.Factories.LayerLoaderFactory.layerLoaderFactory import LayerLoaderFactory
 from DsgTools.CustomWidgets.progressWidget import ProgressWidget
+from DsgTools.ValidationTools.unifiedLayerBuilder import UnifiedLayerBuilder
+from DsgTools.Factories.DbFactory.queryLogger import QueryLogger
 
 class ValidationProcess(QObject):
+    # class level metadata, read by ProcessRegistry without importing or instantiating the process
+    processAlias = QT_TRANSLATE_NOOP('ValidationProcess', 'Validation Process')
+    processGroup = 'Ungrouped'
+    # processes that change the classes they read (instead of only raising flags) must set this to True
+    modifiesClasses = False
+    # processes that only raise flags from temp tables built by prepareExecution (no other use of layers, widgets or iface)
+    # may set this to True to run in worker threads, see canRunInWorker
+    parallelSafe = False
+    # processes whose results for a feature only depend on the feature and its neighbours (see prepareExecution)
+    # may set this to True to offer the 'Only Changed Features' parameter
+    supportsIncremental = False
+    # processes that only read features through getFeatureRequest (see mapInputLayer, createUnifiedLayer and getFeatures)
+    # may set this to True to be run tile by tile by TiledExecutor
+    supportsTiling = False
+    # processes that only raise flags, from the classes returned by getClassSet, may set this to True to reuse the
+    # flags of the last execution when data and parameters are unchanged (see getDataFingerprint)
+    supportsResultCache = False
+    # profiling phases (see profilePhase). Client Geometry is the time spent out of the other phases.
+    phaseList = ['Layer Load', 'Temp Table Staging', 'Server SQL', 'Client Geometry', 'Flag Writing', 'Layer Write-back']
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Constructor
@@ -48,7 +74,7 @@ class ValidationProcess(QObject):
         self.parameters = None
         self.iface = iface
         self.layerLoader = LayerLoaderFactory().makeLoader(self.iface, self.abstractDb)
-        self.processAlias = self.tr('Validation Process')
+        self.processAlias = self.getProcessAlias()
         self.instantiating = instantiating
         self.totalTime = 0
         self.startTime = 0
@@ -56,6 +82,26 @@ class ValidationProcess(QObject):
         self.dbUserName = None
         self.logMsg = None
         self.processName = None
+        # incremental runs: {schema.table: ids of the features whose flags and geometries are replaced}
+        self.dirtyIdDict = dict()
+        # {(schema, table): last change id} stored as checkpoints when the process finishes
+        self.dirtyCheckpointDict = dict()
+        # tiled runs (see TiledExecutor): tile geometry, tile extent with overlap, flags of the tile and {className: {id: owner tile}}
+        self.tile = None
+        self.tileExtent = None
+        self.tileFlagList = []
+        self.tileOwnedIdDict = dict()
+        # profiling (see startProfile)
+        self.phaseDict = OrderedDict()
+        self.phaseDepth = 0
+        self.currentPhase = None
+        self.phaseStartTime = 0
+        self.profileStartTime = None
+        self.profileElapsedTime = 0
+        # builders of the unified layers of the current execution (see removeUnifiedLayers)
+        self.unifiedLayerBuilderList = []
+        # temp tables created by prepareExecutionFromDb, dropped by finishedWithError
+        self.workerTempTableList = []
     
     def getFlagLyr(self, dimension):
         if dimension == 0:
@@ -102,11 +148,19 @@ class ValidationProcess(QObject):
         """
         return str(self.__class__).split('.')[-1].replace('\'>', '')
     
-    def getProcessGroup(self):
+    @classmethod
+    def getProcessAlias(cls):
+        """
+        Returns the translated process alias
+        """
+        return QCoreApplication.translate(cls.__name__, cls.processAlias)
+
+    @classmethod
+    def getProcessGroup(cls):
         """
         Returns the process group
         """
-        return 'Ungrouped'
+        return cls.processGroup
     
     def getClassesToBeDisplayedAfterProcess(self):
         """
@@ -139,17 +193,83 @@ class ValidationProcess(QObject):
         """        
         return None
     
+    def getClassSet(self):
+        """
+        Gets the set of tables (schema.table) selected in the Classes (or Reference and Layers) parameter.
+        Returns None when the process has no Classes parameter (i.e. it may use any table).
+        """
+        if not self.parameters:
+            return None
+        if 'Classes' in self.parameters:
+            classList = self.parameters['Classes']
+        elif 'Reference and Layers' in self.parameters and isinstance(self.parameters['Reference and Layers'], (tuple, list)):
+            # (reference key, list of layer keys) as returned by CustomReferenceAndLayersParameterSelector
+            refKey, classList = self.parameters['Reference and Layers']
+            classList = ([refKey] if refKey else []) + list(classList)
+        elif 'Layer and Filter Layers' in self.parameters and isinstance(self.parameters['Layer and Filter Layers'], (tuple, list)):
+            refKey, classList = self.parameters['Layer and Filter Layers']
+            classList = ([refKey] if refKey else []) + list(classList)
+        else:
+            return None
+        classSet = set()
+        for cl in classList:
+            if isinstance(cl, dict):
+                classSet.add('.'.join([cl['tableSchema'], cl['tableName']]))
+            elif cl in getattr(self, 'classesWithElemDict', dict()):
+                classSet.add('.'.join([self.classesWithElemDict[cl]['tableSchema'], self.classesWithElemDict[cl]['tableName']]))
+            else:
+                classSet.add(cl.split(':')[0])
+        return classSet
+
+    def getReadSet(self):
+        """
+        Gets the set of resources (tables and flag sets) read by the process. None means every resource.
+        Used by ValidationScheduler to find processes that can run concurrently.
+        """
+        return self.getClassSet()
+
+    def getWriteSet(self):
+        """
+        Gets the set of resources (tables and flag sets) written by the process. None means every resource.
+        """
+        writeSet = set(['flags:'+self.getName()])
+        if self.modifiesClasses:
+            classSet = self.getClassSet()
+            if classSet is None:
+                return None
+            writeSet |= classSet
+        return writeSet
+
     def addFlag(self, flagTupleList):
         """
         Adds flags
         flagTUpleList: list of tuples to be added as flag
         """
+        if self.tile:
+            # flags are clipped and merged at the tile seams by TiledExecutor
+            self.tileFlagList += flagTupleList
+            return len(flagTupleList)
+        if self.isIncremental():
+            # flags of features outside the changed set were kept (see filterDirtyFeatures)
+            flagTupleList = [flagTuple for flagTuple in flagTupleList if flagTuple[0] not in self.dirtyIdDict or flagTuple[1] in self.dirtyIdDict[flagTuple[0]]]
         try:
-            return self.abstractDb.insertFlags(flagTupleList, self.getName())
+            with self.profilePhase('Flag Writing') as phaseCount:
+                numberOfFlags = self.abstractDb.insertFlags(flagTupleList, self.getName())
+                phaseCount['features'] = len(flagTupleList)
+            return numberOfFlags
         except Exception as e:
-            QMessageBox.critical(None, self.tr('Critical!'), self.tr('A problem occurred inserting flags! Check log for details.'))
+            if self.hasGui():
+                QMessageBox.critical(None, self.tr('Critical!'), self.tr('A problem occurred inserting flags! Check log for details.'))
             QgsMessageLog.logMessage(str(e.args[0]), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
             
+    def deleteProcessFlags(self):
+        """
+        Erases previous flags of the process. In incremental runs only the flags of the changed features are
+        erased, by prepareExecution.
+        """
+        if not self.isIncremental():
+            self.abstractDb.deleteProcessFlags(self.getName())
+
     def removeFeatureFlags(self, layer, featureId):
         """
         Removes specific flags from process
@@ -159,7 +279,8 @@ class ValidationProcess(QObject):
         try:
             return self.abstractDb.removeFeatureFlags(layer, featureId, self.getName())
         except Exception as e:
-            QMessageBox.critical(None, self.tr('Critical!'), self.tr('A problem occurred! Check log for details.'))
+            if self.hasGui():
+                QMessageBox.critical(None, self.tr('Critical!'), self.tr('A problem occurred! Check log for details.'))
             QgsMessageLog.logMessage(':'.join(e.args), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
     
     def getStatus(self):
@@ -169,7 +290,8 @@ class ValidationProcess(QObject):
         try:
             return self.abstractDb.getValidationStatus(self.getName())
         except Exception as e:
-            QMessageBox.critical(None, self.tr('Critical!'), self.tr('A problem occurred! Check log for details.'))
+            if self.hasGui():
+                QMessageBox.critical(None, self.tr('Critical!'), self.tr('A problem occurred! Check log for details.'))
             QgsMessageLog.logMessage(':'.join(e.args), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
     
     def getStatusMessage(self):
@@ -179,9 +301,51 @@ class ValidationProcess(QObject):
         try:
             return self.abstractDb.getValidationStatusText(self.getName())
         except Exception as e:
-            QMessageBox.critical(None, self.tr('Critical!'), self.tr('A problem occurred! Check log for details.'))
+            if self.hasGui():
+                QMessageBox.critical(None, self.tr('Critical!'), self.tr('A problem occurred! Check log for details.'))
             QgsMessageLog.logMessage(':'.join(e.args), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
     
+    def isWorkerThread(self):
+        """
+        Checks whether the process runs in a worker thread (see ValidationScheduler)
+        """
+        return QThread.currentThread() != QCoreApplication.instance().thread()
+
+    def hasGui(self):
+        """
+        Checks whether widgets can be shown: not in the headless runner (QApplication.Tty) nor in worker threads
+        """
+        return QApplication.type() != QApplication.Tty and not self.isWorkerThread()
+
+    def canRunInWorker(self):
+        """
+        Checks, in the GUI thread, whether this parallelSafe process can run in a worker thread now.
+        Workers read the classes straight from the database (see prepareExecutionFromDb), so selected features,
+        incremental runs and layers with unsaved edits need the layers of the GUI thread.
+        """
+        if not self.parallelSafe or not self.parameters or self.parameters.get('Only Selected') or self.isIncremental():
+            return False
+        classSet = self.getClassSet()
+        if classSet is None:
+            return False
+        for lyr in QgsMapLayerRegistry.instance().mapLayers().values():
+            if isinstance(lyr, QgsVectorLayer) and lyr.isModified():
+                uri = QgsDataSourceURI(lyr.dataProvider().dataSourceUri())
+                if '.'.join([uri.schema(), uri.table()]) in classSet:
+                    return False
+        return True
+
+    def showMessage(self, title, msg, critical = False, parent = None):
+        """
+        Shows msg in a message box. Without a GUI (see hasGui) msg is logged instead.
+        """
+        if not self.hasGui():
+            QgsMessageLog.logMessage(msg, "DSG Tools Plugin", QgsMessageLog.CRITICAL if critical else QgsMessageLog.WARNING)
+        elif critical:
+            QMessageBox.critical(parent, title, msg)
+        else:
+            QMessageBox.warning(parent, title, msg)
+
     def setStatus(self, msg, status):
         """
         Sets the status message
@@ -197,7 +361,8 @@ class ValidationProcess(QObject):
                     msg += self.tr("Database username: {}\n").format(self.abstractDb.db.userName())
             self.abstractDb.setValidationProcessStatus(self.getName(), msg, status)
         except Exception as e:
-            QMessageBox.critical(None, self.tr('Critical!'), self.tr('A problem occurred! Check log for details.'))
+            if self.hasGui():
+                QMessageBox.critical(None, self.tr('Critical!'), self.tr('A problem occurred! Check log for details.'))
             QgsMessageLog.logMessage(':'.join(e.args), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
     
     def finishedWithError(self):
@@ -214,6 +379,12 @@ class ValidationProcess(QObject):
                 self.abstractDb.dropTempTable(tempName)
         except:
             pass
+        for tempName in self.workerTempTableList:
+            try:
+                self.abstractDb.dropTempTable(tempName)
+            except:
+                pass
+        self.workerTempTableList = []
         self.clearClassesToBeDisplayedAfterProcess()
     
     def inputData(self):
@@ -237,15 +408,17 @@ class ValidationProcess(QObject):
         the layer is already in edition mode
         """
         #return dict
-        featureMap = dict()
-        #getting only selected features
-        if selectedFeatures:
-            for feat in inputLyr.selectedFeatures():
-                featureMap[feat.id()] = feat
-        #getting all features
-        else:
-            for feat in inputLyr.getFeatures():
-                featureMap[feat.id()] = feat
+        with self.profilePhase('Layer Load') as phaseCount:
+            featureMap = dict()
+            #getting only selected features
+            if selectedFeatures:
+                for feat in inputLyr.selectedFeatures():
+                    featureMap[feat.id()] = feat
+            #getting all features
+            else:
+                for feat in inputLyr.getFeatures(self.getFeatureRequest()):
+                    featureMap[feat.id()] = feat
+            phaseCount['features'] = len(featureMap)
         return featureMap
     
     def updateOriginalLayer(self, pgInputLayer, qgisOutputVector, featureList=None, featureTupleList=None):
@@ -259,57 +432,61 @@ class ValidationProcess(QObject):
         # getting keyColumn because we want to be generic
         uri = QgsDataSourceURI(pgInputLayer.dataProvider().dataSourceUri())
         keyColumn = uri.keyColumn()
-        # starting edition mode
-        pgInputLayer.startEditing()
-        addList = []
-        idsToRemove = []
-        #making the changes and inserts
-        for feature in pgInputLayer.getFeatures():
-            id = feature.id()
-            outFeats = []
-            #getting the output features with the specific id
-            if qgisOutputVector:
-                for gf in qgisOutputVector.dataProvider().getFeatures(QgsFeatureRequest(QgsExpression("{0}={1}".format(keyColumn, id)))):
-                    outFeats.append(gf)
-            elif featureTupleList:
-                for gfid, gf in featureTupleList:
-                    if gfid == id and gf['classname'] == pgInputLayer.name():
+        with self.profilePhase('Layer Write-back') as phaseCount:
+            # starting edition mode
+            pgInputLayer.startEditing()
+            addList = []
+            idsToRemove = []
+            #making the changes and inserts
+            for feature in pgInputLayer.getFeatures():
+                id = feature.id()
+                outFeats = []
+                #getting the output features with the specific id
+                if qgisOutputVector:
+                    for gf in qgisOutputVector.dataProvider().getFeatures(QgsFeatureRequest(QgsExpression("{0}={1}".format(keyColumn, id)))):
                         outFeats.append(gf)
-            else:
-                for gf in [gf for gf in featureList if gf.id() == id]:
-                    outFeats.append(gf)
-            #starting to make changes
-            for i in range(len(outFeats)):
-                if i == 0:
-                    #let's update this feature
-                    newGeom = outFeats[i].geometry()
-                    newGeom.convertToMultiType()
-                    feature.setGeometry(newGeom)
-                    pgInputLayer.updateFeature(feature)
+                elif featureTupleList:
+                    for gfid, gf in featureTupleList:
+                        if gfid == id and gf['classname'] == pgInputLayer.name():
+                            outFeats.append(gf)
                 else:
-                    #for the rest, let's add them
-                    newFeat = QgsFeature(feature)
-                    newGeom = outFeats[i].geometry()
-                    newGeom.convertToMultiType()
-                    newFeat.setGeometry(newGeom)
-                    idx = newFeat.fieldNameIndex(keyColumn)
-                    newFeat.setAttribute(idx, provider.defaultValue(idx))
-                    addList.append(newFeat)
-            #in the case we don't find features in the output we should mark them to be removed
-            if len(outFeats) == 0:
-                idsToRemove.append(id)
-        #pushing the changes into the edit buffer
-        pgInputLayer.addFeatures(addList, True)
-        #removing features from the layer.
-        pgInputLayer.deleteFeatures(idsToRemove)
-
-    def updateOriginalLayerV2(self, pgInputLayer, qgisOutputVector, featureList=None, featureTupleList=None, deleteFeatures = True):
+                    for gf in [gf for gf in featureList if gf.id() == id]:
+                        outFeats.append(gf)
+                #starting to make changes
+                for i in range(len(outFeats)):
+                    if i == 0:
+                        #let's update this feature
+                        newGeom = outFeats[i].geometry()
+                        newGeom.convertToMultiType()
+                        feature.setGeometry(newGeom)
+                        pgInputLayer.updateFeature(feature)
+                    else:
+                        #for the rest, let's add them
+                        newFeat = QgsFeature(feature)
+                        newGeom = outFeats[i].geometry()
+                        newGeom.convertToMultiType()
+                        newFeat.setGeometry(newGeom)
+                        idx = newFeat.fieldNameIndex(keyColumn)
+                        newFeat.setAttribute(idx, provider.defaultValue(idx))
+                        addList.append(newFeat)
+                #in the case we don't find features in the output we should mark them to be removed
+                if len(outFeats) == 0:
+                    idsToRemove.append(id)
+            #pushing the changes into the edit buffer
+            pgInputLayer.addFeatures(addList, True)
+            #removing features from the layer.
+            pgInputLayer.deleteFeatures(idsToRemove)
+            phaseCount['features'] = pgInputLayer.pendingFeatureCount()
+
+    def updateOriginalLayerV2(self, pgInputLayer, qgisOutputVector, featureList=None, featureTupleList=None, deleteFeatures = True, onlyChanged = True):
         """
         Updates the original layer using the grass output layer
         pgInputLyr: postgis input layer
         qgisOutputVector: qgis output layer
+        onlyChanged: compares the WKB hashes of input and output geometries and only changes the features whose geometry changed,
+        so that the edit buffer, the undo stack and the commit only hold the actual changes
         Speed up tips: http://nyalldawson.net/2016/10/speeding-up-your-pyqgis-scripts/
-        1- Make pgIdList, by querying it with flag QgsFeatureRequest.NoGeometry
+        1- Make pgIdList, by querying it with flag QgsFeatureRequest.NoGeometry (with geometry when onlyChanged)
         2- Build output dict
         3- Perform operation
         """
@@ -317,80 +494,105 @@ class ValidationProcess(QObject):
         # getting keyColumn because we want to be generic
         uri = QgsDataSourceURI(pgInputLayer.dataProvider().dataSourceUri())
         keyColumn = uri.keyColumn()
-        # starting edition mode
-        pgInputLayer.startEditing()
-        pgInputLayer.beginEditCommand('Updating layer')
-        addList = []
-        idsToRemove = []
-        inputDict = dict()
-        #this is done to work generically with output layers that are implemented different from ours
-        isMulti = QgsWKBTypes.isMultiType(int(pgInputLayer.wkbType())) #
-        #making the changes and inserts
-        #this request only takes ids to build inputDict
-        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry)
-        for feature in pgInputLayer.getFeatures(request):
-            inputDict[feature.id()] = dict()
-            inputDict[feature.id()]['featList'] = []
-            inputDict[feature.id()]['featWithoutGeom'] = feature
-        inputDictKeys = inputDict.keys()
-        if qgisOutputVector:
-            for feat in qgisOutputVector.dataProvider().getFeatures():
-                if keyColumn == '':
-                    featid = feat.id()
-                else:
-                    featid = feat[keyColumn]
-                if featid in inputDictKeys: #verificar quando keyColumn = ''
-                    inputDict[featid]['featList'].append(feat)
-        elif featureTupleList:
-            for gfid, gf in featureTupleList:
-                if gfid in inputDictKeys and gf['classname'] == pgInputLayer.name():
-                    inputDict[gfid]['featList'].append(gf)
-        else:
-            for feat in featureList:
-                if keyColumn == '':
-                    featid = feat.id()
-                else:
-                    featid = feat[keyColumn]
-                if featid in inputDictKeys:
-                    inputDict[featid]['featList'].append(feat)
-        #finally, do what must be done
-        for id in inputDictKeys:
-            outFeats = inputDict[id]['featList']
-            #starting to make changes
-            for i in range(len(outFeats)):
-                if i == 0:
-                    #let's update this feature
-                    newGeom = outFeats[i].geometry()
-                    if newGeom:
-                        if isMulti:
-                            newGeom.convertToMultiType()
-                        pgInputLayer.changeGeometry(id, newGeom) #It is faster according to the api
+        with self.profilePhase('Layer Write-back') as phaseCount:
+            # starting edition mode
+            pgInputLayer.startEditing()
+            pgInputLayer.beginEditCommand('Updating layer')
+            addList = []
+            idsToRemove = set()
+            inputDict = dict()
+            # WKB hashes of the input geometries (onlyChanged)
+            inputHashDict = dict()
+            changedCount = 0
+            #this is done to work generically with output layers that are implemented different from ours
+            isMulti = QgsWKBTypes.isMultiType(int(pgInputLayer.wkbType())) #
+            #making the changes and inserts
+            #this request only takes ids to build inputDict
+            request = QgsFeatureRequest()
+            if not onlyChanged:
+                request.setFlags(QgsFeatureRequest.NoGeometry)
+            className = '.'.join([uri.schema(), uri.table()])
+            if className in self.dirtyIdDict:
+                # incremental run: features outside the changed set are not in the output and must be kept
+                request.setFilterFids(list(self.dirtyIdDict[className]))
+            if self.tile:
+                # tiled run: only features owned by the tile are changed
+                request = self.getFeatureRequest(request.setFlags(QgsFeatureRequest.NoFlags))
+            for feature in pgInputLayer.getFeatures(request):
+                if self.tile and not self.isOwnedByTile(className, feature):
+                    continue
+                inputDict[feature.id()] = dict()
+                inputDict[feature.id()]['featList'] = []
+                inputDict[feature.id()]['featWithoutGeom'] = feature
+                if onlyChanged:
+                    geom = feature.geometry()
+                    inputHashDict[feature.id()] = hash(geom.asWkb()) if geom else None
+            if qgisOutputVector:
+                for feat in qgisOutputVector.dataProvider().getFeatures():
+                    if keyColumn == '':
+                        featid = feat.id()
                     else:
-                        if id not in idsToRemove:
-                            idsToRemove.append(id)
-                else:
-                    #for the rest, let's add them
-                    newFeat = QgsFeature(inputDict[id]['featWithoutGeom'])
-                    newGeom = outFeats[i].geometry()
-                    if newGeom:
-                        if isMulti and newGeom:
-                            newGeom.convertToMultiType()
-                        newFeat.setGeometry(newGeom)
-                        if keyColumn != '':
-                            idx = newFeat.fieldNameIndex(keyColumn)
-                            newFeat.setAttribute(idx, provider.defaultValue(idx))
-                        addList.append(newFeat)
+                        featid = feat[keyColumn]
+                    if featid in inputDict: #verificar quando keyColumn = ''
+                        inputDict[featid]['featList'].append(feat)
+            elif featureTupleList:
+                for gfid, gf in featureTupleList:
+                    if gfid in inputDict and gf['classname'] == pgInputLayer.name():
+                        inputDict[gfid]['featList'].append(gf)
+            else:
+                for feat in featureList:
+                    if keyColumn == '':
+                        featid = feat.id()
+                    else:
+                        featid = feat[keyColumn]
+                    if featid in inputDict:
+                        inputDict[featid]['featList'].append(feat)
+            #finally, do what must be done
+            for id in inputDict:
+                outFeats = inputDict[id]['featList']
+                #starting to make changes
+                for i in range(len(outFeats)):
+                    if i == 0:
+                        #let's update this feature
+                        newGeom = outFeats[i].geometry()
+                        if newGeom:
+                            if isMulti:
+                                newGeom.convertToMultiType()
+                            if onlyChanged and inputHashDict[id] == hash(newGeom.asWkb()):
+                                continue
+                            pgInputLayer.changeGeometry(id, newGeom) #It is faster according to the api
+                            changedCount += 1
+                        else:
+                            idsToRemove.add(id)
                     else:
-                        if id not in idsToRemove:
-                            idsToRemove.append(id)
-            #in the case we don't find features in the output we should mark them to be removed
-            if len(outFeats) == 0 and deleteFeatures:
-                idsToRemove.append(id)
-        #pushing the changes into the edit buffer
-        pgInputLayer.addFeatures(addList, True)
-        #removing features from the layer.
-        pgInputLayer.deleteFeatures(idsToRemove)
-        pgInputLayer.endEditCommand()
+                        #for the rest, let's add them
+                        newFeat = QgsFeature(inputDict[id]['featWithoutGeom'])
+                        newGeom = outFeats[i].geometry()
+                        if newGeom:
+                            if isMulti and newGeom:
+                                newGeom.convertToMultiType()
+                            newFeat.setGeometry(newGeom)
+                            if keyColumn != '':
+                                idx = newFeat.fieldNameIndex(keyColumn)
+                                newFeat.setAttribute(idx, provider.defaultValue(idx))
+                            addList.append(newFeat)
+                        else:
+                            idsToRemove.add(id)
+                #in the case we don't find features in the output we should mark them to be removed
+                if len(outFeats) == 0 and deleteFeatures:
+                    idsToRemove.add(id)
+            if changedCount + len(addList) + len(idsToRemove) == 0:
+                # nothing changed, no empty command on the undo stack
+                pgInputLayer.destroyEditCommand()
+            else:
+                #pushing the changes into the edit buffer
+                pgInputLayer.addFeatures(addList, True)
+                #removing features from the layer.
+                pgInputLayer.deleteFeatures(list(idsToRemove))
+                pgInputLayer.endEditCommand()
+            if onlyChanged:
+                QgsMessageLog.logMessage(self.tr('{0}: {1} of {2} features changed, {3} added and {4} removed.').format(pgInputLayer.name(), changedCount, len(inputDict), len(addList), len(idsToRemove)), "DSG Tools Plugin", QgsMessageLog.INFO)
+            phaseCount['features'] = len(inputDict)
 
     def getProcessingErrors(self, layer):
         """
@@ -407,15 +609,16 @@ class ValidationProcess(QObject):
         Loads all layers to QGIS' TOC prior the validation process
         """
         #creating vector layer
-        if self.abstractDb.getDatabaseVersion() == 'Non_EDGV':
-            isEdgv = False
-        else:
-            isEdgv = True
-        if isinstance(cl, dict):
-            lyr = self.layerLoader.load([cl], uniqueLoad=True, isEdgv=isEdgv)[cl['lyrName']]
-        else:
-            schema, layer_name = self.abstractDb.getTableSchema(cl)
-            lyr = self.layerLoader.load([layer_name], uniqueLoad=True, isEdgv=isEdgv)[layer_name]
+        with self.profilePhase('Layer Load') as phaseCount:
+            if self.abstractDb.getDatabaseVersion() == 'Non_EDGV':
+                isEdgv = False
+            else:
+                isEdgv = True
+            if isinstance(cl, dict):
+                lyr = self.layerLoader.load([cl], uniqueLoad=True, isEdgv=isEdgv)[cl['lyrName']]
+            else:
+                schema, layer_name = self.abstractDb.getTableSchema(cl)
+                lyr = self.layerLoader.load([layer_name], uniqueLoad=True, isEdgv=isEdgv)[layer_name]
         return lyr
     
     def prepareExecution(self, cl, geometryColumn='geom', selectedFeatures = False):
@@ -423,6 +626,8 @@ class ValidationProcess(QObject):
         Prepare the process to be executed
         cl: table name
         """
+        if self.isWorkerThread():
+            return self.prepareExecutionFromDb(cl, geometryColumn)
         # loading layer prior to execution
         lyr = self.loadLayerBeforeValidationProcess(cl)
         # getting keyColumn because we want to be generic
@@ -445,10 +650,216 @@ class ValidationProcess(QObject):
         # specific EPSG search
         parameters = {'tableSchema':tableSchema, 'tableName':tableName, 'geometryColumn':geometryColumn}
         srid = self.abstractDb.findEPSG(parameters=parameters)
+        if self.supportsIncremental:
+            featureMap = self.filterDirtyFeatures(lyr, featureMap, tableSchema, tableName, keyColumn, geometryColumn, srid)
         #creating temp table
-        self.abstractDb.createAndPopulateTempTableFromMap(fullTableName, featureMap, geometryColumn, keyColumn, srid)
+        with self.profilePhase('Temp Table Staging') as phaseCount:
+            self.abstractDb.createAndPopulateTempTableFromMap(fullTableName, featureMap, geometryColumn, keyColumn, srid)
+            phaseCount['features'] = len(featureMap)
         return processTableName, lyr, keyColumn
     
+    def prepareExecutionFromDb(self, cl, geometryColumn='geom'):
+        """
+        Prepares the execution in a worker thread (see canRunInWorker): the class (only the features of the current tile,
+        if any) is copied into a temp table on the server, without loading its layer. Returns (temp table name, None, key column).
+        cl: table name
+        """
+        if isinstance(cl, dict):
+            tableSchema = cl['tableSchema']
+            tableName = cl['tableName']
+            geometryColumn = cl['geom']
+        else:
+            tableSchema, tableName = cl.split('.')
+        keyColumn = self.abstractDb.getPrimaryKeyColumn('{0}.{1}'.format(tableSchema, tableName)) or 'id'
+        extent = None
+        if self.tileExtent:
+            srid = self.abstractDb.findEPSG(parameters={'tableSchema':tableSchema, 'tableName':tableName, 'geometryColumn':geometryColumn})
+            extent = (self.tileExtent.xMinimum(), self.tileExtent.yMinimum(), self.tileExtent.xMaximum(), self.tileExtent.yMaximum(), srid)
+        # concurrent processes may read the same class, so each one gets a temp table of its own
+        processTableName = '{0}.{1}_{2}_temp'.format(tableSchema, tableName[:40], uuid4().hex[:8])
+        self.workerTempTableList.append(processTableName)
+        with self.profilePhase('Temp Table Staging'):
+            self.abstractDb.createTempTableFromTable(tableSchema, tableName, processTableName.split('.')[1], geometryColumn, extent = extent)
+        return processTableName, None, keyColumn
+
+    def isIncremental(self):
+        return self.supportsIncremental and bool(self.parameters) and self.parameters.get('Only Changed Features', False)
+
+    def getIncrementalRadius(self):
+        """
+        Distance used to find the neighbours of changed features. Must be reimplemented by processes that
+        compare features that do not touch (e.g. by a tolerance).
+        """
+        return 0
+
+    def getEditBufferChanges(self, lyr):
+        """
+        Gets the ids of features changed in the edit buffer of lyr and the hex WKB of their new and committed geometries
+        """
+        editBuffer = lyr.editBuffer()
+        if not editBuffer:
+            return set(), []
+        idSet = set(editBuffer.addedFeatures().keys()) | set(editBuffer.changedGeometries().keys()) | set(editBuffer.changedAttributeValues().keys()) | set(editBuffer.deletedFeatureIds())
+        geomList = [feat.geometry() for feat in editBuffer.addedFeatures().values()] + editBuffer.changedGeometries().values()
+        committedIdList = [id for id in idSet if id >= 0]
+        if len(committedIdList) > 0:
+            request = QgsFeatureRequest().setFilterFids(committedIdList)
+            geomList += [feat.geometry() for feat in lyr.dataProvider().getFeatures(request)]
+        wkbList = [binascii.hexlify(geom.asWkb()) for geom in geomList if geom and not geom.isEmpty()]
+        return idSet, wkbList
+
+    def filterDirtyFeatures(self, lyr, featureMap, tableSchema, tableName, keyColumn, geometryColumn, srid):
+        """
+        When 'Only Changed Features' is set, restricts featureMap to the features changed since the last run of the
+        process (committed changes are recorded by a trigger, uncommitted ones are read from the edit buffer), their
+        neighbours and the neighbours of those, and erases the flags of the changed features and their neighbours.
+        Also gets the checkpoint stored when the process finishes (see setDirtyFeatureCheckpoints).
+        """
+        className = '.'.join([tableSchema, tableName])
+        self.dirtyIdDict.pop(className, None)
+        if keyColumn == '':
+            if self.isIncremental():
+                # without a key changes cannot be tracked: the class is validated in full, so its flags are replaced
+                self.abstractDb.deleteProcessFlags(self.getName(), className)
+            return featureMap
+        trackingEnabled = self.abstractDb.isDirtyFeatureTrackingEnabled(tableSchema, tableName)
+        if self.isIncremental() and not trackingEnabled:
+            if self.parameters.get('Enable Change Tracking', False):
+                # triggers are only installed when explicitly asked (and confirmed, see ValidationManager.confirmChangeTracking)
+                self.abstractDb.enableDirtyFeatureTracking(tableSchema, tableName, keyColumn, geometryColumn)
+                trackingEnabled = True
+            else:
+                QgsMessageLog.logMessage(self.tr('{0}: changes of {1} are not tracked, every feature is validated. Set Enable Change Tracking to validate only changed features.').format(self.getName(), className), "DSG Tools Plugin", QgsMessageLog.INFO)
+        if not self.isIncremental() or not trackingEnabled or self.abstractDb.getDirtyFeatureCheckpoint(self.getName(), tableSchema, tableName) is None:
+            if self.isIncremental():
+                # full validation of the class (untracked class or first incremental run of the process): deleteProcessFlags
+                # keeps the flags of incremental runs, so they are replaced here. Tracked changes are read from now on.
+                self.abstractDb.deleteProcessFlags(self.getName(), className)
+            if trackingEnabled:
+                self.dirtyCheckpointDict[(tableSchema, tableName)] = self.abstractDb.getDirtyFeatureLastChangeId(tableSchema, tableName)
+            return featureMap
+        lastChangeId = self.abstractDb.getDirtyFeatureLastChangeId(tableSchema, tableName)
+        self.dirtyCheckpointDict[(tableSchema, tableName)] = lastChangeId
+        editIdSet, wkbList = self.getEditBufferChanges(lyr)
+        replacedIdSet, contextIdSet = self.abstractDb.getDirtyFeatureIds(tableSchema, tableName, keyColumn, geometryColumn, self.getName(), lastChangeId, self.getIncrementalRadius(), srid, wkbList)
+        replacedIdSet |= editIdSet
+        contextIdSet -= replacedIdSet
+        self.abstractDb.deleteFeatureFlags(self.getName(), className, [id for id in replacedIdSet if id >= 0])
+        self.dirtyIdDict[className] = replacedIdSet
+        QgsMessageLog.logMessage(self.tr('{0}: {1} of {2} features of {3} changed or are near changed features.').format(self.getName(), len(replacedIdSet), len(featureMap), className), "DSG Tools Plugin", QgsMessageLog.INFO)
+        return {id : feat for id, feat in featureMap.iteritems() if id in replacedIdSet or id in contextIdSet}
+
+    def setDirtyFeatureCheckpoints(self):
+        """
+        Marks the changes read by the process as validated. Called after the process finishes successfully.
+        """
+        for (tableSchema, tableName), lastChangeId in self.dirtyCheckpointDict.iteritems():
+            self.abstractDb.setDirtyFeatureCheckpoint(self.getName(), tableSchema, tableName, lastChangeId)
+        self.dirtyCheckpointDict = dict()
+
+    def hasUncommittedChanges(self, classSet):
+        """
+        Checks if a loaded layer of a class of classSet (schema.table) has uncommitted changes
+        """
+        for lyr in QgsMapLayerRegistry.instance().mapLayers().values():
+            if not isinstance(lyr, QgsVectorLayer) or lyr.providerType() != 'postgres' or not lyr.isModified():
+                continue
+            uri = QgsDataSourceURI(lyr.dataProvider().dataSourceUri())
+            if '.'.join([uri.schema(), uri.table()]) in classSet:
+                return True
+        return False
+
+    def getDataFingerprint(self):
+        """
+        Gets the fingerprint of an execution: process name, parameters and the fingerprint of each class
+        (see AbstractDb.getTableFingerprint). Returns None when the results can not be reused.
+        """
+        if not self.supportsResultCache or not self.parameters or self.parameters.get('Only Selected', False):
+            return None
+        classSet = self.getClassSet()
+        if not classSet or self.hasUncommittedChanges(classSet):
+            return None
+        tableFingerprintList = []
+        for className in sorted(classSet):
+            tableSchema, tableName = className.split('.')
+            tableFingerprint = self.abstractDb.getTableFingerprint(tableSchema, tableName)
+            if tableFingerprint is None:
+                return None
+            tableFingerprintList.append([className] + tableFingerprint)
+        fingerprint = json.dumps([self.getName(), self.parameters, tableFingerprintList], sort_keys=True, default=unicode)
+        return hashlib.md5(fingerprint.encode('utf-8')).hexdigest()
+
+    def reuseCachedResult(self, fingerprint):
+        """
+        Reuses the flags of the last execution when it had the same fingerprint and its flags were not changed since.
+        Returns True when the flags were reused.
+        """
+        cache = self.abstractDb.getValidationProcessCache(self.getName())
+        if cache is None:
+            return False
+        status, lastFingerprint, flagCount = cache
+        if lastFingerprint != fingerprint or status not in [1, 4]:
+            return False
+        if flagCount != self.abstractDb.getNumberOfFlagsByProcess(self.getName()):
+            return False
+        QgsMessageLog.logMessage(self.tr('Data and parameters of process {0} did not change since its last execution, reusing its results.').format(self.processAlias), "DSG Tools Plugin", QgsMessageLog.INFO)
+        if flagCount > 0:
+            self.setStatus(self.tr('{0} flags of the last execution kept, data did not change. Check flags.').format(flagCount), 4) #Finished with flags
+        else:
+            self.setStatus(self.tr('No flags raised on the last execution, data did not change.'), 1) #Finished
+        return True
+
+    def setTile(self, tile, overlap = 0):
+        """
+        Restricts the process to the features that intersect tile (QgsGeometry) enlarged by overlap.
+        tile: None to run on every feature
+        """
+        self.tile = tile
+        self.tileFlagList = []
+        if tile is None:
+            self.tileExtent = None
+            return
+        rect = tile.boundingBox()
+        self.tileExtent = QgsRectangle(rect.xMinimum() - overlap, rect.yMinimum() - overlap, rect.xMaximum() + overlap, rect.yMaximum() + overlap)
+
+    def getTileCopy(self, tile, overlap = 0):
+        """
+        Gets a copy of the process restricted to tile (see setTile), so that tiles run concurrently (see TiledExecutor).
+        The copy shares the parameters and the class metadata of this process, and has tile flags and temp tables of its own.
+        """
+        tileProcess = self.__class__(self.abstractDb, self.iface, instantiating = True)
+        tileProcess.__dict__.update(self.__dict__)
+        tileProcess.unifiedLayerBuilderList = []
+        tileProcess.workerTempTableList = []
+        # the copy runs out of startProfile, its phases are counted as the tiles wall time
+        tileProcess.phaseDict = OrderedDict()
+        tileProcess.phaseDepth = 0
+        tileProcess.currentPhase = None
+        tileProcess.setTile(tile, overlap)
+        return tileProcess
+
+    def getFeatureRequest(self, request = None):
+        """
+        Gets a feature request restricted to the current tile (if any)
+        """
+        if request is None:
+            request = QgsFeatureRequest()
+        if self.tileExtent:
+            request.setFilterRect(self.tileExtent)
+        return request
+
+    def isOwnedByTile(self, className, feature):
+        """
+        Each feature is changed by a single tile: the first one that contains the center of its bounding box
+        """
+        ownerDict = self.tileOwnedIdDict.setdefault(className, dict())
+        if feature.id() in ownerDict:
+            return ownerDict[feature.id()] is self.tile
+        if not feature.geometry() or not self.tile.intersects(QgsGeometry.fromPoint(feature.geometry().boundingBox().center())):
+            return False
+        ownerDict[feature.id()] = self.tile
+        return True
+
     def postProcessSteps(self, processTableName, lyr):
         """
         Execute the final steps after the actual process
@@ -476,115 +887,71 @@ class ValidationProcess(QObject):
         else:
             raise Exception(self.tr('Operation not defined with provided geometry type!'))
     
-    def createUnifiedLineLayer(self, layerList, onlySelected = False):
+    def createUnifiedLineLayer(self, layerList, onlySelected = False, storage = UnifiedLayerBuilder.geopackageStorage):
         """
         For each layer in layerList, transforms it into lines if lyrType 
         is polygon and adds features into layerList.
         Duplicates can happen in this process.
+        The layer is not added to the map (see UnifiedLayerBuilder).
         """
         srid = layerList[0].crs().authid().split(':')[-1]
-        coverage = self.iface.addVectorLayer("{0}?crs=epsg:{1}".format('Linestring',srid), "coverage_lines", "memory")
-        provider = coverage.dataProvider()
-        coverage.startEditing()
-        coverage.beginEditCommand('Creating coverage lines layer')
-
+        builder = UnifiedLayerBuilder(QGis.WKBLineString, srid, asLines = True, storage = storage, name = 'coverage_lines')
+        self.unifiedLayerBuilderList.append(builder)
         self.localProgress = ProgressWidget(1, len(layerList) - 1, self.tr('Building unified layers with  ') + ', '.join([i.name() for i in layerList])+'.', parent=self.iface.mapCanvas())
-        addFeatureList = []
         for lyr in layerList:
-            isPolygon = True if lyr.dataProvider().geometryType() in [QGis.WKBPolygon, QGis.WKBMultiPolygon] else False
-            isMulti = QgsWKBTypes.isMultiType(int(lyr.wkbType()))
             featureIterator = lyr.getFeatures() if not onlySelected else lyr.selectedFeatures()
-            for feature in featureIterator:
-                geom = feature.geometry()
-                if geom:
-                    parts = geom.asGeometryCollection()
-                    if parts:
-                        for part in parts:
-                            if isPolygon:
-                                linestrings = part.asPolygon()
-                                for line in linestrings:
-                                    newfeat = QgsFeature(coverage.pendingFields())
-                                    newfeat.setGeometry(QgsGeometry.fromPolyline(line))
-                                    addFeatureList.append(newfeat)
-                            else:
-                                newfeat = QgsFeature(coverage.pendingFields())
-                                newfeat.setGeometry(part)
-                                addFeatureList.append(newfeat)
+            builder.addLayer(lyr, featureIterator)
             self.localProgress.step()
-        coverage.addFeatures(addFeatureList, True)
-        coverage.endEditCommand()
-        coverage.commitChanges()
-        return coverage
+        return builder.getLayer()
 
-    def createUnifiedLayer(self, layerList, attributeTupple = False, attributeBlackList = '', onlySelected = False):
-        """
-        Creates a unified layer from a list of layers
-        """
+    def getUnifiedLayerBuilder(self, layerList, attributeTupple = False, attributeBlackList = '', storage = UnifiedLayerBuilder.memoryStorage):
         #getting srid from something like 'EPSG:31983'
         srid = layerList[0].crs().authid().split(':')[-1] #quem disse que tudo tem que ter mesmo srid? TODO: mudar isso
-        # creating the layer
         geomtype = layerList[0].dataProvider().geometryType()
         for lyr in layerList:
             if lyr.dataProvider().geometryType() != geomtype:
                 raise Exception(self.tr('Error! Different geometry primitives!'))
-
-        coverage = self.iface.addVectorLayer("{0}?crs=epsg:{1}".format(self.getGeometryTypeText(geomtype),srid), "coverage", "memory")
-        provider = coverage.dataProvider()
-        coverage.startEditing()
-        coverage.beginEditCommand('Creating coverage layer') #speedup
-
-        #defining fields
-        if not attributeTupple:
-            fields = [QgsField('featid', QVariant.Int), QgsField('classname', QVariant.String)]
-        else:
-            fields = [QgsField('featid', QVariant.Int), QgsField('classname', QVariant.String), QgsField('tupple', QVariant.String), QgsField('blacklist', QVariant.String)]
-        provider.addAttributes(fields)
-        coverage.updateFields()
-
-        totalCount = 0
-        for layer in layerList:
-            if onlySelected:
-                totalCount += layer.selectedFeatureCount()
-            else:
-                totalCount += layer.pendingFeatureCount()
-        self.localProgress = ProgressWidget(1, totalCount - 1, self.tr('Building unified layers with  ') + ', '.join([i.name() for i in layerList])+'.', parent=self.iface.mapCanvas())
-        featlist = []
         if attributeBlackList != '':
             bList = attributeBlackList.replace(' ','').split(',')
         else:
             bList = []
+        return UnifiedLayerBuilder(geomtype, srid, attributeTupple = attributeTupple, attributeBlackList = bList, storage = storage)
+
+    def getUnifiedFeatures(self, layerList, attributeTupple = False, attributeBlackList = '', onlySelected = False):
+        """
+        Yields the features of the unified layer of layerList (see createUnifiedLayer) without building the layer
+        """
+        builder = self.getUnifiedLayerBuilder(layerList, attributeTupple = attributeTupple, attributeBlackList = attributeBlackList)
         for layer in layerList:
-            # recording class name
-            classname = layer.name()
-            uri = QgsDataSourceURI(layer.dataProvider().dataSourceUri())
-            keyColumn = uri.keyColumn()
-            if onlySelected:
-                featureList = layer.selectedFeatures()
-            else:
-                featureList = layer.getFeatures()
-            for feature in featureList:
-                newfeat = QgsFeature(coverage.pendingFields())
-                newfeat.setGeometry(feature.geometry())
-                newfeat['featid'] = feature.id()
-                newfeat['classname'] = classname
-                if attributeTupple:
-                    attributeList = []
-                    attributes = [field.name() for field in feature.fields() if (field.type() != 6 and field.name() != keyColumn)]
-                    attributes.sort()
-                    for attribute in attributes:
-                        if attribute not in bList:
-                            attributeList.append(u'{0}'.format(feature[attribute])) #done due to encode problems
-                    tup = ','.join(attributeList)
-                    newfeat['tupple'] = tup
-                featlist.append(newfeat)
+            featureIterator = layer.selectedFeatures() if onlySelected else layer.getFeatures(self.getFeatureRequest())
+            for newfeat in builder.iterLayerFeatures(layer, featureIterator):
+                yield newfeat
+
+    def createUnifiedLayer(self, layerList, attributeTupple = False, attributeBlackList = '', onlySelected = False, storage = UnifiedLayerBuilder.geopackageStorage):
+        """
+        Creates a unified layer from a list of layers.
+        Features are written in batches to a temporary GeoPackage (or memory layer) that is not added to the map.
+        """
+        with self.profilePhase('Temp Table Staging') as phaseCount:
+            builder = self.getUnifiedLayerBuilder(layerList, attributeTupple = attributeTupple, attributeBlackList = attributeBlackList, storage = storage)
+            self.unifiedLayerBuilderList.append(builder)
+            self.localProgress = ProgressWidget(1, len(layerList) - 1, self.tr('Building unified layers with  ') + ', '.join([i.name() for i in layerList])+'.', parent=self.iface.mapCanvas())
+            for layer in layerList:
+                featureIterator = layer.selectedFeatures() if onlySelected else layer.getFeatures(self.getFeatureRequest())
+                builder.addLayer(layer, featureIterator)
                 self.localProgress.step()
-        
-        #inserting new features into layer
-        coverage.addFeatures(featlist, False)
-        coverage.endEditCommand()
-        coverage.commitChanges()
+            coverage = builder.getLayer()
+            phaseCount['features'] = builder.featureCount
         return coverage
 
+    def removeUnifiedLayers(self):
+        """
+        Removes the temporary files of the unified layers built during the execution
+        """
+        for builder in self.unifiedLayerBuilderList:
+            builder.cleanUp()
+        self.unifiedLayerBuilderList = []
+
     def splitUnifiedLayer(self, outputLayer, layerList):
         """
         Updates all original layers making requests with the class name
@@ -612,6 +979,87 @@ class ValidationProcess(QObject):
                 self.totalTime += elapsedTime
         return elapsedTime
 
+    def startProfile(self):
+        """
+        Starts the per phase profile of an execution. Time spent by queries out of other phases is counted as Server SQL.
+        """
+        self.phaseDict = OrderedDict([(phase, {'elapsed' : 0.0, 'features' : 0}) for phase in self.phaseList])
+        self.phaseDepth = 0
+        self.currentPhase = None
+        self.profileStartTime = time()
+        QueryLogger.setQueryListener(self.recordQueryTime)
+
+    def endProfile(self):
+        QueryLogger.setQueryListener(None)
+        if self.profileStartTime is not None:
+            self.profileElapsedTime = time() - self.profileStartTime
+            self.profileStartTime = None
+
+    def startPhase(self, phase):
+        """
+        Starts counting time for a phase (of phaseList). Nested phases are counted in the outermost one.
+        Prefer profilePhase, which always ends the phase.
+        """
+        if phase not in self.phaseDict:
+            return
+        self.phaseDepth += 1
+        if self.phaseDepth == 1:
+            self.currentPhase = phase
+            self.phaseStartTime = time()
+
+    def endPhase(self, phase, featureCount = 0):
+        """
+        Ends a phase started by startPhase
+        featureCount: number of features handled in the phase
+        """
+        if self.phaseDepth == 0 or phase not in self.phaseDict:
+            return
+        self.phaseDepth -= 1
+        self.phaseDict[phase]['features'] += featureCount
+        if self.phaseDepth == 0:
+            self.phaseDict[self.currentPhase]['elapsed'] += time() - self.phaseStartTime
+            self.currentPhase = None
+
+    @contextmanager
+    def profilePhase(self, phase):
+        """
+        Counts the time of the enclosed block as a phase (see startPhase), ending the phase even when the block raises.
+        Yields a dict whose 'features' key is set with the number of features handled in the phase.
+        """
+        phaseCount = {'features' : 0}
+        self.startPhase(phase)
+        try:
+            yield phaseCount
+        finally:
+            self.endPhase(phase, phaseCount['features'])
+
+    def recordQueryTime(self, elapsed):
+        if self.currentPhase is None and 'Server SQL' in self.phaseDict:
+            self.phaseDict['Server SQL']['elapsed'] += elapsed
+            self.phaseDict['Server SQL']['features'] += 1
+
+    def getProfile(self):
+        """
+        Gets the profile of the last execution as {'total' : seconds, 'phases' : [{'phase', 'elapsed', 'features', 'featuresPerSecond'}]}.
+        For Server SQL, features is the number of queries.
+        """
+        phaseDict = OrderedDict([(phase, dict(value)) for phase, value in self.phaseDict.iteritems()])
+        if 'Client Geometry' in phaseDict:
+            phaseDict['Client Geometry']['elapsed'] = max(0.0, self.profileElapsedTime - sum([value['elapsed'] for value in phaseDict.values()]))
+            phaseDict['Client Geometry']['features'] = phaseDict['Layer Load']['features']
+        phaseList = []
+        for phase, value in phaseDict.iteritems():
+            featuresPerSecond = value['features']/value['elapsed'] if value['elapsed'] > 0 else None
+            phaseList.append({'phase' : phase, 'elapsed' : value['elapsed'], 'features' : value['features'], 'featuresPerSecond' : featuresPerSecond})
+        return {'total' : self.profileElapsedTime, 'phases' : phaseList}
+
+    def logProfile(self):
+        profile = self.getProfile()
+        msg = self.tr('Profile of process {0} ({1:.3f} s):').format(self.processAlias, profile['total'])
+        for value in profile['phases']:
+            msg += '\n' + self.tr('{0}: {1:.3f} s, {2} features').format(value['phase'], value['elapsed'], value['features'])
+        QgsMessageLog.logMessage(msg, "DSG Tools Plugin", QgsMessageLog.INFO)
+
     def logLayerTime(self, lyr):
         time = self.endTimeCount()
         if self.startTime != 0 and self.endTime != 0:
@@ -689,7 +1137,7 @@ class ValidationProcess(QObject):
             featureList = lyr.selectedFeatures()
             size = len(featureList)
         else:
-            featureList = [i for i in lyr.getFeatures()] if not returnIterator else lyr.getFeatures()
+            featureList = [i for i in lyr.getFeatures(self.getFeatureRequest())] if not returnIterator else lyr.getFeatures(self.getFeatureRequest())
             size = len(lyr.allFeatureIds())
         if returnIterator:
             return featureList, size
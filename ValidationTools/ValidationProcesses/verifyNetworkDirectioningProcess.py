@@ -23,15 +23,18 @@
 
 from qgis.core import QgsMessageLog, QgsVectorLayer, QgsGeometry, QgsFeature, QgsWKBTypes, QgsRectangle, \
                       QgsFeatureRequest, QgsExpression
-from PyQt4.QtGui import QMessageBox
 
 import binascii, math
 from collections import OrderedDict
+from PyQt4.QtCore import QT_TRANSLATE_NOOP
 from DsgTools.ValidationTools.ValidationProcesses.validationProcess import ValidationProcess
-from DsgTools.ValidationTools.ValidationProcesses.createNetworkNodesProcess import CreateNetworkNodesProcess, HidrographyFlowParameters
+from DsgTools.ValidationTools.ValidationProcesses.createNetworkNodesProcess import CreateNetworkNodesProcess, HidrographyFlowParameters, NodeClassificationContext
 from DsgTools.GeometricTools.DsgGeometryHandler import DsgGeometryHandler
 
 class VerifyNetworkDirectioningProcess(ValidationProcess):
+    modifiesClasses = True
+    processAlias = QT_TRANSLATE_NOOP('VerifyNetworkDirectioningProcess', 'Verify Network Directioning')
+
     def __init__(self, postgisDb, iface, instantiating=False):
         """
         Class constructor.
@@ -40,7 +43,6 @@ class VerifyNetworkDirectioningProcess(ValidationProcess):
         :param instantiating: (bool) indication of whether class is being instatiated.
         """
         super(VerifyNetworkDirectioningProcess, self).__init__(postgisDb, iface, instantiating)        
-        self.processAlias = self.tr('Verify Network Directioning')
         self.canvas = self.iface.mapCanvas()
         self.DsgGeometryHandler = DsgGeometryHandler(iface)
         if not self.instantiating:
@@ -50,7 +52,7 @@ class VerifyNetworkDirectioningProcess(ValidationProcess):
             self.hidNodeLayerName = self.createNetworkNodesProcess.hidNodeLayerName
             # checks whether node table exists and if it is filled
             if not self.abstractDb.checkIfTableExists('validation', self.hidNodeLayerName):
-                QMessageBox.warning(self.iface.mainWindow(), self.tr("Warning!"), self.tr('No node table was found into chosen database. (Did you run Create Network Nodes process?)'))
+                self.showMessage(self.tr("Warning!"), self.tr('No node table was found into chosen database. (Did you run Create Network Nodes process?)'), parent=self.iface.mainWindow())
                 return
             # adjusting process parameters
             # getting tables with elements (line primitive)
@@ -304,7 +306,7 @@ class VerifyNetworkDirectioningProcess(ValidationProcess):
         # if node is introduced by operator's modification, it won't be saved to the layer
         if node not in self.nodeTypeDict.keys() and not self.unclassifiedNodes:
             self.unclassifiedNodes = True
-            QMessageBox.warning(self.iface.mainWindow(), self.tr('Error!'), self.tr('There are unclassified nodes! Node (re)creation process is recommended before this process.'))
+            self.showMessage(self.tr('Error!'), self.tr('There are unclassified nodes! Node (re)creation process is recommended before this process.'), parent=self.iface.mainWindow())
             return None, None, None
         flow = flowType[int(nodeType)]
         nodePointDict = self.nodeDict[node]
@@ -1077,10 +1079,12 @@ class VerifyNetworkDirectioningProcess(ValidationProcess):
             networkNodeLayer.startEditing()
             searchRadius = self.parameters['Search Radius']
             networkLayerGeomType = networkLayer.geometryType()
+            # reference geometries are read once for all reclassifications (network lines are not cached, since they are flipped/merged)
+            context = NodeClassificationContext(frameLyrContourList=frame, waterBodiesLayers=waterBodyClasses, waterSinkLayer=waterSinkLayer)
             # declare reclassification function from createNetworkNodesProcess object - parameter is [node, nodeTypeDict] 
             self.classifyNode = lambda x : self.createNetworkNodesProcess.nodeType(nodePoint=x[0], networkLayer=networkLayer, frameLyrContourList=frame, \
                                     waterBodiesLayers=waterBodyClasses, searchRadius=searchRadius, waterSinkLayer=waterSinkLayer, \
-                                    nodeTypeDict=x[1], networkLayerGeomType=networkLayerGeomType)
+                                    nodeTypeDict=x[1], networkLayerGeomType=networkLayerGeomType, context=context)
             # getting node info from network node layer
             self.nodeDict = self.createNetworkNodesProcess.identifyAllNodes(networkLayer=networkLayer)
             # update createNetworkNodesProcess object node dictionary
@@ -1166,7 +1170,7 @@ class VerifyNetworkDirectioningProcess(ValidationProcess):
             # if there are no starting nodes into network, a warning is raised
             if not isinstance(val, dict):
                 # in that case method directNetwork() returns None, None, REASON
-                QMessageBox.warning(self.iface.mainWindow(), self.tr('Error!'), self.tr('No initial node was found!'))
+                self.showMessage(self.tr('Error!'), self.tr('No initial node was found!'), parent=self.iface.mainWindow())
                 self.finishedWithError()
                 return 0
             # get number of selected features
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ DsgTools
+                                 A QGIS plugin
+ Brazilian Army Cartographic Production Tools
+                              -------------------
+        begin                : 2018-03-20
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Philipe Borba - Cartographic Engineer @ Brazilian Army
+        email                : borba@dsg.eb.mil.br
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Headless validation runner. Runs validation process chains on a list of databases without the QGIS GUI:
+
+    python -m DsgTools.ValidationTools.headlessRunner job.json -o report.json
+
+DsgTools must be in PYTHONPATH (e.g. the QGIS python plugins folder) and QGIS_PREFIX_PATH must point to the QGIS install.
+Job description:
+
+    {
+        "processes" : 4,                      # databases validated at the same time (default 1)
+        "ignoreRunningProcess" : false,       # runs even if the database has a process marked as running
+        "databases" : [
+            {"host" : "localhost", "port" : 5432, "database" : "db1", "user" : "postgres", "password" : "postgres",
+             "parameters" : {}}               # optional, overrides the job parameters for this database
+        ],
+        "chain" : [
+            {"process" : "Identify Invalid Geometries", "parameters" : {"Classes" : "*"}}
+        ],
+        "parameters" : {"Only Selected" : false}  # parameters of every process of the chain
+    }
+
+"process" is a process alias or class name. Parameters that are not set use the dialog defaults (first item of
+combo boxes, values of line edits, spin boxes and check boxes). Class lists must be set, either as "*" (every class)
+or as a list of layer names, category.layer or category_layer (i.e. table) names or class keys
+(category,layer,geometry column,geometry type,layer type).
+Reference and layers parameters are set as [reference, class list].
+"""
+import os, sys, json, argparse, traceback
+from datetime import datetime
+from collections import deque, OrderedDict
+from multiprocessing import Pool
+
+from qgis.core import QgsApplication, QgsVectorLayer, QgsMapLayerRegistry, QgsMessageLog
+
+from PyQt4.QtCore import QCoreApplication
+from PyQt4.Qt import QObject
+
+from DsgTools.Factories.DbFactory.connectionPool import ConnectionPool
+
+# application of the current (worker) process, see initQgis
+qgsApplication = None
+
+class NullLegendInterface(object):
+    """
+    Legend without a layer tree. Groups are only kept as a list of names (group indexes are used by the layer loaders).
+    """
+    def __init__(self):
+        self.groupList = []
+
+    def layers(self):
+        return QgsMapLayerRegistry.instance().mapLayers().values()
+
+    def groups(self):
+        return list(self.groupList)
+
+    def addGroup(self, name, expand = True, parent = -1):
+        self.groupList.append(name)
+        return len(self.groupList) - 1
+
+    def moveLayer(self, layer, groupIndex):
+        pass
+
+class NullMapCanvas(object):
+    """
+    Map canvas stand-in: every registered layer is considered active
+    """
+    def layers(self):
+        return QgsMapLayerRegistry.instance().mapLayers().values()
+
+    def refresh(self):
+        pass
+
+class NullIface(object):
+    """
+    Replaces QgisInterface when there is no GUI. Layers (including memory layers) are created and registered
+    in QgsMapLayerRegistry, without a map canvas or legend.
+    """
+    def __init__(self):
+        self.canvas = NullMapCanvas()
+        self.legend = NullLegendInterface()
+
+    def mapCanvas(self):
+        return self.canvas
+
+    def legendInterface(self):
+        return self.legend
+
+    def mainWindow(self):
+        return None
+
+    def addVectorLayer(self, uri, name, provider):
+        """
+        Same contract as QgisInterface.addVectorLayer: returns the registered layer or None if it is not valid
+        """
+        layer = QgsVectorLayer(uri, name, provider)
+        if not layer.isValid():
+            QgsMessageLog.logMessage(QCoreApplication.translate('NullIface', 'Invalid layer {0}: {1}').format(name, layer.error().summary()), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
+            return None
+        QgsMapLayerRegistry.instance().addMapLayer(layer)
+        return layer
+
+def initQgis():
+    """
+    Starts QGIS without GUI in the current process (once per worker)
+    """
+    global qgsApplication
+    if qgsApplication is not None:
+        return
+    qgsApplication = QgsApplication([], False)
+    qgsApplication.setPrefixPath(os.environ.get('QGIS_PREFIX_PATH', '/usr'), True)
+    qgsApplication.initQgis()
+    QgsMessageLog.instance().messageReceived.connect(logToStderr)
+
+def logToStderr(message, tag, level):
+    sys.stderr.write(u'[{0}] {1}\n'.format(tag, message).encode('utf-8'))
+
+def validateDatabase(args):
+    """
+    Pool entry point: validates a database of a job
+    args: (job dict, database dict)
+    """
+    job, database = args
+    initQgis()
+    return HeadlessRunner(job).validateDatabase(database)
+
+class HeadlessRunner(QObject):
+    # dialog headers used as keys of the class lists (see CustomTableSelector)
+    classHeaderList = ['Category', 'Layer Name', 'Geometry\nColumn', 'Geometry\nType', 'Layer\nType']
+
+    def __init__(self, job):
+        """
+        Constructor
+        job: job description (see module docstring)
+        """
+        super(HeadlessRunner, self).__init__()
+        self.job = job
+
+    @classmethod
+    def readJob(cls, path):
+        with open(path, 'r') as jobFile:
+            return json.load(jobFile)
+
+    def run(self):
+        """
+        Validates every database of the job, in parallel when job['processes'] > 1, and returns the report
+        """
+        startTime = datetime.now()
+        databaseList = self.job.get('databases', [])
+        processes = max(1, int(self.job.get('processes', 1)))
+        argList = [(self.job, database) for database in databaseList]
+        if processes > 1 and len(databaseList) > 1:
+            # each worker has its own QgsApplication and database connections
+            pool = Pool(min(processes, len(databaseList)))
+            try:
+                resultList = pool.map(validateDatabase, argList)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            resultList = [validateDatabase(args) for args in argList]
+        return {'started' : startTime.isoformat(),
+                'finished' : datetime.now().isoformat(),
+                'success' : all([result['success'] for result in resultList]),
+                'databases' : resultList}
+
+    def connectDatabase(self, database):
+        # imported in the workers, after QgsApplication is created (see initQgis)
+        from DsgTools.Factories.DbFactory.dbFactory import DbFactory
+        abstractDb = DbFactory().createDbFactory('QPSQL')
+        if abstractDb is None:
+            raise Exception(self.tr('QT PSQL driver not installed!'))
+        abstractDb.connectDatabaseWithParameters(database['host'], str(database.get('port', 5432)), database['database'], database['user'], database.get('password', ''))
+        abstractDb.checkAndOpenDb()
+        return abstractDb
+
+    def validateDatabase(self, database):
+        """
+        Runs the job chain on a database and returns its report
+        """
+        report = {'host' : database.get('host'), 'port' : database.get('port', 5432), 'database' : database.get('database'), 'success' : False, 'error' : None, 'processes' : []}
+        startTime = datetime.now()
+        abstractDb = None
+        try:
+            from DsgTools.ValidationTools.validationManager import ValidationManager
+            abstractDb = self.connectDatabase(database)
+            runningProc = abstractDb.getRunningProc()
+            if runningProc is not None and not self.job.get('ignoreRunningProcess', False):
+                raise Exception(self.tr('Process {0} is already running.').format(runningProc))
+            validationManager = ValidationManager(abstractDb, NullIface())
+            jobParameters = dict(self.job.get('parameters', dict()), **database.get('parameters', dict()))
+            report['success'] = True
+            for item in self.job.get('chain', []):
+                processReport = self.runChainItem(validationManager, item, jobParameters)
+                report['processes'].append(processReport)
+                if processReport['ret'] != 1:
+                    report['success'] = False
+                    break
+        except Exception as e:
+            report['success'] = False
+            report['error'] = ':'.join([unicode(arg) for arg in e.args]) or traceback.format_exc()
+            QgsMessageLog.logMessage(traceback.format_exc(), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
+        finally:
+            if abstractDb is not None:
+                ConnectionPool.closeConnections(abstractDb.db)
+                abstractDb.db.close()
+            QgsMapLayerRegistry.instance().removeAllMapLayers()
+        report['elapsed'] = (datetime.now() - startTime).total_seconds()
+        return report
+
+    def getProcessAlias(self, validationManager, process):
+        """
+        Gets the alias of a process given by alias or class name
+        """
+        if process in validationManager.processDict:
+            return process
+        for alias, className in validationManager.processDict.iteritems():
+            if className == process:
+                return alias
+        raise Exception(self.tr('Validation process {0} not found.').format(process))
+
+    def runChainItem(self, validationManager, item, jobParameters):
+        """
+        Runs the chain of a process with the job parameters and returns the report of each process of the chain
+        item: {'process' : alias or class name, 'parameters' : dict}
+        """
+        processAlias = self.getProcessAlias(validationManager, item['process'])
+        processChain, parameterDict = validationManager.getProcessChain(processAlias)
+        params = self.getParameters(parameterDict, dict(jobParameters, **item.get('parameters', dict())))
+        ret = validationManager.executeProcessChain(processAlias, processChain, params)
+        processReportList = []
+        for process in processChain:
+            processReportList.append({'process' : process.processAlias,
+                                      'className' : process.getName(),
+                                      'status' : validationManager.postgisDb.getValidationStatus(process.getName()),
+                                      'statusMessage' : validationManager.postgisDb.getValidationStatusText(process.getName()),
+                                      'flags' : validationManager.postgisDb.getNumberOfFlagsByProcess(process.getName()),
+                                      'profile' : process.getProfile()})
+        return {'process' : processAlias, 'ret' : ret, 'chain' : processReportList}
+
+    def getParameters(self, parameterDict, jobParameters):
+        """
+        Gets the values the parameters dialog would return, using the job parameters where they are set
+        """
+        params = dict()
+        missingList = []
+        for key, value in parameterDict.iteritems():
+            if key in jobParameters:
+                params[key] = self.getParameterValue(key, value, jobParameters[key])
+            elif isinstance(value, deque):
+                params[key] = value[0] if len(value) > 0 else ''
+            elif type(value) in (bool, int, float, str, unicode):
+                params[key] = value
+            else:
+                missingList.append(key)
+        if len(missingList) > 0:
+            raise Exception(self.tr('Parameters {0} must be set in the job.').format(', '.join(missingList)))
+        return params
+
+    def getParameterValue(self, key, value, jobValue):
+        if isinstance(value, deque):
+            if jobValue not in value:
+                raise Exception(self.tr('Invalid value {0} for parameter {1}. Options: {2}').format(jobValue, key, ', '.join([unicode(i) for i in value])))
+            return jobValue
+        if isinstance(value, list):
+            return self.getClassKeyList(key, value, jobValue)
+        if isinstance(value, OrderedDict) and 'layersDictList' in value:
+            return self.getReferenceAndLayers(key, value, jobValue)
+        if isinstance(value, tuple):
+            return tuple(jobValue)
+        if type(value) in (bool, int, float):
+            return type(value)(jobValue)
+        return jobValue
+
+    def getClassKey(self, item):
+        if not isinstance(item, dict):
+            return str(item)
+        return ','.join([item.get(self.tr(header), item.get(header, '')) for header in self.classHeaderList])
+
+    def getClassKeyList(self, key, value, jobValue):
+        """
+        Gets the selected keys (as returned by CustomTableSelector) of a class list parameter.
+        jobValue: '*' or a list of keys, layer names or schema.layer names
+        """
+        keyList = [self.getClassKey(item) for item in value]
+        if jobValue == '*':
+            return keyList
+        selectedList = []
+        for name in jobValue:
+            matchList = [classKey for classKey in keyList if name in (classKey, classKey.split(',')[1], '.'.join(classKey.split(',')[0:2]), '_'.join(classKey.split(',')[0:2]))]
+            if len(matchList) == 0:
+                raise Exception(self.tr('Class {0} of parameter {1} not found.').format(name, key))
+            selectedList += [classKey for classKey in matchList if classKey not in selectedList]
+        return selectedList
+
+    def getReferenceAndLayers(self, key, value, jobValue):
+        """
+        Gets the (reference key, selected keys) tuple (as returned by CustomReferenceAndLayersParameterSelector).
+        jobValue: [reference, layers], reference and layers as in getClassKeyList
+        """
+        reference, layers = jobValue
+        referenceDictList = value.get('referenceDictList') or value['layersDictList']
+        referenceKey = None
+        if reference:
+            referenceKey = self.getClassKeyList(key, list(referenceDictList), [reference])[0]
+        return referenceKey, self.getClassKeyList(key, list(value['layersDictList']), layers)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Runs DsgTools validation processes without the QGIS GUI.')
+    parser.add_argument('job', help = 'JSON job description')
+    parser.add_argument('-o', '--output', help = 'JSON report (default: standard output)')
+    parser.add_argument('-j', '--processes', type = int, help = 'databases validated at the same time (overrides the job)')
+    arguments = parser.parse_args()
+    job = HeadlessRunner.readJob(arguments.job)
+    if arguments.processes:
+        job['processes'] = arguments.processes
+    report = HeadlessRunner(job).run()
+    report['job'] = os.path.abspath(arguments.job)
+    if arguments.output:
+        with open(arguments.output, 'w') as reportFile:
+            json.dump(report, reportFile, indent = 4)
+    else:
+        json.dump(report, sys.stdout, indent = 4)
+    sys.exit(0 if report['success'] else 1)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ DsgTools
+                                 A QGIS plugin
+ Brazilian Army Cartographic Production Tools
+                              -------------------
+        begin                : 2018-03-16
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Philipe Borba - Cartographic Engineer @ Brazilian Army
+        email                : borba@dsg.eb.mil.br
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import os, ast
+
+from PyQt4.QtCore import QCoreApplication
+
+class ProcessRegistry(object):
+    """
+    Registry of the validation processes found in a folder.
+    Class level metadata (processAlias, processGroup) is read from the source with ast,
+    so process modules are only imported when a process is actually chosen (see getProcessClass).
+    """
+    def __init__(self, processFolder, packageName, ignoredFiles = []):
+        """
+        Constructor
+        processFolder: folder with the process modules
+        packageName: package of the process modules (e.g. DsgTools.ValidationTools.ValidationProcesses)
+        ignoredFiles: files that are not processes
+        """
+        self.processFolder = processFolder
+        self.packageName = packageName
+        self.ignoredFiles = ignoredFiles
+        self.metadataDict = dict()
+        self.classDict = dict()
+
+    def scan(self):
+        """
+        Scans processFolder for .py files. Each file must define a class named like the file with the
+        first letter in upper case (e.g. identifyDanglesProcess.py defines IdentifyDanglesProcess).
+        Returns the list of process class names.
+        """
+        self.metadataDict = dict()
+        for fileName in sorted(os.listdir(self.processFolder)):
+            if fileName in self.ignoredFiles or fileName.split('.')[-1] != 'py':
+                continue
+            moduleName = fileName.split('.')[0]
+            className = moduleName[0].upper() + moduleName[1::]
+            self.metadataDict[className] = self.readMetadata(os.path.join(self.processFolder, fileName), className, moduleName)
+        return sorted(self.metadataDict.keys())
+
+    def readMetadata(self, path, className, moduleName):
+        """
+        Reads class level metadata of className from the source file, without importing it.
+        Values that are not literals (or QT_TRANSLATE_NOOP calls) are left as None.
+        """
+        metadata = {'className' : className, 'moduleName' : moduleName, 'processAlias' : None, 'processGroup' : None}
+        with open(path, 'r') as sourceFile:
+            tree = ast.parse(sourceFile.read(), path)
+        for node in tree.body:
+            if not isinstance(node, ast.ClassDef) or node.name != className:
+                continue
+            for item in node.body:
+                if not isinstance(item, ast.Assign) or len(item.targets) != 1 or not isinstance(item.targets[0], ast.Name):
+                    continue
+                if item.targets[0].id in metadata:
+                    metadata[item.targets[0].id] = self.getLiteral(item.value)
+        return metadata
+
+    def getLiteral(self, node):
+        if isinstance(node, ast.Str):
+            return node.s
+        if isinstance(node, ast.Call) and getattr(node.func, 'id', None) == 'QT_TRANSLATE_NOOP' and isinstance(node.args[-1], ast.Str):
+            return node.args[-1].s
+        return None
+
+    def getProcessAlias(self, className):
+        """
+        Gets the translated alias of a process. Falls back to importing the class if the alias is not a literal.
+        """
+        processAlias = self.metadataDict[className]['processAlias']
+        if processAlias is None:
+            return self.getProcessClass(className).getProcessAlias()
+        return QCoreApplication.translate(className, processAlias)
+
+    def getProcessGroup(self, className):
+        processGroup = self.metadataDict[className]['processGroup']
+        if processGroup is None:
+            # same default as ValidationProcess
+            return 'Ungrouped'
+        return processGroup
+
+    def getProcessClass(self, className):
+        """
+        Imports (only once) and returns the class of a process
+        """
+        if className not in self.classDict:
+            moduleName = self.metadataDict[className]['moduleName']
+            mod = __import__('.'.join([self.packageName, moduleName]), fromlist=[className])
+            self.classDict[className] = getattr(mod, className)
+        return self.classDict[className]
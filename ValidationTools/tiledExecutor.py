@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ DsgTools
+                                 A QGIS plugin
+ Brazilian Army Cartographic Production Tools
+                              -------------------
+        begin                : 2018-03-19
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Philipe Borba - Cartographic Engineer @ Brazilian Army
+        email                : borba@dsg.eb.mil.br
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import binascii, struct
+
+from qgis.core import QgsMessageLog, QgsGeometry, QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsRectangle, QgsSpatialIndex, QgsFeature, QGis
+
+from PyQt4.QtCore import QEventLoop
+from PyQt4.QtGui import QApplication
+from PyQt4.Qt import QObject
+
+from DsgTools.LayerTools.CreateFrameTool.map_index import UtmGrid
+from DsgTools.CustomWidgets.progressWidget import ProgressWidget
+from DsgTools.Factories.ThreadFactory.validationProcessThread import ValidationProcessThread
+from DsgTools.Factories.DbFactory.connectionPool import ConnectionPool
+
+class TiledExecutor(QObject):
+    """
+    Runs a process (with supportsTiling set) tile by tile, so that only the features of a tile
+    (enlarged by an overlap) are loaded at once. Each feature is changed by a single tile (see
+    ValidationProcess.isOwnedByTile) and flags are clipped to their tiles and merged at the seams.
+    Tiles of processes that can run in worker threads (see ValidationProcess.canRunInWorker) run concurrently,
+    each one on its own pooled connection. Tiles of processes that use layers run one after the other in the GUI thread.
+    """
+    # tiling options shown in the process parameters ('Tiling' parameter)
+    noTiling = 'No Tiling'
+    frameTiling = 'Frame'
+    gridScaleDict = {'1:250.000' : 250, '1:100.000' : 100, '1:50.000' : 50, '1:25.000' : 25}
+
+    def __init__(self, abstractDb, iface):
+        """
+        Constructor
+        """
+        super(TiledExecutor, self).__init__()
+        self.abstractDb = abstractDb
+        self.iface = iface
+        self.utmGrid = UtmGrid()
+
+    @classmethod
+    def getTilingOptionList(cls):
+        return [cls.noTiling, cls.frameTiling] + sorted(cls.gridScaleDict.keys(), key = lambda x : -cls.gridScaleDict[x])
+
+    def getFrameTileList(self):
+        """
+        Gets the tiles from the frame layer (see AbstractDb.getFrameLayerName)
+        """
+        tileList = []
+        for wkb in self.abstractDb.getFrameGeometryList():
+            tile = QgsGeometry()
+            tile.fromWkb(binascii.unhexlify(wkb))
+            tileList.append(tile)
+        return tileList
+
+    def getGridTileList(self, tableList, scale):
+        """
+        Gets the map index (UtmGrid) cells of scale that cover the tables of tableList, in the database crs
+        """
+        extent = self.abstractDb.getMultiTableExtent(tableList)
+        if extent is None:
+            return []
+        crs = QgsCoordinateReferenceSystem(int(self.abstractDb.findEPSG()), QgsCoordinateReferenceSystem.EpsgCrsId)
+        geographicCrs = QgsCoordinateReferenceSystem(crs.geographicCRSAuthId())
+        coordinateTransform = QgsCoordinateTransform(geographicCrs, crs)
+        geographicExtent = coordinateTransform.transformBoundingBox(QgsRectangle(*extent), QgsCoordinateTransform.ReverseTransform)
+        tileList = []
+        for cell in self.utmGrid.getGridCellList(geographicExtent.xMinimum(), geographicExtent.yMinimum(), geographicExtent.xMaximum(), geographicExtent.yMaximum(), scale):
+            cell.transform(coordinateTransform)
+            tileList.append(cell)
+        return tileList
+
+    def getTileList(self, process, tiling):
+        """
+        Gets the tiles of a process for a tiling option
+        """
+        if tiling == self.frameTiling:
+            return self.getFrameTileList()
+        classSet = process.getClassSet()
+        if classSet is None:
+            raise Exception(self.tr('Process {0} has no classes to build the grid from.').format(process.processAlias))
+        return self.getGridTileList(classSet, self.gridScaleDict[tiling])
+
+    def execute(self, process, tiling, overlap):
+        """
+        Runs process on each tile and stores the merged flags. Returns the status of the last execution.
+        tiling: option of getTilingOptionList
+        overlap: distance (in the database crs units) that each tile is enlarged by
+        """
+        tileList = self.getTileList(process, tiling)
+        QgsMessageLog.logMessage(self.tr('Running {0} on {1} tiles.').format(process.processAlias, len(tileList)), "DSG Tools Plugin", QgsMessageLog.INFO)
+        # a process already running in a worker thread (see ValidationScheduler) runs its tiles in that thread
+        if not process.isWorkerThread() and process.canRunInWorker():
+            ret, flagTupleList = self.executeConcurrently(process, tileList, overlap)
+        else:
+            ret, flagTupleList = self.executeSerially(process, tileList, overlap)
+        if ret != 1:
+            return ret
+        mergedFlagList = self.mergeFlags(flagTupleList)
+        if len(mergedFlagList) > 0:
+            numberOfProblems = process.addFlag(mergedFlagList)
+            process.setStatus(self.tr('{0} flags raised on {1} tiles. Check flags.').format(numberOfProblems, len(tileList)), 4) #Finished with flags
+        else:
+            process.setStatus(self.tr('No flags raised on {0} tiles.').format(len(tileList)), 1) #Finished
+        return ret
+
+    def executeSerially(self, process, tileList, overlap):
+        """
+        Runs process on each tile, one after the other. Returns (status, list of (tile index, flag tuple)).
+        """
+        process.tileOwnedIdDict = dict()
+        flagTupleList = []
+        try:
+            for i, tile in enumerate(tileList):
+                process.setTile(tile, overlap)
+                ret = process.execute()
+                if ret != 1:
+                    return ret, flagTupleList
+                flagTupleList += [(i, flagTuple) for flagTuple in self.clipFlags(process.tileFlagList, tile)]
+        finally:
+            process.setTile(None)
+            process.tileOwnedIdDict = dict()
+        return 1, flagTupleList
+
+    def executeConcurrently(self, process, tileList, overlap):
+        """
+        Runs a copy of process (see ValidationProcess.getTileCopy) per tile in the tiles thread pool.
+        Returns (status, list of (tile index, flag tuple)).
+        """
+        # tiles wait for their async queries, which run in the queries pool
+        threadPool = ConnectionPool.getThreadPool('tiles')
+        threadList = []
+        for tile in tileList:
+            thread = ValidationProcessThread(process.getTileCopy(tile, overlap), lambda tileProcess : tileProcess.execute())
+            threadList.append(thread)
+            threadPool.start(thread)
+        ret = 1
+        flagTupleList = []
+        for i, thread in enumerate(threadList):
+            # the interface is repainted, but user input waits for the tiles
+            while not thread.finished.wait(0.05):
+                QApplication.processEvents(QEventLoop.ExcludeUserInputEvents)
+            if thread.ret != 1:
+                ret = thread.ret
+            flagTupleList += [(i, flagTuple) for flagTuple in self.clipFlags(thread.process.tileFlagList, tileList[i])]
+        return ret, flagTupleList
+
+    def getFlagGeometry(self, flagTuple):
+        """
+        Gets the geometry of a flag, given as hex WKB or as PostGIS hex EWKB (see getPlainWkb)
+        """
+        geom = QgsGeometry()
+        geom.fromWkb(self.getPlainWkb(binascii.unhexlify(flagTuple[3])))
+        return geom
+
+    def getPlainWkb(self, wkb):
+        """
+        Strips the SRID of an EWKB header (SRID flag 0x20000000 on the type, followed by the 4 byte SRID).
+        PostGIS only writes the SRID on the outer geometry.
+        """
+        byteOrder = '<' if wkb[0] == '\x01' else '>'
+        wkbType = struct.unpack(byteOrder + 'I', wkb[1:5])[0]
+        if not wkbType & 0x20000000:
+            return wkb
+        return wkb[0] + struct.pack(byteOrder + 'I', wkbType & ~0x20000000) + wkb[9:]
+
+    def clipFlags(self, flagTupleList, tile):
+        """
+        Clips flag geometries to the tile. Flags outside the tile belong to other tiles.
+        """
+        clippedList = []
+        for flagTuple in flagTupleList:
+            geom = self.getFlagGeometry(flagTuple)
+            if geom.type() == QGis.Point:
+                if tile.intersects(geom):
+                    clippedList.append(flagTuple)
+                continue
+            clipped = geom.intersection(tile)
+            if clipped and not clipped.isEmpty():
+                clippedList.append(tuple([flagTuple[0], flagTuple[1], flagTuple[2], binascii.hexlify(clipped.asWkb())]) + tuple(flagTuple[4:]))
+        return clippedList
+
+    def mergeFlags(self, indexedFlagList):
+        """
+        Merges flags split by the tile seams: line and polygon flags of the same class and reason
+        that come from different tiles and intersect are unified. Duplicated point flags are removed.
+        indexedFlagList: list of (tile index, flag tuple)
+        """
+        mergedList = []
+        pointKeySet = set()
+        groupDict = dict()
+        for tileIndex, flagTuple in indexedFlagList:
+            geom = self.getFlagGeometry(flagTuple)
+            if geom.type() == QGis.Point:
+                key = (flagTuple[0], flagTuple[2], flagTuple[3])
+                if key not in pointKeySet:
+                    pointKeySet.add(key)
+                    mergedList.append(flagTuple)
+                continue
+            groupDict.setdefault((flagTuple[0], flagTuple[2]), []).append((tileIndex, flagTuple, geom))
+        for itemList in groupDict.values():
+            mergedList += self.mergeFlagGroup(itemList)
+        return mergedList
+
+    def mergeFlagGroup(self, itemList):
+        """
+        Unifies the intersecting pieces (from different tiles) of a list of (tile index, flag tuple, geometry)
+        """
+        index = QgsSpatialIndex()
+        for i, (tileIndex, flagTuple, geom) in enumerate(itemList):
+            feature = QgsFeature(i)
+            feature.setGeometry(geom)
+            index.insertFeature(feature)
+        # union find of the pieces
+        parentList = range(len(itemList))
+        def find(i):
+            while parentList[i] != i:
+                parentList[i] = parentList[parentList[i]]
+                i = parentList[i]
+            return i
+        for i, (tileIndex, flagTuple, geom) in enumerate(itemList):
+            for j in index.intersects(geom.boundingBox()):
+                if j <= i or itemList[j][0] == tileIndex or not geom.intersects(itemList[j][2]):
+                    continue
+                parentList[find(j)] = find(i)
+        componentDict = dict()
+        for i in range(len(itemList)):
+            componentDict.setdefault(find(i), []).append(i)
+        mergedList = []
+        for root, memberList in componentDict.iteritems():
+            flagTuple = itemList[root][1]
+            if len(memberList) == 1:
+                mergedList.append(flagTuple)
+                continue
+            geom = QgsGeometry(itemList[memberList[0]][2])
+            for i in memberList[1::]:
+                geom = geom.combine(itemList[i][2])
+            mergedList.append(tuple([flagTuple[0], flagTuple[1], flagTuple[2], binascii.hexlify(geom.asWkb())]) + tuple(flagTuple[4:]))
+        return mergedList
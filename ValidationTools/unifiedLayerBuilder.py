@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ DsgTools
+                                 A QGIS plugin
+ Brazilian Army Cartographic Production Tools
+                              -------------------
+        begin                : 2018-03-22
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Philipe Borba - Cartographic Engineer @ Brazilian Army
+        email                : borba@dsg.eb.mil.br
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import os, tempfile, uuid
+
+from qgis.core import QGis, QgsVectorLayer, QgsVectorFileWriter, QgsFeature, QgsField, QgsFields, QgsGeometry, QgsDataSourceURI, QgsCoordinateReferenceSystem, QgsMessageLog
+
+from PyQt4.QtCore import QVariant
+from PyQt4.Qt import QObject
+
+class UnifiedLayerBuilder(QObject):
+    """
+    Builds the unified (coverage) layer of a list of layers: one feature per input feature (or per line, see asLines)
+    with the fields featid, classname and, with attributeTupple, tupple and blacklist.
+    Features are streamed (see iterLayerFeatures) and written in batches to a memory layer that is not added to the
+    map, or to a temporary GeoPackage (spatially indexed), which can also be used by processing algorithms.
+    """
+    memoryStorage = 'memory'
+    geopackageStorage = 'gpkg'
+
+    def __init__(self, geometryType, srid, attributeTupple = False, attributeBlackList = [], asLines = False, storage = 'memory', batchSize = 5000, name = 'coverage'):
+        """
+        Constructor
+        geometryType: QGis.WkbType of the output
+        attributeTupple: adds the tupple field (sorted attribute values of each feature, but the ones of attributeBlackList)
+        asLines: polygons are written as their rings and multi geometries as their parts (see createUnifiedLineLayer)
+        storage: memoryStorage or geopackageStorage
+        """
+        super(UnifiedLayerBuilder, self).__init__()
+        self.geometryType = geometryType
+        self.srid = srid
+        self.attributeTupple = attributeTupple
+        self.attributeBlackList = attributeBlackList
+        self.asLines = asLines
+        self.storage = storage
+        self.batchSize = batchSize
+        self.name = name
+        self.fields = self.getFields()
+        self.featureCount = 0
+        self.batch = []
+        self.layer = None
+        self.writer = None
+        self.path = None
+        if storage == self.geopackageStorage:
+            self.path = os.path.join(tempfile.gettempdir(), 'dsgtools_{0}_{1}.gpkg'.format(name, uuid.uuid4().hex))
+            crs = QgsCoordinateReferenceSystem(int(srid), QgsCoordinateReferenceSystem.EpsgCrsId)
+            self.writer = QgsVectorFileWriter(self.path, 'UTF-8', self.fields, geometryType, crs, 'GPKG')
+            if self.writer.hasError() != QgsVectorFileWriter.NoError:
+                raise Exception(self.tr('Problem creating temporary layer: ') + self.writer.errorMessage())
+        else:
+            uri = '{0}?crs=epsg:{1}&index=yes'.format(QGis.featureType(geometryType).replace('WKB', ''), srid)
+            self.layer = QgsVectorLayer(uri, name, 'memory')
+            self.layer.dataProvider().addAttributes(self.fields.toList())
+            self.layer.updateFields()
+
+    def getFields(self):
+        fields = QgsFields()
+        fieldList = [QgsField('featid', QVariant.Int), QgsField('classname', QVariant.String)]
+        if self.attributeTupple:
+            fieldList += [QgsField('tupple', QVariant.String), QgsField('blacklist', QVariant.String)]
+        for field in fieldList:
+            fields.append(field)
+        return fields
+
+    def getTuppleAttributeList(self, layer):
+        """
+        Gets (once per layer) the sorted attribute names used in the tupple field
+        """
+        keyColumn = QgsDataSourceURI(layer.dataProvider().dataSourceUri()).keyColumn()
+        attributeList = [field.name() for field in layer.pendingFields() if (field.type() != 6 and field.name() != keyColumn)]
+        return [attribute for attribute in sorted(attributeList) if attribute not in self.attributeBlackList]
+
+    def getGeometryList(self, geom):
+        if not self.asLines:
+            return [geom]
+        geometryList = []
+        for part in geom.asGeometryCollection():
+            if part.type() == QGis.Polygon:
+                geometryList += [QgsGeometry.fromPolyline(line) for line in part.asPolygon()]
+            else:
+                geometryList.append(part)
+        return geometryList
+
+    def iterLayerFeatures(self, layer, featureIterator):
+        """
+        Yields the unified features of the features of layer (from featureIterator), without storing them
+        """
+        classname = layer.name()
+        attributeList = self.getTuppleAttributeList(layer) if self.attributeTupple else []
+        for feature in featureIterator:
+            geom = feature.geometry()
+            if self.asLines and not geom:
+                continue
+            if self.attributeTupple:
+                tupple = ','.join([u'{0}'.format(feature[attribute]) for attribute in attributeList]) #done due to encode problems
+            for newGeom in self.getGeometryList(geom):
+                newfeat = QgsFeature(self.fields)
+                newfeat.setGeometry(newGeom)
+                newfeat['featid'] = feature.id()
+                newfeat['classname'] = classname
+                if self.attributeTupple:
+                    newfeat['tupple'] = tupple
+                yield newfeat
+
+    def addLayer(self, layer, featureIterator):
+        """
+        Writes the unified features of layer in batches
+        """
+        for newfeat in self.iterLayerFeatures(layer, featureIterator):
+            self.batch.append(newfeat)
+            if len(self.batch) >= self.batchSize:
+                self.flush()
+        self.flush()
+
+    def flush(self):
+        if len(self.batch) == 0:
+            return
+        if self.writer is not None:
+            for newfeat in self.batch:
+                self.writer.addFeature(newfeat)
+        else:
+            self.layer.dataProvider().addFeatures(self.batch)
+        self.featureCount += len(self.batch)
+        self.batch = []
+
+    def getLayer(self):
+        """
+        Finishes the writing and returns the unified layer (not added to the map)
+        """
+        self.flush()
+        if self.writer is not None:
+            # deleting the writer closes the GeoPackage
+            self.writer = None
+            self.layer = QgsVectorLayer(self.path, self.name, 'ogr')
+            if not self.layer.isValid():
+                raise Exception(self.tr('Problem opening temporary layer {0}').format(self.path))
+        self.layer.updateExtents()
+        return self.layer
+
+    def cleanUp(self):
+        """
+        Removes the temporary GeoPackage
+        """
+        self.layer = None
+        if self.path and os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError:
+                QgsMessageLog.logMessage(self.tr('Could not remove temporary layer {0}').format(self.path), "DSG Tools Plugin", QgsMessageLog.WARNING)
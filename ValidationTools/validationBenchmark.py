@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ DsgTools
+                                 A QGIS plugin
+ Brazilian Army Cartographic Production Tools
+                              -------------------
+        begin                : 2018-03-21
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Philipe Borba - Cartographic Engineer @ Brazilian Army
+        email                : borba@dsg.eb.mil.br
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+Benchmark of the validation processes on synthetic EDGV databases:
+
+    python -m DsgTools.ValidationTools.validationBenchmark benchmark.json -b baseline.json -o results.json
+
+For each size, an EDGV database is created from the EDGV template and filled with a reproducible (seeded) grid
+coverage with planted gaps, overlaps, invalid geometries and duplicates, and a grid network with planted dangles and
+duplicates (half of the features each). Each case runs on a fresh copy of that database, in its own headless runner
+process (see headlessRunner.py), and records wall time, process time (sum of the process profiles), peak RSS and flags.
+Results are compared with the baseline: slower or larger cases (beyond the tolerances) and different flag counts are
+reported as regressions. --update-baseline stores the results as the new baseline.
+
+Benchmark description (every key but server is optional):
+
+    {
+        "server" : {"host" : "localhost", "port" : 5432, "user" : "postgres", "password" : "postgres"},
+        "version" : "2.1.3",
+        "srid" : 31982,
+        "sizes" : [10000, 100000, 1000000],
+        "seed" : 1,
+        "cases" : [{"process" : "Identify Invalid Geometries", "parameters" : {"Classes" : ["veg_vegetacao_a"]}}],
+        "timeTolerance" : 0.2,
+        "memoryTolerance" : 0.2,
+        "keepDatabases" : false
+    }
+"""
+import os, sys, json, argparse, subprocess, tempfile, shutil, time
+from datetime import datetime
+
+from PyQt4.Qt import QObject
+
+from DsgTools.ValidationTools.headlessRunner import initQgis
+
+class ValidationBenchmark(QObject):
+    coverageTable = 'cb.veg_vegetacao_a'
+    networkTable = 'cb.hid_trecho_drenagem_l'
+    # UTM coordinates (in meters) of the lower left corner of the synthetic data
+    origin = (500000.0, 7500000.0)
+    cellSize = 100.0
+    # classes are given by table name (see HeadlessRunner.getClassKeyList)
+    defaultCaseList = [
+        {'process' : 'IdentifyInvalidGeometriesProcess', 'parameters' : {'Classes' : ['veg_vegetacao_a', 'hid_trecho_drenagem_l']}},
+        {'process' : 'IdentifyDuplicatedGeometriesProcess', 'parameters' : {'Classes' : ['veg_vegetacao_a', 'hid_trecho_drenagem_l']}},
+        {'process' : 'IdentifyOverlapsProcess', 'parameters' : {'Classes' : ['veg_vegetacao_a']}},
+        {'process' : 'IdentifyGapsAndOverlapsProcess', 'parameters' : {'Reference and Layers' : [None, ['veg_vegetacao_a']]}},
+        {'process' : 'IdentifyDanglesProcess', 'parameters' : {'Layer and Filter Layers' : ['hid_trecho_drenagem_l', ['hid_trecho_drenagem_l']]}}
+    ]
+
+    def __init__(self, benchmark):
+        """
+        Constructor
+        benchmark: benchmark description (see module docstring)
+        """
+        super(ValidationBenchmark, self).__init__()
+        self.benchmark = benchmark
+        self.server = benchmark['server']
+        self.version = benchmark.get('version', '2.1.3')
+        self.srid = benchmark.get('srid', 31982)
+        self.sizeList = benchmark.get('sizes', [10000, 100000, 1000000])
+        self.seed = benchmark.get('seed', 1)
+        self.caseList = benchmark.get('cases', self.defaultCaseList)
+        self.keepDatabases = benchmark.get('keepDatabases', False)
+        self.serverDb = None
+
+    def getCaseName(self, case):
+        return case.get('name', case['process'])
+
+    def connect(self, dbName):
+        from DsgTools.Factories.DbFactory.dbFactory import DbFactory
+        abstractDb = DbFactory().createDbFactory('QPSQL')
+        abstractDb.connectDatabaseWithParameters(self.server['host'], str(self.server.get('port', 5432)), dbName, self.server['user'], self.server.get('password', ''))
+        abstractDb.checkAndOpenDb()
+        return abstractDb
+
+    def getDatabaseName(self, size):
+        return 'dsgtools_benchmark_{0}_{1}_{2}'.format(self.version.replace('.', '').lower(), size, self.seed)
+
+    def prepareDatabase(self, size):
+        """
+        Creates (once) the synthetic database of a size and returns its name
+        """
+        dbName = self.getDatabaseName(size)
+        if dbName in self.serverDb.getDbsFromServer():
+            return dbName
+        from DsgTools.Factories.DbCreatorFactory.dbCreatorFactory import DbCreatorFactory
+        dbCreator = DbCreatorFactory().createDbCreatorFactory('QPSQL', self.serverDb)
+        paramDict = {'version' : self.version, 'templateName' : self.serverDb.getTemplateName(self.version), 'isTemplateEdgv' : True}
+        newDb = dbCreator.createDb(dbName, self.srid, paramDict = paramDict)
+        try:
+            newDb.insertSyntheticCoverage(self.coverageTable, size / 2, self.cellSize, self.origin[0], self.origin[1], self.seed)
+            newDb.insertSyntheticNetwork(self.networkTable, size - size / 2, self.cellSize, self.origin[0], self.origin[1], self.seed)
+        except:
+            newDb.db.close()
+            self.serverDb.dropDatabase(dbName)
+            raise
+        newDb.db.close()
+        return dbName
+
+    def runCase(self, dbName, case, workDir):
+        """
+        Runs a case on a copy of dbName in a headless runner process and returns its result
+        """
+        caseDbName = dbName + '_case'
+        if caseDbName in self.serverDb.getDbsFromServer():
+            self.serverDb.dropDatabase(caseDbName)
+        self.serverDb.createDbFromTemplate(caseDbName, dbName)
+        try:
+            database = dict(self.server, database = caseDbName)
+            jobPath = os.path.join(workDir, 'job.json')
+            reportPath = os.path.join(workDir, 'report.json')
+            with open(jobPath, 'w') as jobFile:
+                json.dump({'databases' : [database], 'chain' : [case], 'ignoreRunningProcess' : True}, jobFile)
+            # the report of the previous case must not be taken as the report of this one
+            if os.path.exists(reportPath):
+                os.remove(reportPath)
+            startTime = time.time()
+            runner = subprocess.Popen([sys.executable, '-m', 'DsgTools.ValidationTools.headlessRunner', jobPath, '-o', reportPath])
+            # wait4 gives the resource usage of this child only (ru_maxrss is in kilobytes on Linux)
+            pid, status, rusage = os.wait4(runner.pid, 0)
+            wallTime = time.time() - startTime
+            report = None
+            if os.path.exists(reportPath):
+                with open(reportPath, 'r') as reportFile:
+                    report = json.load(reportFile)
+        finally:
+            self.serverDb.dropDatabase(caseDbName)
+        result = {'wallTime' : wallTime, 'peakRss' : rusage.ru_maxrss * 1024, 'success' : False, 'error' : None, 'processTime' : 0.0, 'flags' : None}
+        # the runner exits with 1 when a process fails, any other non zero status (or a missing report) is a crash
+        if report is None or not (os.WIFEXITED(status) and os.WEXITSTATUS(status) in (0, 1)):
+            result['error'] = self.tr('Headless runner exited with status {0} ({1}).').format(status, self.tr('report written') if report is not None else self.tr('no report'))
+            return result
+        databaseReport = report['databases'][0]
+        result['success'], result['error'] = databaseReport['success'], databaseReport['error']
+        for processReport in databaseReport['processes']:
+            for chainReport in processReport['chain']:
+                result['processTime'] += chainReport['profile']['total'] if chainReport['profile'] else 0.0
+                if case['process'] in (chainReport['process'], chainReport['className']):
+                    result['flags'] = chainReport['flags']
+        return result
+
+    def run(self):
+        """
+        Runs every case on every size and returns {size : {case name : result}}
+        """
+        initQgis()
+        self.serverDb = self.connect('postgres')
+        workDir = tempfile.mkdtemp(prefix = 'dsgtools_benchmark')
+        resultDict = dict()
+        try:
+            for size in self.sizeList:
+                dbName = self.prepareDatabase(size)
+                resultDict[str(size)] = dict()
+                for case in self.caseList:
+                    result = self.runCase(dbName, case, workDir)
+                    resultDict[str(size)][self.getCaseName(case)] = result
+                    sys.stderr.write('{0} {1}: {2:.2f} s, {3:.1f} MB, {4} flags\n'.format(size, self.getCaseName(case), result['wallTime'], result['peakRss'] / 1048576.0, result['flags']))
+                if not self.keepDatabases:
+                    self.serverDb.dropDatabase(dbName)
+        finally:
+            shutil.rmtree(workDir, ignore_errors = True)
+        return resultDict
+
+    def compare(self, resultDict, baselineDict):
+        """
+        Gets the list of regressions of resultDict compared with baselineDict (same format)
+        """
+        timeTolerance = self.benchmark.get('timeTolerance', 0.2)
+        memoryTolerance = self.benchmark.get('memoryTolerance', 0.2)
+        regressionList = []
+        for size, caseDict in sorted(resultDict.iteritems()):
+            for caseName, result in sorted(caseDict.iteritems()):
+                baseline = baselineDict.get(size, dict()).get(caseName)
+                if baseline is None:
+                    continue
+                if not result['success']:
+                    regressionList.append(self.tr('{0} {1}: failed ({2})').format(size, caseName, result['error']))
+                if result['processTime'] > baseline['processTime'] * (1 + timeTolerance):
+                    regressionList.append(self.tr('{0} {1}: process time {2:.2f} s (baseline {3:.2f} s)').format(size, caseName, result['processTime'], baseline['processTime']))
+                if result['peakRss'] > baseline['peakRss'] * (1 + memoryTolerance):
+                    regressionList.append(self.tr('{0} {1}: peak RSS {2:.1f} MB (baseline {3:.1f} MB)').format(size, caseName, result['peakRss'] / 1048576.0, baseline['peakRss'] / 1048576.0))
+                if result['flags'] != baseline['flags']:
+                    regressionList.append(self.tr('{0} {1}: {2} flags (baseline {3})').format(size, caseName, result['flags'], baseline['flags']))
+        return regressionList
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmarks DsgTools validation processes on synthetic databases.')
+    parser.add_argument('benchmark', help = 'JSON benchmark description')
+    parser.add_argument('-b', '--baseline', help = 'JSON baseline (results of a previous run)')
+    parser.add_argument('-o', '--output', help = 'JSON results (default: standard output)')
+    parser.add_argument('--update-baseline', action = 'store_true', help = 'stores the results in the baseline file')
+    arguments = parser.parse_args()
+    with open(arguments.benchmark, 'r') as benchmarkFile:
+        benchmark = ValidationBenchmark(json.load(benchmarkFile))
+    resultDict = benchmark.run()
+    output = {'date' : datetime.now().isoformat(), 'results' : resultDict, 'regressions' : []}
+    if arguments.baseline and os.path.exists(arguments.baseline) and not arguments.update_baseline:
+        with open(arguments.baseline, 'r') as baselineFile:
+            output['regressions'] = benchmark.compare(resultDict, json.load(baselineFile)['results'])
+    if arguments.baseline and arguments.update_baseline:
+        with open(arguments.baseline, 'w') as baselineFile:
+            json.dump(output, baselineFile, indent = 4)
+    if arguments.output:
+        with open(arguments.output, 'w') as outputFile:
+            json.dump(output, outputFile, indent = 4)
+    else:
+        json.dump(output, sys.stdout, indent = 4)
+    for regression in output['regressions']:
+        sys.stderr.write(regression + '\n')
+    sys.exit(1 if len(output['regressions']) > 0 else 0)
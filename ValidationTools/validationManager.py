@@ -21,8 +21,13 @@
  ***************************************************************************/
 """
 import os
+from datetime import datetime
+from collections import deque
 from qgis.core import QgsMessageLog
 from DsgTools.ValidationTools.processParametersDialog import ProcessParametersDialog
+from DsgTools.ValidationTools.validationScheduler import ValidationScheduler
+from DsgTools.ValidationTools.processRegistry import ProcessRegistry
+from DsgTools.ValidationTools.tiledExecutor import TiledExecutor
 
 from PyQt4.QtCore import Qt
 from PyQt4 import QtGui
@@ -41,6 +46,8 @@ class ValidationManager(QObject):
         self.processDict = dict()
         self.lastProcess = None
         self.lastParameters = None
+        self.scheduler = ValidationScheduler()
+        self.tiledExecutor = TiledExecutor(self.postgisDb, self.iface)
         try:
             #creating validation structure
             self.postgisDb.checkAndCreateValidationStructure()
@@ -48,7 +55,8 @@ class ValidationManager(QObject):
             #setting available processes
             self.setAvailableProcesses()
         except Exception as e:
-            QMessageBox.critical(None, self.tr('Critical!'), self.tr('A problem occurred! Check log for details.'))
+            if QApplication.type() != QApplication.Tty:
+                QMessageBox.critical(None, self.tr('Critical!'), self.tr('A problem occurred! Check log for details.'))
             QgsMessageLog.logMessage(':'.join(e.args), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
             
 
@@ -56,44 +64,30 @@ class ValidationManager(QObject):
         """
         Sets all available processes.
         This method is a dynamic method that scans the processes folder for .py files.
-        All .py files within the folder (minus the ignored ones) are listed as available processes
+        All .py files within the folder (minus the ignored ones) are listed as available processes.
+        Aliases are read by the process registry, process modules are only imported when needed.
         """
+        startTime = datetime.now()
         ignoredFiles = ['__init__.py', 'validationProcess.py', 'spatialRuleEnforcer.py']
-        for root, dirs, files in os.walk(os.path.join(os.path.dirname(__file__), 'ValidationProcesses')):
-            files.sort()
-            for file in files:
-                if file in ignoredFiles or file.split('.')[-1] != 'py':
-                    continue
-                fileBaseName = file.split('.')[0]
-                chars = list(fileBaseName)
-                chars[0] = chars[0].upper()
-                processClass = ''.join(chars)
-                if processClass != 'UnbuildEarthCoveragePolygonsProcess':
-                    self.processList.append(processClass)
-                    self.processDict[self.instantiateProcessByName(processClass, True).processAlias] = processClass 
-            
+        self.registry = ProcessRegistry(os.path.join(os.path.dirname(__file__), 'ValidationProcesses'), 'DsgTools.ValidationTools.ValidationProcesses', ignoredFiles = ignoredFiles)
+        for processClass in self.registry.scan():
+            if processClass != 'UnbuildEarthCoveragePolygonsProcess':
+                self.processList.append(processClass)
+                self.processDict[self.registry.getProcessAlias(processClass)] = processClass
+        QgsMessageLog.logMessage(self.tr('{0} validation processes registered in {1}.').format(len(self.processList), str(datetime.now() - startTime)), "DSG Tools Plugin", QgsMessageLog.INFO)
+
     def instantiateProcessByName(self, processName, instantiating):
         """
         This method instantiate a process by its name.
-        The import is made dynamically using the __import__ function.
-        The class to be import is obtained using the getattr function.
+        The class is imported on demand by the process registry.
         The class instance is made using: klass(self.postgisDb, self.iface)
         """
         currProc = None
-        for processClass in self.processList:
-            if processClass == processName:
-                chars = list(processClass)
-                #adjusting first character case
-                chars[0] = chars[0].lower()
-                #making file name
-                fileBaseName = ''.join(chars)
-                #setting up the module to be imported
-                mod = __import__('DsgTools.ValidationTools.ValidationProcesses.'+fileBaseName, fromlist=[processClass])
-                #obtaining the class name
-                klass = getattr(mod, processClass)
-                #instantiating the class
-                currProc = klass(self.postgisDb, self.iface, instantiating)
-                return currProc
+        if processName in self.processList:
+            klass = self.registry.getProcessClass(processName)
+            #instantiating the class
+            currProc = klass(self.postgisDb, self.iface, instantiating)
+        return currProc
                
     def getProcessChain(self, processAlias):
         """
@@ -105,6 +99,12 @@ class ValidationManager(QObject):
         postProcessList, parameterDict = self.generateProcessObjects(currProc.postProcess(), parameterDict)
         postProcessAlias = currProc.postProcess()
         localList = preProcessList + [currProc] + postProcessList
+        if any([process.supportsIncremental for process in localList]):
+            parameterDict['Only Changed Features'] = False
+            parameterDict['Enable Change Tracking'] = False
+        if any([process.supportsTiling for process in localList]):
+            parameterDict['Tiling'] = deque(TiledExecutor.getTilingOptionList())
+            parameterDict['Tile Overlap'] = 10.0
         return localList, parameterDict
 
     def generateProcessObjects(self, inputItem, inputParameterDict):
@@ -147,7 +147,7 @@ class ValidationManager(QObject):
         #if there is a running process we should stop
         QApplication.restoreOverrideCursor()
         if runningProc != None:
-            if not QtGui.QMessageBox.question(self.iface.mainWindow(), self.tr('Question'),  self.tr('It seems that process {0} is already running. Would you like to ignore it and start another process?').format(process), QtGui.QMessageBox.Ok|QtGui.QMessageBox.Cancel) == QtGui.QMessageBox.Ok:
+            if QApplication.type() == QApplication.Tty or not QtGui.QMessageBox.question(self.iface.mainWindow(), self.tr('Question'),  self.tr('It seems that process {0} is already running. Would you like to ignore it and start another process?').format(process), QtGui.QMessageBox.Ok|QtGui.QMessageBox.Cancel) == QtGui.QMessageBox.Ok:
                 QgsMessageLog.logMessage(self.tr('Unable to run process {0}. Process {1} is already running.\n').format(process, runningProc), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
                 return 0
         QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
@@ -159,27 +159,85 @@ class ValidationManager(QObject):
                 params = self.getParametersWithUi(processChain, parameterDict)
                 if params == -1:
                     return -1
+                self.confirmChangeTracking(params)
             else:
                 params = {}
             self.lastParameters = params
             self.lastProcess = process
         else:
             params = lastParameters
-        #execute each process
-        for process in processChain:
-            QgsMessageLog.logMessage(self.tr('Process {0} Log:\n').format(process.getName()), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
-            process.setParameters(params)
-            process.setDbUserName(self.postgisDb.getDatabaseParameters()[2])
-            process.setProcessName(self.processDict[process.processAlias])
-            ret = process.execute() # run bitch run!
-            #status = currProc.getStatus() #must set status
-            QgsMessageLog.logMessage(self.tr('Process {0} ran with status {1}\n').format(process.processAlias, process.getStatusMessage()), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
-            # process.logTotalTime()
-            # process.logProcess()
-            if ret == 0:
-                return 0
-        return 1
+        return self.executeProcessChain(process, processChain, params)
+
+    def confirmChangeTracking(self, params):
+        """
+        Asks before installing the change tracking triggers on the validated classes (see ValidationProcess.filterDirtyFeatures)
+        """
+        if not params.get('Enable Change Tracking', False):
+            return
+        msg = self.tr('Change tracking installs triggers on the validated classes that record the key and bounding box of every change made by any client. Do you want to enable it?')
+        if QMessageBox.question(self.iface.mainWindow(), self.tr('Question'), msg, QMessageBox.Yes|QMessageBox.No) != QMessageBox.Yes:
+            params['Enable Change Tracking'] = False
+
+    def executeProcessChain(self, process, processChain, params):
+        """
+        Sets params on every process of the chain of process (see getProcessChain) and runs it.
+        Used without dialogs by the headless runner.
+        """
+        #setting parameters before scheduling, read/write sets depend on them
+        for proc in processChain:
+            proc.setParameters(params)
+        mainIndex = [proc.processAlias for proc in processChain].index(process)
+        #execute the chain in order, consecutive independent processes may run concurrently
+        return self.scheduler.execute(processChain, self.runProcess, mainIndex = mainIndex)
+
+    def runProcess(self, process):
+        """
+        Runs a single process of a chain (called by the scheduler). It may run in a worker thread,
+        so the database object of the process is used instead of self.postgisDb (see ValidationProcessThread).
+        """
+        abstractDb = process.abstractDb
+        QgsMessageLog.logMessage(self.tr('Process {0} Log:\n').format(process.getName()), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
+        process.setDbUserName(abstractDb.getDatabaseParameters()[2])
+        process.setProcessName(self.processDict[process.processAlias])
+        tiling = process.parameters.get('Tiling') if process.parameters else None
+        fingerprint = self.getProcessFingerprint(process)
+        process.startProfile()
+        try:
+            if fingerprint and process.reuseCachedResult(fingerprint):
+                ret = 1
+            elif process.supportsTiling and isinstance(tiling, basestring) and tiling != TiledExecutor.noTiling:
+                ret = self.tiledExecutor.execute(process, tiling, process.parameters['Tile Overlap'])
+            else:
+                ret = process.execute() # run bitch run!
+        finally:
+            process.endProfile()
+            process.removeUnifiedLayers()
+        if ret == 1:
+            process.setDirtyFeatureCheckpoints()
+        process.logProfile()
+        try:
+            abstractDb.setValidationProcessProfile(process.getName(), process.getProfile())
+            if ret == 1 and fingerprint:
+                abstractDb.setValidationProcessFingerprint(process.getName(), fingerprint, abstractDb.getNumberOfFlagsByProcess(process.getName()))
+        except Exception as e:
+            QgsMessageLog.logMessage(':'.join(e.args), "DSG Tools Plugin", QgsMessageLog.WARNING)
+        #status = currProc.getStatus() #must set status
+        QgsMessageLog.logMessage(self.tr('Process {0} ran with status {1}\n').format(process.processAlias, process.getStatusMessage()), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
+        # process.logTotalTime()
+        # process.logProcess()
+        return ret
     
+    def getProcessFingerprint(self, process):
+        """
+        Gets the fingerprint of the input data and parameters of process (see ValidationProcess.getDataFingerprint)
+        computed before it runs. Returns None when its results can not be reused.
+        """
+        try:
+            return process.getDataFingerprint()
+        except Exception as e:
+            QgsMessageLog.logMessage(':'.join(e.args), "DSG Tools Plugin", QgsMessageLog.WARNING)
+            return None
+
     def getParametersWithUi(self, processChain, parameterDict):
         """
         Builds interface
@@ -209,7 +267,7 @@ class ValidationManager(QObject):
         #if there is a running process we should stop
         QApplication.restoreOverrideCursor()
         if runningProc != None:
-            if not QtGui.QMessageBox.question(self.iface.mainWindow(), self.tr('Question'),  self.tr('It seems that process {0} is already running. Would you like to ignore it and start another process?').format(process), QtGui.QMessageBox.Ok|QtGui.QMessageBox.Cancel) == QtGui.QMessageBox.Ok:
+            if QApplication.type() == QApplication.Tty or not QtGui.QMessageBox.question(self.iface.mainWindow(), self.tr('Question'),  self.tr('It seems that process {0} is already running. Would you like to ignore it and start another process?').format(process), QtGui.QMessageBox.Ok|QtGui.QMessageBox.Cancel) == QtGui.QMessageBox.Ok:
                 QgsMessageLog.logMessage(self.tr('Unable to run process {0}. Process {1} is already running.\n').format(process, runningProc), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
                 return 0
         QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ DsgTools
+                                 A QGIS plugin
+ Brazilian Army Cartographic Production Tools
+                              -------------------
+        begin                : 2018-03-15
+        git sha              : $Format:%H$
+        copyright            : (C) 2018 by Philipe Borba - Cartographic Engineer @ Brazilian Army
+        email                : borba@dsg.eb.mil.br
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from qgis.core import QgsMessageLog
+
+from PyQt4.QtCore import QEventLoop
+from PyQt4.QtGui import QApplication
+from PyQt4.Qt import QObject
+
+from DsgTools.Factories.ThreadFactory.validationProcessThread import ValidationProcessThread
+from DsgTools.Factories.DbFactory.connectionPool import ConnectionPool
+
+class ValidationScheduler(QObject):
+    def __init__(self):
+        """
+        Constructor
+        """
+        super(ValidationScheduler, self).__init__()
+
+    def conflicts(self, process, otherProcess):
+        """
+        Checks whether two processes touch a common resource with at least one of them writing it
+        """
+        readSet, writeSet = process.getReadSet(), process.getWriteSet()
+        otherReadSet, otherWriteSet = otherProcess.getReadSet(), otherProcess.getWriteSet()
+        if writeSet is None or otherWriteSet is None:
+            return True
+        if (readSet is None and len(otherWriteSet) > 0) or (otherReadSet is None and len(writeSet) > 0):
+            return True
+        return len(writeSet & (otherWriteSet | otherReadSet)) > 0 or len(otherWriteSet & readSet) > 0
+
+    def getDependencyDict(self, processChain, mainIndex = None):
+        """
+        Builds the process DAG as {index: set of indexes that must finish before}.
+        Edges come from the chain structure (pre processes -> main process -> post processes),
+        from the preProcess()/postProcess() of each process and from read/write conflicts (in chain order).
+        processChain: list of processes (the same process may appear more than once)
+        mainIndex: index of the process whose pre and post processes compose the chain
+        """
+        aliasList = [process.processAlias for process in processChain]
+        dependencyDict = {i : set() for i in range(len(processChain))}
+        for i, process in enumerate(processChain):
+            if mainIndex is not None:
+                if i < mainIndex:
+                    dependencyDict[mainIndex].add(i)
+                elif i > mainIndex:
+                    dependencyDict[i].add(mainIndex)
+            for alias in self.getAliasList(process.preProcess()):
+                previousList = [j for j in range(i) if aliasList[j] == alias]
+                if previousList:
+                    dependencyDict[i].add(previousList[-1])
+            for alias in self.getAliasList(process.postProcess()):
+                nextList = [j for j in range(i+1, len(processChain)) if aliasList[j] == alias]
+                if nextList:
+                    dependencyDict[nextList[0]].add(i)
+            for j in range(i):
+                if self.conflicts(processChain[j], process):
+                    dependencyDict[i].add(j)
+        return dependencyDict
+
+    def getAliasList(self, inputItem):
+        if not inputItem:
+            return []
+        if not isinstance(inputItem, list):
+            return [inputItem]
+        return inputItem
+
+    def getGroup(self, processChain, dependencyDict, start):
+        """
+        Gets the indexes of the processes that run together from start on: the longest sequence of processes that can
+        run in worker threads (see ValidationProcess.canRunInWorker) and do not depend on each other.
+        It is computed right before the group runs, since the previous processes may change the layers.
+        """
+        group = [start]
+        if not processChain[start].canRunInWorker():
+            return group
+        for i in range(start + 1, len(processChain)):
+            if dependencyDict[i] & set(group) or processChain[i] in [processChain[j] for j in group] or not processChain[i].canRunInWorker():
+                break
+            group.append(i)
+        return group
+
+    def execute(self, processChain, runProcess, mainIndex = None):
+        """
+        Runs the chain in its order. Consecutive processes that can run in worker threads and do not depend on each other
+        (see getGroup) run concurrently in the processes thread pool, each one on its own pooled connection.
+        The other processes run alone in the GUI thread. Stops after the group in which a process fails.
+        runProcess: callable that runs a process and returns its execute() code
+        Returns 1 on success and 0 on failure.
+        """
+        dependencyDict = self.getDependencyDict(processChain, mainIndex = mainIndex)
+        start = 0
+        while start < len(processChain):
+            group = self.getGroup(processChain, dependencyDict, start)
+            if len(group) == 1:
+                ret = runProcess(processChain[start])
+            else:
+                ret = self.executeConcurrently([processChain[i] for i in group], runProcess)
+            if ret == 0:
+                return 0
+            start += len(group)
+        return 1
+
+    def executeConcurrently(self, processList, runProcess):
+        """
+        Runs processList in worker threads and waits for all of them. Returns 0 if any of them failed.
+        """
+        # processes wait for their async queries, which run in the queries pool
+        threadPool = ConnectionPool.getThreadPool('processes')
+        threadList = []
+        for process in processList:
+            thread = ValidationProcessThread(process, runProcess)
+            threadList.append(thread)
+            threadPool.start(thread)
+        ret = 1
+        for thread in threadList:
+            # the interface is repainted, but user input waits for the processes
+            while not thread.finished.wait(0.05):
+                QApplication.processEvents(QEventLoop.ExcludeUserInputEvents)
+            if thread.ret == 0:
+                ret = 0
+        return ret
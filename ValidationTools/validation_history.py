@@ -20,7 +20,7 @@
  *                                                                         *
  ***************************************************************************/
 """
-import os
+import os, csv
 
 from PyQt4 import QtGui, uic
 from PyQt4.QtCore import *
@@ -200,6 +200,57 @@ class ValidationHistory(QtGui.QDialog, FORM_CLASS):
                 compactHistory.append(fullHistory[idx])
         self.postgisDb.createCompactValidationHistory(compactHistory)
 
+    @pyqtSlot(QModelIndex)
+    def on_tableView_clicked(self, index):
+        """
+        Shows the profile of the selected process execution
+        """
+        processName = self.projectModel.data(self.projectModel.index(index.row(), 0))
+        finished = self.projectModel.data(self.projectModel.index(index.row(), 3)).toPyDateTime()
+        try:
+            profile = self.postgisDb.getValidationProcessProfile(processName, finished)
+        except Exception as e:
+            QgsMessageLog.logMessage(':'.join(e.args), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
+            profile = None
+        self.fillProfileTable(profile)
+
+    def fillProfileTable(self, profile):
+        """
+        Fills the profile table with a profile (see ValidationProcess.getProfile)
+        """
+        self.profileTableWidget.setRowCount(0)
+        if not profile:
+            return
+        for value in profile['phases']:
+            row = self.profileTableWidget.rowCount()
+            self.profileTableWidget.insertRow(row)
+            share = 100*value['elapsed']/profile['total'] if profile['total'] else 0
+            featuresPerSecond = '{0:.1f}'.format(value['featuresPerSecond']) if value['featuresPerSecond'] is not None else '-'
+            for column, text in enumerate([self.tr(value['phase']), '{0:.3f}'.format(value['elapsed']), '{0:.1f}'.format(share), str(value['features']), featuresPerSecond]):
+                self.profileTableWidget.setItem(row, column, QtGui.QTableWidgetItem(text))
+        self.profileTableWidget.resizeColumnsToContents()
+
+    @pyqtSlot(bool)
+    def on_exportProfilePushButton_clicked(self):
+        """
+        Exports the profiles of every process execution to a csv file (one line per phase)
+        """
+        fileName = QtGui.QFileDialog.getSaveFileName(self, self.tr('Export profiles'), '', self.tr('CSV (*.csv)'))
+        if not fileName:
+            return
+        try:
+            with open(fileName, 'wb') as csvFile:
+                writer = csv.writer(csvFile)
+                writer.writerow(['id', 'process_name', 'finished', 'total', 'phase', 'elapsed', 'features', 'features_per_second'])
+                for id, processName, finished, profile in self.postgisDb.getValidationProfileList():
+                    for value in profile['phases']:
+                        writer.writerow([id, processName, finished.isoformat(), profile['total'], value['phase'], value['elapsed'], value['features'], value['featuresPerSecond']])
+        except Exception as e:
+            QtGui.QMessageBox.critical(self, self.tr('Critical!'), self.tr('A problem occurred! Check log for details.'))
+            QgsMessageLog.logMessage(':'.join(e.args), "DSG Tools Plugin", QgsMessageLog.CRITICAL)
+            return
+        QtGui.QMessageBox.information(self, self.tr('Success!'), self.tr('Profiles exported to {0}.').format(fileName))
+
     @pyqtSlot(int)
     def on_userFilterComboBox_currentIndexChanged(self):
         """
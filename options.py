@@ -36,6 +36,7 @@ from DsgTools.Utils.utils import Utils
 from DsgTools.Factories.SqlFactory.sqlGeneratorFactory import SqlGeneratorFactory
 from DsgTools.ServerTools.viewServers import ViewServers
 from DsgTools.Factories.DbFactory.dbFactory import DbFactory
+from DsgTools.Factories.DbFactory.queryLogger import QueryLogger
 
 from DsgTools.UserTools.profile_editor import ProfileEditor
 from DsgTools.ServerTools.createView import CreateView
@@ -51,6 +52,7 @@ class Options(QtGui.QDialog, FORM_CLASS):
         super(self.__class__, self).__init__(parent)
         self.setupUi(self)
         self.setInterfaceWithParametersFromConfig()
+        self.setQueryLogInterfaceFromConfig()
     
     @pyqtSlot(bool)
     def on_addPushButton_clicked(self):
@@ -129,9 +131,37 @@ class Options(QtGui.QDialog, FORM_CLASS):
         settings.setValue('decimals', decimals)
         settings.endGroup()
     
+    def setQueryLogInterfaceFromConfig(self):
+        QueryLogger.loadSettings()
+        self.queryLogCheckBox.setChecked(QueryLogger.enabled)
+        self.slowQueryThresholdQgsDoubleSpinBox.setValue(QueryLogger.slowQueryThreshold)
+        self.explainSlowQueriesCheckBox.setChecked(QueryLogger.explainSlowQueries)
+
+    def storeQueryLogParametersInConfig(self):
+        settings = QSettings()
+        settings.beginGroup('PythonPlugins/DsgTools/Options')
+        settings.setValue('queryLogEnabled', self.queryLogCheckBox.isChecked())
+        settings.setValue('slowQueryThreshold', self.slowQueryThresholdQgsDoubleSpinBox.value())
+        settings.setValue('explainSlowQueries', self.explainSlowQueriesCheckBox.isChecked())
+        settings.endGroup()
+        QueryLogger.loadSettings()
+
+    @pyqtSlot(bool)
+    def on_exportQueryLogPushButton_clicked(self):
+        fileName = QFileDialog.getSaveFileName(self, self.tr('Export query log'), expanduser('~'), self.tr('JSON files (*.json)'))
+        if not fileName:
+            return
+        try:
+            QueryLogger.exportToJson(fileName)
+        except Exception as e:
+            QMessageBox.critical(self, self.tr('Critical!'), self.tr('Problem exporting query log: ') + ':'.join(e.args))
+            return
+        QMessageBox.information(self, self.tr('Success!'), self.tr('Query log exported to ') + fileName)
+
     @pyqtSlot()
     def on_buttonBox_accepted(self):
         self.storeParametersInConfig()
+        self.storeQueryLogParametersInConfig()
         self.close()
     
     @pyqtSlot(bool)